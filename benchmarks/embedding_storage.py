@@ -0,0 +1,107 @@
+"""
+Memory, latency and top-k agreement of float16 / int8 embedding storage against float32.
+
+Run from the repo root:
+    python benchmarks/embedding_storage.py                      # POC data + synthetic scale-up
+    python benchmarks/embedding_storage.py --no-poc --synthetic 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "working"))
+
+from vector_index import VECTOR_DTYPES, BruteForceIndex  # noqa: E402
+
+
+def synthetic_corpus(n: int, n_queries: int, dim: int = 384, seed: int = 0):
+    """Clustered random vectors, roughly shaped like sentence embeddings of a product catalog."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 1000), dim)).astype(np.float32)
+    corpus = centers[rng.integers(0, len(centers), n)]
+    corpus += 0.5 * rng.standard_normal(corpus.shape).astype(np.float32)
+    queries = corpus[rng.choice(n, n_queries)] + 0.1 * rng.standard_normal((n_queries, dim)).astype(np.float32)
+    return corpus, queries
+
+
+def poc_corpus():
+    """Competitor embeddings (corpus) and GemGem embeddings (queries) from the poc_*.csv data."""
+    from normalization import engine
+    engine.ensure_ready()
+    snap = engine.competitor_corpus.snapshot
+    return snap.index.vectors, engine.gemgem_embeddings
+
+
+def compare(corpus, queries, k: int = 5, dtypes=VECTOR_DTYPES, repeats: int = 3):
+    """One row per dtype: footprint, build time, query latency and top-k overlap with float32."""
+    queries = np.asarray(queries, dtype=np.float32)
+    truth = None
+    rows = []
+    for dtype in dtypes:
+        start = time.perf_counter()
+        index = BruteForceIndex(corpus, dtype=dtype)
+        build_sec = time.perf_counter() - start
+
+        latencies = []
+        found = []
+        for _ in range(repeats):
+            found = []
+            for q in queries:
+                start = time.perf_counter()
+                found.append(index.search(q, k)[0])
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        index.search_batch(queries, k)
+        batch_ms = (time.perf_counter() - start) * 1000
+
+        if truth is None:
+            # The first dtype is the reference (float32 unless told otherwise)
+            truth = found
+        overlap = np.mean([len(set(f.tolist()) & set(t.tolist())) / max(len(t), 1) for f, t in zip(found, truth)])
+        latencies_ms = np.array(latencies) * 1000
+        rows.append({
+            "dtype": dtype,
+            "rows": len(index),
+            "memory_mb": round(index.nbytes / 1024 / 1024, 2),
+            "build_sec": round(build_sec, 3),
+            "query_ms_mean": round(float(latencies_ms.mean()), 3),
+            "query_ms_p95": round(float(np.percentile(latencies_ms, 95)), 3),
+            "batch_ms": round(batch_ms, 2),
+            f"top{k}_overlap": round(float(overlap), 4),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark quantized embedding storage against float32")
+    parser.add_argument("--synthetic", type=int, nargs="*", default=[100_000, 1_000_000],
+                        help="Synthetic corpus sizes for the scale-up")
+    parser.add_argument("--no-poc", action="store_true", help="Skip the poc_*.csv corpus")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dtypes", nargs="*", default=list(VECTOR_DTYPES))
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.dtypes[0] != "float32":
+        args.dtypes = ["float32"] + [d for d in args.dtypes if d != "float32"]
+
+    results = {}
+    datasets = [] if args.no_poc else [("poc", poc_corpus)]
+    datasets += [(f"synthetic-{n}", lambda n=n: synthetic_corpus(n, args.queries)) for n in args.synthetic]
+    for name, load in datasets:
+        corpus, queries = load()
+        print(f"📊 {name}: {len(corpus)} vectors, {len(queries)} queries, k={args.k}")
+        results[name] = compare(corpus, queries, k=args.k, dtypes=args.dtypes)
+        for row in results[name]:
+            print(row)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Results written to {args.output}")
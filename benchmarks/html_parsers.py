@@ -0,0 +1,134 @@
+"""
+Throughput and output equality of the scraping/parsers.py backends over saved product pages.
+
+Run from the repo root:
+    python benchmarks/html_parsers.py                                   # kay_outlet/debug_pages/*.html + synthetic
+    python benchmarks/html_parsers.py --kay "dumps/*.html" --glamira "glamira_pages/*.html" --synthetic 0
+
+Kay fixtures are the debug_page_N.html dumps of testing_parser2.py --debug-dumps;
+Glamira fixtures are any saved product pages. Every backend's output is compared
+with html.parser's, the original implementation.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from scraping.parsers import available_backends, parse_glamira_page, parse_specs_tables  # noqa: E402
+
+EXTRACTORS = {"kay": parse_specs_tables, "glamira": parse_glamira_page}
+
+
+def _padding(rng, blocks: int) -> str:
+    """Navigation, scripts and product grids, the bulk of a real page that the extractors skip."""
+    parts = []
+    for i in range(blocks):
+        items = "".join(f'<li class="nav-item level1"><a href="/c/{i}-{j}" class="nav-link">Category {i}-{j}</a></li>'
+                        for j in range(rng.randint(5, 15)))
+        parts.append(f'<nav class="menu"><ul>{items}</ul></nav>')
+        parts.append(f'<script type="text/javascript">window.dataLayer.push({{"block": {i}, "x": "{"a" * 200}"}});</script>')
+        parts.append(f'<div class="tile"><span class="tile-price">${rng.randint(100, 9000)}.99</span>'
+                     f'<p>{"Lorem ipsum dolor sit amet. " * rng.randint(3, 10)}</p></div>')
+    return "".join(parts)
+
+
+def synthetic_kay_page(rng, blocks: int = 60) -> str:
+    tables = []
+    for section in ("Product Details", "Stone Information", "Metal Information"):
+        rows = "".join(f"<tr><td>{section} label {j}</td><td> value {rng.randint(1, 999)} </td></tr>"
+                       for j in range(rng.randint(3, 8)))
+        tables.append(f'<table class="specs-table mt-2"><thead><tr><th>{section}</th></tr></thead><tbody>{rows}</tbody></table>')
+    return (f"<html><head><title>Kay</title></head><body><h1>Stub Bracelet</h1>{_padding(rng, blocks)}"
+            f'<div class="details">{"".join(tables)}</div>{_padding(rng, blocks // 2)}</body></html>')
+
+
+def synthetic_glamira_page(rng, blocks: int = 60) -> str:
+    general = "".join(f'<tr><td class="detail-label">Label {j}:</td><td class="detail-value"> {rng.randint(1, 99)} </td></tr>'
+                      for j in range(rng.randint(4, 10)))
+    stone = "".join(f'<tr><td class="detail-label">Stone {j}[]?</td><td class="detail-value">≈ {rng.random():.2f} ct</td></tr>'
+                    for j in range(rng.randint(2, 6)))
+    return (f'<html><head><meta charset="utf-8"><title>Glamira</title></head><body>{_padding(rng, blocks)}'
+            f'<h1><span data-ui-id="page-title-wrapper">Bracelet {rng.randint(1, 999)}</span></h1>'
+            f'<span class="price-wrapper"><span class="price">€ {rng.randint(300, 5000)},00</span></span>'
+            f'<table class="table-detail"><tr class="item-sku"><td class="detail-label">Product No:</td>'
+            f'<td class="detail-value">X{rng.randint(1000, 9999)}</td></tr>{general}</table>'
+            f'<div id="stone1_detail"><table class="table-detail">{stone}</table></div>'
+            f"{_padding(rng, blocks)}</body></html>")
+
+
+def load_fixtures(pattern):
+    pages = []
+    for path in sorted(glob.glob(pattern or "")):
+        with open(path, "rb") as f:
+            pages.append(f.read())
+    return pages
+
+
+def compare(kind, pages, backends, repeats: int = 3):
+    """One row per backend: pages/s, MB/s and how many pages differ from html.parser."""
+    extract = EXTRACTORS[kind]
+    expected = [extract(page, "html.parser") for page in pages]
+    megabytes = sum(len(page) for page in pages) / 1e6
+    rows = []
+    for backend in backends:
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            found = [extract(page, backend) for page in pages]
+            best = min(best, time.perf_counter() - start)
+        rows.append({
+            "backend": backend,
+            "pages": len(pages),
+            "pages_per_sec": round(len(pages) / best, 1),
+            "mb_per_sec": round(megabytes / best, 2),
+            "mismatches": sum(a != b for a, b in zip(found, expected)),
+        })
+    baseline = rows[0]["pages_per_sec"] if rows else 0
+    for row in rows:
+        row["speedup"] = round(row["pages_per_sec"] / baseline, 2) if baseline else None
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scraper HTML parser backends")
+    parser.add_argument("--kay", default=os.path.join("kay_outlet", "debug_pages", "*.html"),
+                        help="Glob of saved Kay product pages")
+    parser.add_argument("--glamira", help="Glob of saved Glamira product pages")
+    parser.add_argument("--synthetic", type=int, default=50, help="Synthetic pages per site (0 = fixtures only)")
+    parser.add_argument("--backends", nargs="*", default=available_backends())
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.backends[:1] != ["html.parser"]:
+        args.backends = ["html.parser"] + [b for b in args.backends if b != "html.parser"]
+
+    rng = random.Random(0)
+    datasets = [("kay-fixtures", "kay", load_fixtures(args.kay)),
+                ("glamira-fixtures", "glamira", load_fixtures(args.glamira))]
+    if args.synthetic:
+        datasets += [
+            ("kay-synthetic", "kay", [synthetic_kay_page(rng).encode("utf-8") for _ in range(args.synthetic)]),
+            ("glamira-synthetic", "glamira", [synthetic_glamira_page(rng).encode("utf-8") for _ in range(args.synthetic)]),
+        ]
+
+    results = {}
+    for name, kind, pages in datasets:
+        if not pages:
+            continue
+        print(f"📊 {name}: {len(pages)} pages, {sum(len(p) for p in pages) / 1e6:.1f} MB, backends {args.backends}")
+        results[name] = compare(kind, pages, args.backends, repeats=args.repeats)
+        for row in results[name]:
+            print(row)
+    if not results:
+        print("⚠️ No pages to parse: pass --kay / --glamira fixtures or --synthetic N")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"✅ Results written to {args.output}")
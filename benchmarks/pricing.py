@@ -0,0 +1,472 @@
+"""
+Microbenchmarks of the pricing hot paths on a synthetic GemGem / Kay / Glamira catalog.
+
+Run from the repo root:
+    python benchmarks/pricing.py                                   # 1k, 100k and 1M catalog rows
+    python benchmarks/pricing.py --sizes 1000 20000                # quick check
+    python benchmarks/pricing.py --sizes 1000 100000 --compare benchmarks/baselines/pricing-<commit>.json
+
+preprocess_df, get_similar_prices, calculate_retail_price and render_pricing_chart
+are timed separately. The gold price API is the local stub from gold_price.py and,
+unless --encoder model, embeddings come from a hashing encoder, so the numbers are
+about this code rather than the network or the transformer. Every run is saved as
+JSON (benchmarks/baselines/pricing-<commit>.json by default); --compare prints the
+median-time ratio against an earlier baseline and exits 1 when one exceeds --threshold.
+
+Sizes from --store-rows up (default 500k, so the 1M tier) are generated, compiled and
+encoded in CHUNK_ROWS chunks into a corpus store that the engine memory-maps, the way
+a catalog that size is served; compiling a million rows in memory needs more than 5 GB.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+import warnings
+import zlib
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "working"))
+
+BASELINE_DIR = os.path.join(ROOT, "benchmarks", "baselines")
+USD_PER_OUNCE = 2400.0
+# Rows generated / compiled / encoded at a time for the large sizes
+CHUNK_ROWS = 100_000
+
+CATEGORIES = ["Bracelet", "Tennis Bracelet", "Necklace", "Pendant", "Ring", "Earrings", "Anklet", "Bangle"]
+COLORS = ["White", "Yellow", "Rose"]
+KARATS = ["10K", "14K", "18K"]
+# Weighted so most rows are natural diamonds, with enough lab / other stones for the filters to matter
+STONES = ["Diamond"] * 6 + ["Lab-Created Diamond", "Sapphire", "Cultured Pearl", "No Stone"]
+CARATS = [("1/10", 0.1), ("1/5", 0.2), ("1/4", 0.25), ("1/3", 0.33), ("1/2", 0.5), ("3/4", 0.75),
+          ("1", 1.0), ("1 1/2", 1.5), ("2", 2.0), ("3", 3.0), ("5", 5.0)]
+SHAPES = ["Round", "Princess", "Oval", "Emerald", "Pear", "Cushion"]
+
+
+# --- Synthetic catalog ---
+
+def _metal(rng):
+    roll = rng.random()
+    if roll < 0.08:
+        return "Platinum", None, "Platinum"
+    if roll < 0.15:
+        return "Sterling Silver", None, "Silver"
+    karat, color = rng.choice(KARATS), rng.choice(COLORS)
+    return f"{karat} {color} Gold", karat, color
+
+
+def _price(rng, carats):
+    # Roughly tracks carat weight; about a fifth land under MIN_PRICE like the real scrapes
+    return round(300 + carats * rng.uniform(1500, 4500) + rng.uniform(0, 1500), 2)
+
+
+def kay_rows(n, rng, start: int = 0):
+    rows = []
+    for i in range(start, start + n):
+        category, stone = rng.choice(CATEGORIES), rng.choice(STONES)
+        fraction, carats = rng.choice(CARATS)
+        metal, karat, color = _metal(rng)
+        details = {
+            "Stone(s)": {"Stone Type": stone, "Stone Shape": rng.choice(SHAPES),
+                         "Total Weight (CT. T.W.)": fraction if stone != "No Stone" else ""},
+            "Metal(s)": {"Metal Type": "Gold" if karat else metal, "Metal Color": color, "Gold Karat": karat or ""},
+            "Product Details": {"Length": f"{rng.choice([6.5, 7, 7.25, 18, 20])} in", "Clasp Type": "Lobster"},
+        }
+        rows.append({
+            "name": f"{stone} {category} {fraction} ct tw {metal} {i}",
+            "price": _price(rng, carats),
+            "url": f"https://www.kayoutlet.com/bench-{i}/p/V-{i:09d}",
+            "details": json.dumps(details, ensure_ascii=False),
+        })
+    return pd.DataFrame(rows)
+
+
+def glamira_rows(n, rng, start: int = 0):
+    rows = []
+    for i in range(start, start + n):
+        category, stone = rng.choice(CATEGORIES), rng.choice(STONES)
+        _, carats = rng.choice(CARATS)
+        metal, _, _ = _metal(rng)
+        details = {
+            "Product No": f"bench-{i}", "Gender": rng.choice(["Female", "Male", "Unisex"]),
+            "Color / Metal": metal, "Average Weight": f"≈ {rng.uniform(1, 15):.2f} Grams",
+            "Stone": stone, "Certification": "GL Certified", "Color": rng.choice("DEFGH"),
+            "Stone Clarity": rng.choice(["VS", "SI", "VVS"]), "Shape": rng.choice(SHAPES),
+            "Carat": f"{carats:.2f}", "Quantity of stones": str(rng.randint(1, 40)),
+        }
+        rows.append({
+            "name": f"GLAMIRA {category} Bench {i}",
+            "price": f"${_price(rng, carats):,.2f}",
+            "url": f"https://www.glamira.com/glamira-bench-{i}.html?alloy=white-585",
+            "details": json.dumps(details, ensure_ascii=False),
+        })
+    return pd.DataFrame(rows)
+
+
+def gemgem_rows(n, rng, start: int = 0):
+    rows = []
+    for i in range(start, start + n):
+        category, stone = rng.choice(CATEGORIES), rng.choice(STONES)
+        _, carats = rng.choice(CARATS)
+        metal, _, _ = _metal(rng)
+        details = {
+            "Stone(s)": {"Stone Type": stone, "Quantity": str(rng.randint(1, 40)),
+                         "Carat Weight": f"{carats} ctw", "Diamond Shape": rng.choice(SHAPES)},
+            "Metal(s)": {"Metal": metal},
+            "Specifications": {"Gender": "Female", "Item Weight": f"{rng.uniform(1, 20):.2f}g", "Metal": metal},
+            "source": "lab" if "Lab" in stone else "natural",
+        }
+        rows.append({
+            "name": f"{carats}ctw {stone} {category} in {metal} / B{i}",
+            "price": int(_price(rng, carats)),
+            "listing_id": f"L{i:013d}",
+            "details": json.dumps(details, ensure_ascii=False),
+        })
+    return pd.DataFrame(rows)
+
+
+def _split(rows: int) -> dict:
+    """Rows per source: 45% Kay, 45% Glamira, 10% GemGem."""
+    gemgem = max(10, rows // 10)
+    kay = (rows - gemgem) // 2
+    return {"kay": kay, "glamira": rows - gemgem - kay, "gemgem": gemgem}
+
+
+def synthetic_chunks(rows: int, seed: int = 0, chunk_rows: int = CHUNK_ROWS):
+    """
+    (source, DataFrame) chunks of `rows` raw rows shaped like the three scrapes.
+    One rng is drawn row by row in a fixed order, so the rows don't depend on chunk_rows.
+    """
+    rng = random.Random(seed)
+    generators = {"kay": kay_rows, "glamira": glamira_rows, "gemgem": gemgem_rows}
+    for source, n in _split(rows).items():
+        for start in range(0, n, chunk_rows):
+            yield source, generators[source](min(chunk_rows, n - start), rng, start=start)
+
+
+def synthetic_catalog(rows: int, seed: int = 0) -> dict:
+    """`rows` raw rows shaped like the three scrapes, one DataFrame per source."""
+    frames = {}
+    for source, df in synthetic_chunks(rows, seed):
+        frames.setdefault(source, []).append(df)
+    return {source: pd.concat(chunks, ignore_index=True) for source, chunks in frames.items()}
+
+
+def write_catalog(rows: int, seed: int, workdir: str) -> list:
+    """
+    The synthetic catalog as poc_*.csv files (generated once per size and seed,
+    appended chunk by chunk); returns DATA_FILES order.
+    """
+    target = os.path.join(workdir, f"catalog-{rows}-s{seed}")
+    paths = {source: os.path.join(target, f"poc_{source}.csv") for source in ("kay", "glamira", "gemgem")}
+    if not all(os.path.exists(path) for path in paths.values()):
+        tmp = f"{target}.tmp-{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        written = set()
+        for source, df in synthetic_chunks(rows, seed):
+            path = os.path.join(tmp, os.path.basename(paths[source]))
+            df.to_csv(path, mode="a" if source in written else "w", header=source not in written, index=False)
+            written.add(source)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+    return list(paths.values())
+
+
+class HashingEncoder:
+    """
+    Stand-in for the SentenceTransformer: each token of the text adds to one of `dim`
+    buckets (crc32), then rows are L2-normalised. Texts sharing words still score
+    high, and encoding a million rows takes seconds instead of hours.
+    """
+
+    name = "bench-hashing-384"
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, convert_to_numpy=True, show_progress_bar=False, batch_size=10_000):
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            rows, buckets = [], []
+            for offset, text in enumerate(texts[start:start + batch_size]):
+                tokens = re.findall(r"\w+", text.lower())
+                rows.extend([start + offset] * len(tokens))
+                buckets.extend(zlib.crc32(token.encode("utf-8")) % self.dim for token in tokens)
+            np.add.at(out, (np.array(rows, dtype=np.int64), np.array(buckets, dtype=np.int64)), 1.0)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms == 0, 1, norms)
+
+
+# --- Gold price stub ---
+
+def start_gold_stub(usd_per_ounce: float = USD_PER_OUNCE) -> str:
+    """Run gold_price.serve_stub on a free port in the background; returns its URL once it accepts connections."""
+    from gold_price import serve_stub
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    threading.Thread(target=serve_stub, args=(port, usd_per_ounce), name="gold-stub", daemon=True).start()
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return f"http://127.0.0.1:{port}/"
+
+
+# --- Timing ---
+
+def summarize(seconds, rows: int = None) -> dict:
+    ms = np.asarray(seconds) * 1000
+    stats = {
+        "calls": len(ms),
+        "mean_ms": round(float(ms.mean()), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(ms, 95)), 4),
+        "min_ms": round(float(ms.min()), 4),
+    }
+    if rows:
+        stats["rows_per_sec"] = round(rows / (float(np.median(ms)) / 1000), 1)
+    return stats
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def time_calls(fn, args_list, setup=None) -> list:
+    seconds = []
+    for args in args_list:
+        prepared = setup(args) if setup else args
+        start = time.perf_counter()
+        fn(*prepared)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def _stack(chunks: list) -> np.ndarray:
+    """np.concatenate that frees each chunk once it is copied, so the rows are never held twice."""
+    out = np.empty((sum(len(c) for c in chunks),) + chunks[0].shape[1:], dtype=chunks[0].dtype)
+    row = 0
+    while chunks:
+        chunk = chunks.pop(0)
+        out[row:row + len(chunk)] = chunk
+        row += len(chunk)
+    return out
+
+
+def build_corpus_store(data_files, encoder, model_name: str, path: str) -> dict:
+    """
+    The engine's corpus store for `data_files`, compiled and encoded CHUNK_ROWS
+    competitor rows at a time. Only the served rows' typed columns and vectors are
+    kept (parsed_details is dropped per chunk, as the store does), which is what lets
+    a million-row catalog build where compiling the CSVs in memory would not fit.
+    """
+    import catalog
+    from corpus_store import SKIP_COLUMNS, save_corpus_store
+    from vector_index import VECTOR_DTYPE, encode_vectors, make_index
+
+    started = time.perf_counter()
+    # Reads every CSV whole, so it runs before anything else is held in memory
+    data_fingerprint = catalog.fingerprint(data_files)
+    *competitor_files, gemgem_file = data_files
+    frames, codes, scales = [], [], []
+    for csv_path in competitor_files:
+        for chunk in pd.read_csv(csv_path, chunksize=CHUNK_ROWS):
+            served = catalog.serving_rows(catalog.compile_frame(chunk, catalog.source_of(csv_path)))
+            # Stored in the index dtype as they come, so the float32 matrix never exists whole
+            chunk_codes, chunk_scales = encode_vectors(
+                encoder.encode(served["embedding_text"].tolist(), convert_to_numpy=True), VECTOR_DTYPE)
+            codes.append(chunk_codes)
+            scales.append(chunk_scales)
+            frames.append(served.drop(columns=SKIP_COLUMNS))
+    competitors = pd.concat(frames, ignore_index=True)
+    del frames
+    index = make_index(_stack(codes), encoded=True, scales=_stack(scales) if scales[0] is not None else None)
+
+    gemgem = catalog.serving_rows(catalog.compile_frame(pd.read_csv(gemgem_file), catalog.source_of(gemgem_file)))
+    gemgem_vectors = encoder.encode(gemgem["embedding_text"].tolist(), convert_to_numpy=True)
+    save_corpus_store(
+        path, competitors, index, gemgem, gemgem_vectors,
+        model=model_name, data_fingerprint=data_fingerprint,
+        data_modified_at=max(os.path.getmtime(p) for p in data_files), catalog_version=None,
+    )
+    return {"seconds": round(time.perf_counter() - started, 3), "competitors": len(competitors),
+            "listings": len(gemgem), "peak_rss_mb": peak_rss_mb()}
+
+
+def bench_size(rows: int, args) -> dict:
+    import normalization
+    from chart_renderer import render_pricing_chart
+    from price_calculator import calculate_retail_price, fetch_gold_price_usd_per_gram
+
+    data_files = write_catalog(rows, args.seed, args.workdir)
+    results = {"rows": rows, "benchmarks": {}}
+    bench = results["benchmarks"]
+
+    # A fresh engine per size; get_similar_prices reads normalization.engine (replacing
+    # it first also frees the previous size's engine before this one is built)
+    engine = normalization.PricingEngine(data_files=data_files, store_path="", catalog_path="")
+    if args.encoder == "hash":
+        engine.model_name = HashingEncoder.name
+        engine._model = HashingEncoder()
+    normalization.engine = engine
+    if rows >= args.store_rows:
+        # Large catalogs go through the corpus store: built chunk by chunk (first, while
+        # little else is in memory), then memory-mapped by the engine
+        engine.store_path = os.path.join(args.workdir, f"store-{rows}-s{args.seed}-{args.encoder}")
+        results["store_build"] = build_corpus_store(data_files, engine.model, engine.model_name, engine.store_path)
+        print(f"   corpus store {results['store_build']}")
+
+    raw = pd.concat([pd.read_csv(path) for path in data_files[:-1]], ignore_index=True)
+    print(f"📊 {rows} rows: {len(raw)} competitors + {sum(1 for _ in open(data_files[-1])) - 1} GemGem listings")
+
+    # preprocess_df filters in place, so every call gets a fresh copy (not timed); its
+    # assignments into the filtered frame warn on every call, which would drown the report
+    warnings.simplefilter("ignore", pd.errors.SettingWithCopyWarning)
+    bench["preprocess_df"] = summarize(
+        time_calls(normalization.preprocess_df, [None] * args.repeats, setup=lambda _: (raw.copy(),)), len(raw)
+    )
+    print(f"   preprocess_df {bench['preprocess_df']}")
+    del raw  # the engine below holds its own compiled copy
+
+    started = time.perf_counter()
+    engine.ensure_ready()
+    results["setup"] = {"seconds": round(time.perf_counter() - started, 3), "source": engine.source,
+                        "phases": engine.timings, "competitors": len(engine.competitor_corpus.snapshot),
+                        "listings": len(engine.listing_store), "peak_rss_mb": peak_rss_mb()}
+
+    rng = random.Random(args.seed)
+    listing_ids = engine.gemgem_df["listing_id"].tolist()
+    queries = [(rng.choice(listing_ids),) for _ in range(args.queries)]
+    bench["get_similar_prices"] = summarize(time_calls(normalization.get_similar_prices, queries))
+    bench["get_similar_prices_unblocked"] = summarize(
+        time_calls(lambda lid: normalization.get_similar_prices(lid, blocking_level=0), queries)
+    )
+    # The app's path (ListingStore) and the DataFrame path kept for scripts
+    bench["calculate_retail_price"] = summarize(
+        time_calls(lambda lid: calculate_retail_price(lid, engine.listing_store), queries)
+    )
+    bench["calculate_retail_price_df"] = summarize(
+        time_calls(lambda lid: calculate_retail_price(lid, engine.gemgem_df), queries[:max(1, args.queries // 10)])
+    )
+
+    charts = [(rng.uniform(1000, 9000), rng.uniform(1000, 9000), rng.uniform(1000, 9000)) for _ in range(args.charts)]
+    bench["render_pricing_chart"] = summarize(time_calls(render_pricing_chart, charts))
+    results["gold_price_per_gram"] = round(fetch_gold_price_usd_per_gram(), 4)
+
+    for name, stats in bench.items():
+        if name != "preprocess_df":
+            print(f"   {name} {stats}")
+    return results
+
+
+# --- Baselines ---
+
+def _git(*cmd):
+    try:
+        return subprocess.run(["git", *cmd], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(args) -> dict:
+    import matplotlib
+    from attribute_index import BLOCKING_LEVEL
+    from vector_index import VECTOR_DTYPE, VECTOR_INDEX
+
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "matplotlib": matplotlib.__version__,
+        "encoder": args.encoder,
+        "seed": args.seed,
+        "vector_index": VECTOR_INDEX,
+        "vector_dtype": VECTOR_DTYPE,
+        "blocking_level": BLOCKING_LEVEL,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """Median-time ratios (current / baseline) for every benchmark both runs have; returns the regressions."""
+    regressions = []
+    print(f"\n📈 Against {baseline['meta'].get('commit')} ({baseline['meta'].get('created_at')}), "
+          f"regression threshold {threshold}x")
+    for size, result in current["sizes"].items():
+        old = baseline["sizes"].get(size, {}).get("benchmarks", {})
+        for name, stats in result["benchmarks"].items():
+            if name not in old or not old[name]["p50_ms"]:
+                continue
+            ratio = stats["p50_ms"] / old[name]["p50_ms"]
+            flag = "❌" if ratio > threshold else "✅"
+            print(f"{flag} {size:>8} {name:<30} {old[name]['p50_ms']:>10.3f} -> {stats['p50_ms']:>10.3f} ms "
+                  f"({ratio:.2f}x)")
+            if ratio > threshold:
+                regressions.append({"rows": size, "benchmark": name, "ratio": round(ratio, 3)})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing, similarity search, retail pricing and charts")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1_000, 100_000, 1_000_000],
+                        help="Synthetic catalog sizes (rows across the three sources)")
+    parser.add_argument("--store-rows", type=int, default=500_000,
+                        help="Sizes from this many rows load through a chunk-built corpus store instead of the CSVs")
+    parser.add_argument("--queries", type=int, default=200, help="Listings priced per size")
+    parser.add_argument("--charts", type=int, default=20, help="Charts rendered per size")
+    parser.add_argument("--repeats", type=int, default=5, help="preprocess_df runs per size")
+    parser.add_argument("--encoder", choices=["hash", "model"], default="hash",
+                        help="hash = HashingEncoder, model = the real SentenceTransformer (slow to build)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=os.path.join("cache", "bench"),
+                        help="Synthetic CSVs and their embedding cache")
+    parser.add_argument("--output", help="Baseline JSON to write (default benchmarks/baselines/pricing-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Median-time ratio that counts as a regression")
+    args = parser.parse_args()
+
+    # Set before the pricing modules are imported: they read these at import time
+    os.environ["METAL_PRICE_URL"] = start_gold_stub()
+    os.environ["EMBEDDING_CACHE_DIR"] = os.path.join(args.workdir, "embeddings")
+
+    results = {"meta": run_metadata(args), "sizes": {}}
+    for rows in args.sizes:
+        results["sizes"][str(rows)] = bench_size(rows, args)
+
+    output = args.output or os.path.join(BASELINE_DIR, f"pricing-{results['meta']['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Baseline written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) past {args.threshold}x")
+            sys.exit(1)
@@ -1,80 +1,215 @@
-#run this script to get poc_glamira.csv ie test glamira dataset. 
+#run this script to get poc_glamira.csv ie test glamira dataset.
 #Unable to use scraping to get urls first, so used manually added urls for now.
+#--mode auto (default) fetches each page over plain HTTP and only opens a browser when the static html lacks the details;
+#--mode http / --mode browser force one path. urls are scraped concurrently and each one's time is reported.
+#http requests are conditional on the previous run's ETag / Last-Modified; poc_glamira.delta.csv lists what changed.
 
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from bs4 import BeautifulSoup
-import time
-import json
+import argparse
 import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 
-def extract_product_details(url):
-    chrome_options = Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("user-agent=Mozilla/5.0")
-
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=chrome_options)
-    driver.get(url)
-    time.sleep(5)
-    soup = BeautifulSoup(driver.page_source, "html.parser")
-    driver.quit()
-
-    # ✅ Extract name
-    name_tag = soup.find("span", {"data-ui-id": "page-title-wrapper"})
-    name = name_tag.get_text(strip=True) if name_tag else "N/A"
-
-    # ✅ Extract price
-    price_tag = soup.find("span", class_="price")
-    price = price_tag.get_text(strip=True) if price_tag else "N/A"
-
-    # ✅ Extract details
-    details_dict = {}
-
-    # General details
-    tables = soup.find_all("table", class_="table-detail")
-    for table in tables:
-        first_row = table.find("tr")
-        if first_row and "item-sku" in first_row.get("class", []):
-            for row in table.find_all("tr"):
-                label = row.find("td", class_="detail-label")
-                value = row.find("td", class_="detail-value")
-                if label and value:
-                    key = label.text.strip().strip(":").replace("?", "").replace("[]", "")
-                    val = value.text.strip()
-                    details_dict[key] = val
-
-    # Center Stone
-    stone_section = soup.find("div", id="stone1_detail")
-    if stone_section:
-        table = stone_section.find("table", class_="table-detail")
-        if table:
-            for row in table.find_all("tr"):
-                label = row.find("td", class_="detail-label")
-                value = row.find("td", class_="detail-value")
-                if label and value:
-                    key = label.text.strip().strip(":").replace("?", "").replace("[]", "")
-                    val = value.text.strip()
-                    details_dict[key] = val
+from dotenv import load_dotenv
 
-    return {
-        "name": name,
-        "price": price,
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scraping.drivers import DriverPool, chrome_factory  # noqa: E402
+from scraping.parsers import parse_glamira_page  # noqa: E402
+from scraping.session import RateLimiter, get, make_session  # noqa: E402
+from scraping.state import ScrapeState, delta_path  # noqa: E402
+
+try:
+    from selenium.webdriver.chrome.service import Service
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+except ImportError:  # only the browser mode needs selenium
+    Service = By = EC = WebDriverWait = None
+
+try:
+    from webdriver_manager.chrome import ChromeDriverManager
+except ImportError:  # fall back to the chromedriver selenium finds itself
+    ChromeDriverManager = None
+
+load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
+
+# URLs scraped at the same time
+GLAMIRA_WORKERS = int(os.getenv("GLAMIRA_WORKERS", "4"))
+# Long-lived headless Chrome drivers for pages that need the browser
+GLAMIRA_DRIVERS = int(os.getenv("GLAMIRA_DRIVERS", "2"))
+# Requests per second over plain HTTP (0 = unlimited)
+GLAMIRA_RATE = float(os.getenv("GLAMIRA_RATE", "4"))
+GLAMIRA_TIMEOUT_SEC = float(os.getenv("GLAMIRA_TIMEOUT_SEC", "15"))
+# How long the browser waits for the details table to render
+GLAMIRA_WAIT_SEC = float(os.getenv("GLAMIRA_WAIT_SEC", "15"))
+
+MODES = ("auto", "http", "browser")
+STATE_JSON = "poc_glamira.state.json"
+
+
+def parse_product_page(html):
+    """name, price and the `table-detail` / `stone1_detail` details of a Glamira product page."""
+    # The parser backend is picked by SCRAPE_PARSER_BACKEND (see scraping/parsers.py)
+    return parse_glamira_page(html)
+
+
+def is_complete(parsed):
+    """Whether the static html had everything, i.e. the page didn't need JavaScript."""
+    return parsed["name"] != "N/A" and parsed["price"] != "N/A" and bool(parsed["details"])
+
+
+def fetch_http(session, url, limiter=None, headers=None):
+    return get(session, url, limiter, timeout=GLAMIRA_TIMEOUT_SEC, headers=headers)
+
+
+def fetch_browser(pool, url):
+    with pool.driver() as driver:
+        driver.get(url)
+        # Wait for the details table instead of a fixed sleep; parse whatever rendered if it never shows
+        try:
+            WebDriverWait(driver, GLAMIRA_WAIT_SEC).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "table.table-detail"))
+            )
+        except Exception as e:
+            print(f"⚠️ Details table didn't render for {url}: {type(e).__name__}")
+        return driver.page_source
+
+
+def extract_product_details(url, mode="browser", session=None, pool=None, limiter=None, state=None):
+    """
+    Scrape one product. "http" parses the static html, "browser" renders it in
+    a pooled Chrome, "auto" tries http first and falls back to the browser
+    when the request fails or the details aren't in the static html.
+    Also returns how the page was fetched and how long it took. With a
+    ScrapeState the http request is conditional, a 304 reuses the previous
+    row without parsing, and the result says whether the product changed.
+    """
+    started = time.perf_counter()
+    parsed, method, fallback_reason, headers = None, mode, None, None
+    if mode in ("auto", "http"):
+        try:
+            response = fetch_http(session or make_session(), url, limiter,
+                                  state.conditional_headers(url) if state is not None else None)
+            if response.status_code == 304 and state is not None and state.known(url):
+                return {**state.not_modified(url), "method": "http", "fallback_reason": None,
+                        "change": "unchanged", "seconds": round(time.perf_counter() - started, 3)}
+            # Raw bytes: the parser picks the charset from the page when the server doesn't send one
+            parsed = parse_product_page(response.content)
+            headers = response.headers
+            method = "http"
+            if not is_complete(parsed):
+                fallback_reason = "incomplete static html"
+        except Exception as e:
+            if mode == "http":
+                raise
+            fallback_reason = f"{type(e).__name__}: {e}"
+    if mode == "browser" or (mode == "auto" and fallback_reason):
+        if pool is None:
+            with DriverPool(1, browser_factory()) as own_pool:
+                parsed = parse_product_page(fetch_browser(own_pool, url))
+        else:
+            parsed = parse_product_page(fetch_browser(pool, url))
+        method = "browser"
+
+    row = {
+        "name": parsed["name"],
+        "price": parsed["price"],
         "url": url,
-        "details": json.dumps(details_dict, ensure_ascii=False),
+        "details": json.dumps(parsed["details"], ensure_ascii=False),
+    }
+    change = state.record(url, dict(row), headers) if state is not None else None
+    return {
+        **row,
+        "method": method,
+        "fallback_reason": fallback_reason if method == "browser" else None,
+        "change": change,
+        "seconds": round(time.perf_counter() - started, 3),
     }
 
+
+def browser_factory():
+    """Starts headless Chrome; chromedriver is resolved on the first start, not once per url."""
+    starter = None
+    lock = threading.Lock()
+
+    def start():
+        nonlocal starter
+        with lock:
+            if starter is None:
+                service = Service(ChromeDriverManager().install()) if ChromeDriverManager and Service else None
+                starter = chrome_factory(headless=True, service=service)
+        return starter()
+    return start
+
+
+def scrape_all(urls, mode="auto", workers=GLAMIRA_WORKERS, drivers=GLAMIRA_DRIVERS, rate=GLAMIRA_RATE,
+               driver_factory=None, state=None):
+    """Scrape `urls` concurrently; returns (results in url order, failures)."""
+    session = make_session(pool_size=workers)
+    limiter = RateLimiter(rate, burst=workers)
+    results, failures = {}, {}
+    # Drivers only start if a page actually needs the browser
+    with DriverPool(drivers, driver_factory or browser_factory()) as pool, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(extract_product_details, url, mode, session, pool, limiter, state): url
+                   for url in urls}
+        for i, future in enumerate(as_completed(futures), 1):
+            url = futures[future]
+            try:
+                results[url] = future.result()
+                r = results[url]
+                note = f" (fallback: {r['fallback_reason']})" if r["fallback_reason"] else ""
+                note += f" [{r['change']}]" if r["change"] else ""
+                print(f"✅ {i}/{len(urls)} {r['seconds']:.2f}s via {r['method']}{note}: {url}")
+            except Exception as e:
+                failures[url] = f"{type(e).__name__}: {e}"
+                print(f"❌ Failed to scrape {url}: {failures[url]}")
+    return [results[url] for url in urls if url in results], failures
+
+
+def timing_report(results):
+    """Per-method count / mean / max seconds."""
+    report = {}
+    for method in ("http", "browser"):
+        seconds = [r["seconds"] for r in results if r["method"] == method]
+        if seconds:
+            report[method] = {"urls": len(seconds), "mean_sec": round(sum(seconds) / len(seconds), 3),
+                              "max_sec": round(max(seconds), 3)}
+    return report
+
+
 def save_to_csv(data_list, filename):
     with open(filename, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["name", "price", "url", "details"])
+        writer = csv.DictWriter(f, fieldnames=["name", "price", "url", "details"], extrasaction="ignore")
         writer.writeheader()
         for row in data_list:
             writer.writerow(row)
 
+
+def save_timings(data_list, filename):
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["url", "method", "seconds", "fallback_reason", "change"], extrasaction="ignore")
+        writer.writeheader()
+        for row in data_list:
+            writer.writerow(row)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape Glamira product pages into poc_glamira.csv")
+    parser.add_argument("--mode", choices=MODES, default="auto")
+    parser.add_argument("--workers", type=int, default=GLAMIRA_WORKERS)
+    parser.add_argument("--drivers", type=int, default=GLAMIRA_DRIVERS)
+    parser.add_argument("--output", default="poc_glamira.csv")
+    parser.add_argument("--timings", help="Also write per-url timings to this csv")
+    parser.add_argument("--state", default=STATE_JSON, help="Scrape state from the previous run")
+    parser.add_argument("--no-state", action="store_true", help="Fetch every page and don't compare with the previous run")
+    args = parser.parse_args()
+
     urls = [
         "https://www.glamira.com/glamira-bracelet-fouett.html?alloy=white-750&stone1=diamond-Brillant",
         "https://www.glamira.com/glamira-bracelet-fionnuala-3-5-mm.html?alloy=yellow-585&stone1=diamond-Brillant",
@@ -85,7 +220,7 @@ if __name__ == "__main__":
         "https://www.glamira.com/glamira-bracelet-tressa.html?alloy=white-375&stone1=diamond-Brillant",
         "https://www.glamira.com/glamira-bracelet-tamesha.html?alloy=yellow-585&stone1=diamond-Brillant&stone2=diamond-Brillant",
         "https://www.glamira.com/glamira-bracelet-fionnuala-2-5-mm.html?alloy=yellow-585&stone1=diamond-Brillant",
-        "https://www.glamira.com/glamira-bracelet-amazzi.html?alloy=yellow-585&pearl=white_pearl&stone1=lab-grown-diamond"
+        "https://www.glamira.com/glamira-bracelet-amazzi.html?alloy=yellow-585&pearl=white_pearl&stone1=lab-grown-diamond",
         "https://www.glamira.com/glamira-bracelet-iliana.html?alloy=white-585&stone1=diamond-Brillant",
         "https://www.glamira.com/glamira-bracelet-astropel.html?alloy=white-silber&stone1=diamond-Brillant",
         "https://www.glamira.com/glamira-bracelet-unerka.html?alloy=white-585&stone1=diamond-Brillant",
@@ -95,14 +230,17 @@ if __name__ == "__main__":
         "https://www.glamira.com/glamira-bracelet-celesia.html?alloy=white-silber&stone1=blackdiamond"
     ]
 
-    results = []
-    for i, url in enumerate(urls):
-        print(f"Scraping {i+1}/{len(urls)}: {url}")
-        try:
-            data = extract_product_details(url)
-            results.append(data)
-        except Exception as e:
-            print(f"❌ Failed to scrape {url}: {e}")
-
-    save_to_csv(results, "poc_glamira.csv")
-    print("✅ Saved to poc_glamira.csv")
+    started = time.perf_counter()
+    state = None if args.no_state else ScrapeState(args.state)
+    results, failures = scrape_all(urls, args.mode, workers=args.workers, drivers=args.drivers, state=state)
+    save_to_csv(results, args.output)
+    if args.timings:
+        save_timings(results, args.timings)
+    if state is not None:
+        if not failures:
+            # Failed urls weren't seen, which doesn't mean they were removed
+            state.finish()
+        state.save()
+        print(f"✅ Delta {state.summary()} saved to {state.write_delta(delta_path(args.output))}")
+    print(f"✅ Saved {len(results)} products to {args.output} in {time.perf_counter() - started:.1f}s "
+          f"({len(failures)} failed) {timing_report(results)}")
@@ -1,11 +1,23 @@
 #this script scrapes all products from kay outlet and saves them to a csv file, you can use some of those urls to create a test_csv.csv and pass it to testing_parser2.py and get something like poc_kay.csv. or directly use the poc_kay.csv to run the app.py
+#pages are fetched concurrently over one pooled session and written to the csv as they arrive.
+#every run also writes all_products.delta.csv (added / changed / removed since the previous run, see scraping/state.py).
+#to try it without hitting kayoutlet.com, start `python unbxd_stub.py` and set UNBXD_API_BASE=http://127.0.0.1:8765/category
 
-import requests
-import csv
-from dotenv import load_dotenv
+import argparse
 import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+from dotenv import load_dotenv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scraping.output import StreamingCsvWriter  # noqa: E402
+from scraping.session import RateLimiter, get, make_session  # noqa: E402
+from scraping.state import ScrapeState, delta_path  # noqa: E402
+
 
 # All your category IDs - add or remove as needed
 category_ids = [
@@ -19,69 +31,155 @@ env_path = Path(__file__).resolve().parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
 api_base = os.getenv("UNBXD_API_BASE")
+# Pages fetched in parallel (also the size of the session's connection pool)
+KAY_SCRAPE_WORKERS = int(os.getenv("KAY_SCRAPE_WORKERS", "8"))
+# Requests per second across all workers (0 = unlimited)
+KAY_SCRAPE_RATE = float(os.getenv("KAY_SCRAPE_RATE", "5"))
+# Retries per page for connection errors / 429 / 5xx, with exponential backoff from KAY_SCRAPE_BACKOFF_SEC
+KAY_SCRAPE_RETRIES = int(os.getenv("KAY_SCRAPE_RETRIES", "3"))
+KAY_SCRAPE_BACKOFF_SEC = float(os.getenv("KAY_SCRAPE_BACKOFF_SEC", "0.5"))
+KAY_SCRAPE_TIMEOUT_SEC = float(os.getenv("KAY_SCRAPE_TIMEOUT_SEC", "15"))
+
+PAGE_ROWS = 42
+OUTPUT_CSV = "all_products.csv"
+STATE_JSON = "all_products.state.json"
+FIELDNAMES = ["name", "price", "url"]
 
 # Fields to request
 fields = "v_MSRP,v_allCategories,v_availableSwatchesCode,v_availableSwatchesValues,v_badgeId,v_badgeText,v_badgeImageAltText,v_bopisPOS,v_category,v_custom_discount_amount,v_custom_discount_percentage,v_custom_discount_percentage_string,v_stockLevel,v_url,v_variant_code,v_sku,v_productUrl,v_stockLevelStatus,v_title,v_specials,v_numberOfRatings,v_avgRating,v_imgx100,v_imgx135,v_imgx260,v_imgx320,v_imageUrl,v_price,v_financePaymentApr,v_lowestFinanceAmountPerMonth,v_isFinancingAvailable,v_availableToRent,v_rentalPrice,v_moreOptions,v_isPJProduct,v_vendorID,v_ampProductType,v_categoryPromotion"
 
-# To store final deduplicated products
-all_products = {}
-total_count = 0
-
-for cat_id in category_ids:
-    print(f"\n🚀 Scraping category {cat_id} ...")
-    start = 0
-    rows = 42
-
-    while True:
-        params = {
-            "p": f"v_categoryPathId:{cat_id}",
-            "pagetype": "boolean",
-            "version": "V2",
-            "start": str(start),
-            "rows": str(rows),
-            "format": "json",
-            "user-type": "first-time",
-            "fields": fields,
-            "uid": "uid-1754128934137-70560"
-        }
-        response = requests.get(api_base, params=params)
-        data = response.json()
-
-        products = data.get("response", {}).get("products", [])
-        print(f"  ✅ Found {len(products)} products at offset {start}")
-
-        if not products:
-            break
-
-        for p in products:
-            # products often have multiple variants; pick first
-            v = p["variants"][0]
-
-            product_id = v.get("v_url") or v.get("v_productUrl")
-            if not product_id:
-                continue
 
-            # Use full URL
-            full_url = "https://www.kayoutlet.com" + product_id
-
-            # Deduplicate: store by URL
-            all_products[full_url] = {
-                "name": v.get("v_title", "N/A"),
-                "price": v.get("v_price", "N/A"),
-                "url": full_url,
-                
-            }
-
-        start += rows
-
-print(f"\n🎉 Done! Total unique products scraped: {len(all_products)}")
-
-# Write to CSV
-with open("all_products.csv", "w", newline="", encoding="utf-8") as f:
-    writer = csv.DictWriter(f, fieldnames=[
-        "name", "price", "url"
-    ])
-    writer.writeheader()
-    writer.writerows(all_products.values())
+def page_params(cat_id, start, rows=PAGE_ROWS):
+    return {
+        "p": f"v_categoryPathId:{cat_id}",
+        "pagetype": "boolean",
+        "version": "V2",
+        "start": str(start),
+        "rows": str(rows),
+        "format": "json",
+        "user-type": "first-time",
+        "fields": fields,
+        "uid": "uid-1754128934137-70560"
+    }
+
+
+def to_rows(products):
+    rows = []
+    for p in products:
+        # products often have multiple variants; pick first
+        v = (p.get("variants") or [p])[0]
+
+        product_id = v.get("v_url") or v.get("v_productUrl")
+        if not product_id:
+            continue
+
+        # Use full URL
+        full_url = "https://www.kayoutlet.com" + product_id
+        rows.append({
+            "name": v.get("v_title", "N/A"),
+            "price": v.get("v_price", "N/A"),
+            "url": full_url,
+        })
+    return rows
+
+
+def fetch_page(session, limiter, cat_id, start, base=None, timeout=None):
+    """One Unbxd page: (cat_id, start, products, numberOfProducts or None)."""
+    response = get(session, base or api_base, limiter, timeout=timeout or KAY_SCRAPE_TIMEOUT_SEC,
+                   params=page_params(cat_id, start))
+    data = response.json().get("response", {})
+    return cat_id, start, data.get("products", []), data.get("numberOfProducts")
+
+
+def scrape(categories=category_ids, output=OUTPUT_CSV, base=None, workers=KAY_SCRAPE_WORKERS,
+           rate=KAY_SCRAPE_RATE, retries=KAY_SCRAPE_RETRIES, backoff=KAY_SCRAPE_BACKOFF_SEC, state=None) -> dict:
+    """
+    Scrape every category into `output`.
+
+    The first page of each category is fetched in parallel; its
+    numberOfProducts says how many pages follow, and those are all queued at
+    once. If the API doesn't report a total, a category is walked `workers`
+    pages at a time until a page comes back empty. Rows are written as each
+    page arrives (first occurrence of a URL wins).
+
+    With a ScrapeState every product is also classified as added / changed /
+    unchanged against the previous run. Search result pages are never served
+    with validators, so change detection here is by content hash only.
+    """
+    base = base or api_base
+    if not base:
+        raise ValueError("UNBXD_API_BASE is not set")
+    session = make_session(pool_size=workers, retries=retries, backoff=backoff)
+    limiter = RateLimiter(rate, burst=workers)
+    stats = {"pages": 0, "failed_pages": 0, "products": 0}
+    started = time.perf_counter()
+
+    with StreamingCsvWriter(output, FIELDNAMES) as writer, ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(cat_id, start):
+            return pool.submit(fetch_page, session, limiter, cat_id, start, base)
+
+        pending = {submit(cat_id, 0) for cat_id in categories}
+        frontier = {}  # categories walked without a known total: next offset to queue
+        while pending:
+            future = next(as_completed(pending))
+            pending.discard(future)
+            try:
+                cat_id, start, products, total = future.result()
+            except Exception as e:
+                stats["failed_pages"] += 1
+                print(f"  ❌ Page failed after retries: {e}")
+                continue
 
-print("✅ CSV saved as all_products.csv")
+            stats["pages"] += 1
+            new = writer.write_rows(to_rows(products))
+            if state is not None:
+                for row in new:
+                    state.record(row["url"], row)
+            stats["products"] += len(new)
+            print(f"  ✅ [{cat_id}] {len(products)} products at offset {start} ({len(new)} new)")
+
+            if start == 0 and products:
+                if total is not None:
+                    print(f"\n🚀 Category {cat_id}: {total} products")
+                    pending |= {submit(cat_id, s) for s in range(PAGE_ROWS, int(total), PAGE_ROWS)}
+                else:
+                    # Unknown total: open a window of `workers` pages ...
+                    frontier[cat_id] = PAGE_ROWS * (workers + 1)
+                    pending |= {submit(cat_id, s) for s in range(PAGE_ROWS, frontier[cat_id], PAGE_ROWS)}
+            elif cat_id in frontier:
+                if not products:
+                    del frontier[cat_id]  # past the last page; what is still in flight comes back empty
+                else:
+                    # ... and slide it by one page for every full page that comes back
+                    pending.add(submit(cat_id, frontier[cat_id]))
+                    frontier[cat_id] += PAGE_ROWS
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape Kay Outlet category listings from the Unbxd search API")
+    parser.add_argument("categories", nargs="*", default=category_ids)
+    parser.add_argument("--output", default=OUTPUT_CSV)
+    parser.add_argument("--workers", type=int, default=KAY_SCRAPE_WORKERS)
+    parser.add_argument("--rate", type=float, default=KAY_SCRAPE_RATE, help="Requests per second (0 = unlimited)")
+    parser.add_argument("--state", default=STATE_JSON, help="Scrape state from the previous run")
+    parser.add_argument("--no-state", action="store_true", help="Don't compare with the previous run")
+    args = parser.parse_args()
+
+    state = None if args.no_state else ScrapeState(args.state)
+    stats = scrape(args.categories, args.output, workers=args.workers, rate=args.rate, state=state)
+    print(f"\n🎉 Done! Total unique products scraped: {stats['products']} "
+          f"({stats['pages']} pages, {stats['failed_pages']} failed, {stats['seconds']}s)")
+    print(f"✅ CSV saved as {args.output}")
+    if state is not None:
+        if stats["failed_pages"]:
+            # Products on the failed pages weren't seen, which doesn't mean they were removed
+            print("⚠️ Some pages failed; not marking unseen products as removed")
+        elif set(args.categories) == set(category_ids):
+            state.finish()
+        else:
+            print("⚠️ Not all categories were scraped; not marking unseen products as removed")
+        state.save()
+        print(f"✅ Delta {state.summary()} saved as {state.write_delta(delta_path(args.output))}")
@@ -1,112 +1,202 @@
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from bs4 import BeautifulSoup
+#visits the product urls in INPUT_CSV with a pool of reusable chrome drivers and writes poc_kay.csv.
+#every parsed product is appended to CHECKPOINT_JSONL as soon as it's done; re-running resumes from there (--restart to start over).
+#pages that answer a conditional HEAD with 304 since the previous run are not opened at all; poc_kay.delta.csv lists what changed.
+
+import argparse
 import csv
 import json
+import os
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 
-INPUT_CSV = "test_csv.csv"   #create a test_csv by picking some products from products.csv
-OUTPUT_JSON = "test_output.json"
-OUTPUT_CSV = "poc_kay.csv"
-WAIT_TIME = 15
-
-options = webdriver.ChromeOptions()
-# options.add_argument("--headless")  # optional: run headless
-driver = webdriver.Chrome(options=options)
+from dotenv import load_dotenv
 
-results = []
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
-with open(INPUT_CSV, newline='', encoding="utf-8") as csvfile:
-    reader = csv.DictReader(csvfile)
-    for idx, row in enumerate(reader):
-        url = row["url"]
-        print(f"\n[{idx+1}] Visiting: {url}")
+from scraping.drivers import DriverPool, chrome_factory  # noqa: E402
+from scraping.output import Checkpoint  # noqa: E402
+from scraping.parsers import parse_specs_tables  # noqa: E402  (backend: SCRAPE_PARSER_BACKEND)
+from scraping.session import make_session  # noqa: E402
+from scraping.state import ScrapeState, delta_path, probe  # noqa: E402
 
-        try:
-            driver.get(url)
+try:
+    from selenium.common.exceptions import TimeoutException
+    from selenium.webdriver.common.action_chains import ActionChains
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support import expected_conditions as EC
+    from selenium.webdriver.support.ui import WebDriverWait
+except ImportError:  # reported by chrome_factory when a run actually starts
+    TimeoutException = ActionChains = By = EC = WebDriverWait = None
 
-            # Wait until product title appears
-            WebDriverWait(driver, WAIT_TIME).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, 'h1'))
-            )
-            print("✅ Page loaded")
+load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
 
-            # Scroll down to bottom to load JS content
-            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(2)
+INPUT_CSV = "test_csv.csv"   #create a test_csv by picking some products from products.csv
+OUTPUT_JSON = "test_output.json"
+OUTPUT_CSV = "poc_kay.csv"
+CHECKPOINT_JSONL = "test_output.jsonl"
+STATE_JSON = "poc_kay.state.json"
+ROW_FIELDS = ["name", "price", "url", "details"]
+WAIT_TIME = 15
 
-            # Try to click Details button
+# Chrome drivers (and worker threads) visiting product pages in parallel
+KAY_DETAIL_WORKERS = int(os.getenv("KAY_DETAIL_WORKERS", "3"))
+# Run Chrome without a window
+KAY_DETAIL_HEADLESS = os.getenv("KAY_DETAIL_HEADLESS", "0") == "1"
+# Seconds to wait for the specs tables after clicking Details
+KAY_DETAILS_WAIT_SEC = float(os.getenv("KAY_DETAILS_WAIT_SEC", "5"))
+# Save every visited page as debug_pages/debug_page_N.html (off by default, it's a full page per product)
+KAY_DEBUG_DUMPS = os.getenv("KAY_DEBUG_DUMPS", "0") == "1"
+DEBUG_DIR = "debug_pages"
+
+SPECS_TABLE = (By.CSS_SELECTOR, "table.specs-table") if By else None
+DETAILS_BUTTON = (By.XPATH, '//h4[contains(., "Details")]/ancestor::button') if By else None
+
+
+def load_page(driver, url):
+    """Open a product page and expand its Details section; returns the rendered HTML."""
+    driver.get(url)
+
+    # Wait until product title appears
+    WebDriverWait(driver, WAIT_TIME).until(EC.presence_of_element_located((By.CSS_SELECTOR, 'h1')))
+
+    # Scroll down to bottom to load JS content, then wait for the Details button instead of sleeping
+    driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+    try:
+        details_btn = WebDriverWait(driver, WAIT_TIME).until(EC.element_to_be_clickable(DETAILS_BUTTON))
+        ActionChains(driver).move_to_element(details_btn).click().perform()
+        # The specs tables are rendered by the click
+        WebDriverWait(driver, KAY_DETAILS_WAIT_SEC).until(EC.presence_of_element_located(SPECS_TABLE))
+    except TimeoutException:
+        print(f"⚠️ Details not found for {url}, parsing what is on the page")
+
+    return driver.page_source
+
+
+def scrape_product(pool, idx, row, debug_dumps=KAY_DEBUG_DUMPS, state=None, session=None):
+    url = row["url"]
+    started = time.perf_counter()
+    headers = {}
+    if state is not None:
+        stored, headers = probe(session, state, url, timeout=WAIT_TIME)
+        if stored is not None:
+            return {**stored, "seconds": round(time.perf_counter() - started, 2), "change": "unchanged",
+                    "not_modified": True}
+
+    with pool.driver() as driver:
+        try:
+            html = load_page(driver, url)
+        except TimeoutException as e:
+            # The page itself is broken, not the driver: keep the driver, record the failure
+            return {"url": url, "error": f"timeout: {e.msg}", "seconds": round(time.perf_counter() - started, 2)}
+
+    if debug_dumps:
+        os.makedirs(DEBUG_DIR, exist_ok=True)
+        dump_file = os.path.join(DEBUG_DIR, f"debug_page_{idx+1}.html")
+        with open(dump_file, "w", encoding="utf-8") as f:
+            f.write(html)
+
+    record = {
+        "name": row.get("name", "N/A"),
+        "price": row.get("price", "N/A"),
+        "url": url,
+        "details": parse_specs_tables(html),
+    }
+    if state is not None:
+        record["change"] = state.record(url, dict(record), headers)
+    record["seconds"] = round(time.perf_counter() - started, 2)
+    return record
+
+
+def run(rows, checkpoint, workers=KAY_DETAIL_WORKERS, driver_factory=None, debug_dumps=KAY_DEBUG_DUMPS,
+        state=None) -> dict:
+    """
+    Scrape every row not already in the checkpoint, appending each result as it finishes.
+    With a ScrapeState, unchanged pages (304) are skipped and every product is
+    classified as added / changed / unchanged against the previous run.
+    """
+    todo = [(idx, row) for idx, row in enumerate(rows) if not checkpoint.done(row["url"])]
+    print(f"🚀 {len(todo)} of {len(rows)} products to scrape ({len(rows) - len(todo)} already in the checkpoint)")
+    stats = {"scraped": 0, "unchanged": 0, "failed": 0, "skipped": len(rows) - len(todo)}
+    factory = driver_factory or chrome_factory(headless=KAY_DETAIL_HEADLESS)
+    session = make_session(pool_size=workers) if state is not None else None
+    if state is not None:
+        # Rows finished before an interruption still count as seen this run
+        for row in rows:
+            if checkpoint.done(row["url"]):
+                record = checkpoint.get(row["url"])
+                state.record(row["url"], {k: record[k] for k in ROW_FIELDS})
+
+    with DriverPool(workers, factory) as pool, ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(scrape_product, pool, idx, row, debug_dumps, state, session): (idx, row)
+                   for idx, row in todo}
+        for future in as_completed(futures):
+            idx, row = futures[future]
             try:
-                details_btn = WebDriverWait(driver, WAIT_TIME).until(
-                    EC.element_to_be_clickable((By.XPATH, '//h4[contains(., "Details")]/ancestor::button'))
-                )
-                ActionChains(driver).move_to_element(details_btn).click().perform()
-                print("✅ Clicked Details button")
-                time.sleep(2)
+                record = future.result()
             except Exception as e:
-                print("⚠️ Details button not found or not clickable, skipping click:", e)
-
-            time.sleep(2)  # wait for dynamic content
-
-            html = driver.page_source
-
-            # save page for debug
-            dump_file = f"debug_page_{idx+1}.html"
-            with open(dump_file, "w", encoding="utf-8") as f:
-                f.write(html)
-            print(f"💾 Saved page to {dump_file}")
-
-            # Parse with BeautifulSoup
-            soup = BeautifulSoup(html, "html.parser")
-            tables = soup.find_all("table", class_="specs-table")
-            print(f"👉 Found {len(tables)} specs tables")
-
-            product_details = {}
-            for table in tables:
-                thead = table.find("thead")
-                header = thead.get_text(strip=True) if thead else "Unknown Section"
-                items = {}
-                for tr in table.find_all("tr"):
-                    tds = tr.find_all("td")
-                    if len(tds) >= 2:
-                        key = tds[0].get_text(strip=True)
-                        value = tds[1].get_text(strip=True)
-                        items[key] = value
-                product_details[header] = items
-
-            record = {
-                "name": row.get("name", "N/A"),
-                "price": row.get("price", "N/A"),
-                "url": url,
-                "details": product_details
-            }
-            print("✅ Parsed details:", json.dumps(product_details, indent=2))
-            results.append(record)
-
-        except Exception as e:
-            print(f"❌ Failed to process product at {url}: {e}")
-            continue  # go to next product
-
-# save JSON
-with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-    json.dump(results, f, indent=2)
-print(f"\n✅ JSON saved to: {OUTPUT_JSON}")
-
-# save CSV: name, price, url, details(json)
-with open(OUTPUT_CSV, "w", newline='', encoding="utf-8") as f:
-    writer = csv.DictWriter(f, fieldnames=["name", "price", "url", "details"])
-    writer.writeheader()
-    for item in results:
-        writer.writerow({
-            "name": item["name"],
-            "price": item["price"],
-            "url": item["url"],
-            "details": json.dumps(item["details"], ensure_ascii=False)
-        })
-print(f"✅ CSV saved to: {OUTPUT_CSV}")
-
-driver.quit()
-print("\n🎉 Done!")
+                record = {"url": row["url"], "error": f"{type(e).__name__}: {e}"}
+            checkpoint.append(record)
+            if "error" in record:
+                stats["failed"] += 1
+                print(f"❌ [{idx+1}] Failed to process product at {row['url']}: {record['error']}")
+            elif record.get("not_modified"):
+                stats["unchanged"] += 1
+                print(f"⏭️ [{idx+1}] Not modified since the last run: {row['url']}")
+            else:
+                stats["scraped"] += 1
+                print(f"✅ [{idx+1}] {len(record['details'])} specs sections in {record['seconds']}s: {row['url']}")
+    return stats
+
+
+def export(records, output_json=OUTPUT_JSON, output_csv=OUTPUT_CSV):
+    # save JSON
+    with open(output_json, "w", encoding="utf-8") as f:
+        json.dump([{k: r[k] for k in ROW_FIELDS} for r in records], f, indent=2)
+    print(f"\n✅ JSON saved to: {output_json}")
+
+    # save CSV: name, price, url, details(json)
+    with open(output_csv, "w", newline='', encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["name", "price", "url", "details"])
+        writer.writeheader()
+        for item in records:
+            writer.writerow({
+                "name": item["name"],
+                "price": item["price"],
+                "url": item["url"],
+                "details": json.dumps(item["details"], ensure_ascii=False)
+            })
+    print(f"✅ CSV saved to: {output_csv}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape Kay Outlet product details into poc_kay.csv")
+    parser.add_argument("--input", default=INPUT_CSV)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_JSONL)
+    parser.add_argument("--workers", type=int, default=KAY_DETAIL_WORKERS)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and scrape everything again")
+    parser.add_argument("--debug-dumps", action="store_true", default=KAY_DEBUG_DUMPS,
+                        help=f"Save every page under {DEBUG_DIR}/")
+    parser.add_argument("--state", default=STATE_JSON, help="Scrape state from the previous run")
+    parser.add_argument("--no-state", action="store_true", help="Open every page and don't compare with the previous run")
+    args = parser.parse_args()
+
+    with open(args.input, newline='', encoding="utf-8") as csvfile:
+        rows = list(csv.DictReader(csvfile))
+
+    started = time.perf_counter()
+    state = None if args.no_state else ScrapeState(args.state)
+    with Checkpoint(args.checkpoint, resume=not args.restart) as checkpoint:
+        stats = run(rows, checkpoint, workers=args.workers, debug_dumps=args.debug_dumps, state=state)
+        export(checkpoint.records(order=[row["url"] for row in rows]))
+        if state is not None and not stats["failed"]:
+            # Complete: urls missing from this run are gone, and the next run starts from the state, not the checkpoint
+            state.finish()
+            checkpoint.clear()
+            state.save()
+            print(f"✅ Delta {state.summary()} saved to: {state.write_delta(delta_path(OUTPUT_CSV))}")
+        elif state is not None:
+            # The resumed run re-classifies the checkpointed rows against the unchanged state and writes the delta
+            print(f"⚠️ {stats['failed']} failed; state and delta left as they were until a resumed run completes")
+    print(f"\n🎉 Done in {time.perf_counter() - started:.1f}s! {stats}")
@@ -0,0 +1,77 @@
+#local stand-in for the Unbxd category search API, so final_scrape.py can be run and timed without hitting kayoutlet.com.
+#  python unbxd_stub.py --products 500 --latency 0.2 --fail-rate 0.1
+#  UNBXD_API_BASE=http://127.0.0.1:8765/category python final_scrape.py
+
+import argparse
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def make_products(cat_id: str, n: int):
+    return [
+        {"variants": [{
+            "v_title": f"Stub Diamond Bracelet {cat_id}-{i} 1/4 ct tw 10K Yellow Gold",
+            "v_price": round(500 + (i * 37) % 4000 + 0.99, 2),
+            "v_url": f"/stub-bracelet-{cat_id}-{i}/p/V-{cat_id}{i:05d}",
+        }]}
+        for i in range(n)
+    ]
+
+
+def make_handler(products_per_category: int, latency: float, fail_rate: float, report_total: bool):
+    catalog = {}
+
+    class UnbxdStub(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def do_GET(self):
+            time.sleep(latency)
+            if fail_rate and random.random() < fail_rate:
+                return self._send(503, {"error": "stub failure"})
+            query = parse_qs(urlparse(self.path).query)
+            cat_id = query.get("p", ["v_categoryPathId:0"])[0].split(":")[-1]
+            start = int(query.get("start", ["0"])[0])
+            rows = int(query.get("rows", ["42"])[0])
+            products = catalog.setdefault(cat_id, make_products(cat_id, products_per_category))
+            body = {"response": {"start": start, "products": products[start:start + rows]}}
+            if report_total:
+                body["response"]["numberOfProducts"] = len(products)
+            self._send(200, body)
+
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    return UnbxdStub
+
+
+def serve(host="127.0.0.1", port=8765, products=500, latency=0.1, fail_rate=0.0, report_total=True):
+    """The stub server, not yet started (call serve_forever() on it)."""
+    server = ThreadingHTTPServer((host, port), make_handler(products, latency, fail_rate, report_total))
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Unbxd category search API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--products", type=int, default=500, help="Products per category")
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds added to every response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--no-total", action="store_true", help="Omit numberOfProducts from responses")
+    args = parser.parse_args()
+
+    server = serve(port=args.port, products=args.products, latency=args.latency,
+                   fail_rate=args.fail_rate, report_total=not args.no_total)
+    print(f"🧪 Unbxd stub on http://127.0.0.1:{args.port}/category")
+    server.serve_forever()
@@ -0,0 +1 @@
+"""Helpers shared by the kay_outlet/ and glamira/ scrapers (HTTP session, rate limiting, output)."""
@@ -0,0 +1,106 @@
+import queue
+import threading
+from contextlib import contextmanager
+
+try:
+    from selenium import webdriver
+except ImportError:  # only the browser-based scrapers need it
+    webdriver = None
+
+
+def chrome_options(headless: bool = True):
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument("--headless=new")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("user-agent=Mozilla/5.0")
+    return options
+
+
+def chrome_factory(headless: bool = True, service=None):
+    """A zero-argument callable that starts one Chrome driver."""
+    if webdriver is None:
+        raise ImportError("selenium is required for browser scraping (pip install selenium)")
+
+    def start():
+        if service is not None:
+            return webdriver.Chrome(service=service, options=chrome_options(headless))
+        return webdriver.Chrome(options=chrome_options(headless))
+    return start
+
+
+class DriverPool:
+    """
+    Up to `size` long-lived browser drivers shared by worker threads.
+
+    Drivers are started on first checkout and reused for every later URL,
+    so browser startup is paid `size` times per run instead of once per page.
+    A driver that raised while checked out is quit and replaced, since its
+    session may be dead or stuck on a broken page.
+    """
+
+    def __init__(self, size: int, factory):
+        self.size = size
+        self.factory = factory
+        self._idle = queue.Queue()
+        self._started = 0
+        self._lock = threading.Lock()
+        self._all = []
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            start = self._started < self.size
+            if start:
+                self._started += 1
+        if not start:
+            return self._idle.get()
+        try:
+            driver = self.factory()
+        except Exception:
+            with self._lock:
+                self._started -= 1
+            raise
+        with self._lock:
+            self._all.append(driver)
+        return driver
+
+    def _discard(self, driver):
+        with self._lock:
+            self._started -= 1
+            if driver in self._all:
+                self._all.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    @contextmanager
+    def driver(self):
+        driver = self._checkout()
+        try:
+            yield driver
+        except Exception:
+            self._discard(driver)
+            raise
+        self._idle.put(driver)
+
+    def close(self):
+        with self._lock:
+            drivers, self._all = self._all, []
+            self._started = 0
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
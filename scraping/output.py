@@ -0,0 +1,108 @@
+import csv
+import json
+import os
+import threading
+
+
+class StreamingCsvWriter:
+    """
+    Appends rows to a CSV as they arrive instead of collecting them all first,
+    so memory stays flat and a crash keeps everything written so far.
+    Rows are deduplicated on `key`; only the keys are kept in memory.
+    """
+
+    def __init__(self, path, fieldnames, key: str = "url"):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.key = key
+        self.seen = set()
+        self.written = 0
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction="ignore")
+        self._writer.writeheader()
+
+    def write_rows(self, rows) -> list:
+        """Write the rows whose key hasn't been seen; returns those (new) rows."""
+        new = []
+        for row in rows:
+            if row[self.key] in self.seen:
+                continue
+            self.seen.add(row[self.key])
+            self._writer.writerow(row)
+            new.append(row)
+        self._file.flush()
+        self.written += len(new)
+        return new
+
+    def close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Checkpoint:
+    """
+    Append-only JSONL of finished records, one line per URL, written as each
+    one completes. An interrupted run loses at most the records in flight;
+    re-running with the same file skips every URL already recorded without
+    an "error" (failed URLs are retried). The last line for a URL wins.
+    """
+
+    def __init__(self, path, key: str = "url", resume: bool = True):
+        self.path = path
+        self.key = key
+        self._lock = threading.Lock()
+        self._records = {}
+        if resume and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # a line cut short by the crash
+                    self._records[record[key]] = record
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def done(self, key) -> bool:
+        record = self._records.get(key)
+        return record is not None and "error" not in record
+
+    def append(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self._records[record[self.key]] = record
+
+    def get(self, key):
+        return self._records.get(key)
+
+    def clear(self):
+        """Forget every record (after a completed run, so the next one starts over)."""
+        with self._lock:
+            self._file.truncate(0)
+            self._file.flush()
+            self._records = {}
+
+    def records(self, order=None) -> list:
+        """Successful records, in `order` (a list of keys) when given."""
+        with self._lock:
+            records = dict(self._records)
+        keys = order if order is not None else list(records)
+        return [records[k] for k in keys if k in records and "error" not in records[k]]
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,212 @@
+"""
+Product-page extraction shared by the Kay and Glamira scrapers, with selectable backends.
+
+    html.parser  BeautifulSoup over the whole page with the pure-Python parser (the original code)
+    strainer     BeautifulSoup that only builds the elements the extractor reads (SoupStrainer)
+    lxml         BeautifulSoup over the whole page with the lxml (C) parser
+    lxml-xpath   lxml.html + XPath, no BeautifulSoup tree at all
+
+Every backend returns the same output as html.parser; benchmarks/html_parsers.py checks that.
+"""
+import os
+
+from bs4 import BeautifulSoup, SoupStrainer, UnicodeDammit
+
+try:
+    import lxml.html as lxml_html
+    from lxml.etree import ParserError
+except ImportError:  # the lxml backends are optional
+    lxml_html = None
+
+BACKENDS = ("html.parser", "strainer", "lxml", "lxml-xpath")
+
+# Backend used when none is given; "auto" = the fastest one installed
+SCRAPE_PARSER_BACKEND = os.getenv("SCRAPE_PARSER_BACKEND", "auto")
+
+
+def available_backends():
+    return [b for b in BACKENDS if lxml_html is not None or not b.startswith("lxml")]
+
+
+def resolve_backend(backend=None):
+    backend = backend or SCRAPE_PARSER_BACKEND
+    if backend == "auto":
+        return "lxml-xpath" if lxml_html is not None else "strainer"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown parser backend {backend!r}, expected one of {BACKENDS} or 'auto'")
+    if backend.startswith("lxml") and lxml_html is None:
+        raise ImportError(f"The {backend} backend needs lxml (pip install lxml)")
+    return backend
+
+
+def _has_class(name):
+    """XPath predicate for `name` being one of the element's classes (like BeautifulSoup's class_=)."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _stripped_text(element):
+    """lxml equivalent of BeautifulSoup's get_text(strip=True)."""
+    return "".join(s.strip() for s in element.itertext())
+
+
+def _lxml_root(html):
+    if isinstance(html, bytes):
+        # Detect the charset the way BeautifulSoup does (lxml alone assumes latin-1 without a meta tag)
+        html = UnicodeDammit(html, is_html=True).unicode_markup
+    try:
+        return lxml_html.fromstring(html)
+    except ParserError:  # lxml refuses empty documents
+        return lxml_html.fromstring("<html></html>")
+
+
+def _soup(html, backend, strainer):
+    if backend == "strainer":
+        return BeautifulSoup(html, "html.parser", parse_only=strainer)
+    return BeautifulSoup(html, "lxml" if backend == "lxml" else "html.parser")
+
+
+class _TagStrainer(SoupStrainer):
+    """
+    Builds only the top-level tags for which wanted(name, attrs) is true, plus
+    everything inside them. attrs["class"] is a list of classes. SoupStrainer's
+    own rules can't OR conditions on different attributes, or match one class
+    of a multi-class attribute before the tag exists, so the tag test is overridden.
+    """
+
+    def __init__(self, names, wanted):
+        super().__init__(list(names))
+        self.wanted = wanted
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        attrs = dict(attrs or {})
+        classes = attrs.get("class") or ""
+        attrs["class"] = classes.split() if isinstance(classes, str) else list(classes)
+        return self.wanted(name, attrs)
+
+
+# --- Kay: specs tables ---
+
+_KAY_STRAINER = _TagStrainer(["table"], lambda name, attrs: "specs-table" in attrs["class"])
+
+
+def parse_specs_tables(html, backend=None):
+    """{section header: {label: value}} from the Kay specs tables of a product page."""
+    backend = resolve_backend(backend)
+    if backend == "lxml-xpath":
+        return _specs_tables_xpath(html)
+
+    soup = _soup(html, backend, _KAY_STRAINER)
+    product_details = {}
+    for table in soup.find_all("table", class_="specs-table"):
+        thead = table.find("thead")
+        header = thead.get_text(strip=True) if thead else "Unknown Section"
+        items = {}
+        for tr in table.find_all("tr"):
+            tds = tr.find_all("td")
+            if len(tds) >= 2:
+                key = tds[0].get_text(strip=True)
+                value = tds[1].get_text(strip=True)
+                items[key] = value
+        product_details[header] = items
+    return product_details
+
+
+def _specs_tables_xpath(html):
+    product_details = {}
+    for table in _lxml_root(html).xpath(f"//table[{_has_class('specs-table')}]"):
+        thead = table.xpath(".//thead")
+        header = _stripped_text(thead[0]) if thead else "Unknown Section"
+        items = {}
+        for tr in table.xpath(".//tr"):
+            tds = tr.xpath(".//td")
+            if len(tds) >= 2:
+                items[_stripped_text(tds[0])] = _stripped_text(tds[1])
+        product_details[header] = items
+    return product_details
+
+
+# --- Glamira: title, price, table-detail and the center stone section ---
+
+def _glamira_wanted(name, attrs):
+    if name == "span":
+        return attrs.get("data-ui-id") == "page-title-wrapper" or "price" in attrs["class"]
+    if name == "table":
+        return "table-detail" in attrs["class"]
+    return name == "div" and attrs.get("id") == "stone1_detail"
+
+
+_GLAMIRA_STRAINER = _TagStrainer(["span", "table", "div"], _glamira_wanted)
+
+
+def _detail_key(label_text):
+    return label_text.strip().strip(":").replace("?", "").replace("[]", "")
+
+
+def _detail_rows(table, details_dict):
+    for row in table.find_all("tr"):
+        label = row.find("td", class_="detail-label")
+        value = row.find("td", class_="detail-value")
+        if label and value:
+            details_dict[_detail_key(label.text)] = value.text.strip()
+
+
+def parse_glamira_page(html, backend=None):
+    """{"name", "price", "details"} from the `table-detail` / `stone1_detail` sections of a Glamira page."""
+    backend = resolve_backend(backend)
+    if backend == "lxml-xpath":
+        return _glamira_page_xpath(html)
+
+    soup = _soup(html, backend, _GLAMIRA_STRAINER)
+
+    name_tag = soup.find("span", {"data-ui-id": "page-title-wrapper"})
+    name = name_tag.get_text(strip=True) if name_tag else "N/A"
+
+    price_tag = soup.find("span", class_="price")
+    price = price_tag.get_text(strip=True) if price_tag else "N/A"
+
+    details_dict = {}
+
+    # General details
+    for table in soup.find_all("table", class_="table-detail"):
+        first_row = table.find("tr")
+        if first_row and "item-sku" in first_row.get("class", []):
+            _detail_rows(table, details_dict)
+
+    # Center Stone
+    stone_section = soup.find("div", id="stone1_detail")
+    if stone_section:
+        table = stone_section.find("table", class_="table-detail")
+        if table:
+            _detail_rows(table, details_dict)
+
+    return {"name": name, "price": price, "details": details_dict}
+
+
+def _detail_rows_xpath(table, details_dict):
+    for row in table.xpath(".//tr"):
+        label = row.xpath(f".//td[{_has_class('detail-label')}]")
+        value = row.xpath(f".//td[{_has_class('detail-value')}]")
+        if label and value:
+            details_dict[_detail_key(label[0].text_content())] = value[0].text_content().strip()
+
+
+def _glamira_page_xpath(html):
+    root = _lxml_root(html)
+    name_tag = root.xpath("(//span[@data-ui-id='page-title-wrapper'])[1]")
+    price_tag = root.xpath(f"(//span[{_has_class('price')}])[1]")
+
+    details_dict = {}
+    for table in root.xpath(f"//table[{_has_class('table-detail')}]"):
+        first_row = table.xpath("(.//tr)[1]")
+        if first_row and "item-sku" in (first_row[0].get("class") or "").split():
+            _detail_rows_xpath(table, details_dict)
+
+    stone_table = root.xpath(f"((//div[@id='stone1_detail'])[1]//table[{_has_class('table-detail')}])[1]")
+    if stone_table:
+        _detail_rows_xpath(stone_table[0], details_dict)
+
+    return {
+        "name": _stripped_text(name_tag[0]) if name_tag else "N/A",
+        "price": _stripped_text(price_tag[0]) if price_tag else "N/A",
+        "details": details_dict,
+    }
@@ -0,0 +1,74 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Responses worth retrying: throttling and transient server / gateway errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+
+def make_session(pool_size: int = 8, retries: int = 3, backoff: float = 0.5, headers=None) -> requests.Session:
+    """
+    A requests.Session with one connection pool of `pool_size` keep-alive
+    connections per host, shared by every worker thread. Connection errors
+    and RETRY_STATUSES are retried `retries` times with exponential backoff
+    (backoff, 2*backoff, 4*backoff ... seconds), honouring Retry-After.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(headers or DEFAULT_HEADERS)
+    return session
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all workers: at most `rate` requests per second on
+    average, with bursts of up to `burst`. rate <= 0 disables limiting.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def get(session: requests.Session, url: str, limiter: RateLimiter = None, timeout: float = 15, **kwargs):
+    """session.get under the rate limit, with a timeout; raises for HTTP errors left after retries."""
+    if limiter is not None:
+        limiter.acquire()
+    response = session.get(url, timeout=timeout, **kwargs)
+    response.raise_for_status()
+    return response
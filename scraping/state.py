@@ -0,0 +1,157 @@
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+
+CHANGES = ("added", "changed", "removed")
+DELTA_FIELDS = ["change", "name", "price", "url", "details"]
+
+
+def content_hash(row: dict) -> str:
+    """Hash of what downstream cares about: name, price and details (key order doesn't matter)."""
+    details = row.get("details")
+    if isinstance(details, str):
+        try:
+            details = json.loads(details)
+        except json.JSONDecodeError:
+            pass
+    payload = json.dumps([row.get("name"), str(row.get("price")), details], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class ScrapeState:
+    """
+    Per-URL memory of the previous scrape, kept in one JSON file.
+
+    For every URL it stores the response's ETag / Last-Modified, a hash of
+    the extracted name/price/details and the row itself. A re-run sends
+    those validators as a conditional request (a 304 means the page didn't
+    change and the stored row is reused without parsing), classifies every
+    freshly parsed row as added / changed / unchanged by its hash, and
+    treats URLs it didn't see again as removed. save() replaces the file
+    atomically, so a crash keeps the previous state.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._entries = json.load(f).get("urls", {})
+        self._seen = set()
+        self.changes = {change: [] for change in CHANGES}
+        self.unchanged = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def conditional_headers(self, url) -> dict:
+        entry = self._entries.get(url) or {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def not_modified(self, url) -> dict:
+        """The server answered 304: mark `url` seen and unchanged; returns its stored row."""
+        with self._lock:
+            entry = self._entries[url]
+            entry["checked_at"] = time.time()
+            self._seen.add(url)
+            self.unchanged += 1
+            return dict(entry["row"])
+
+    def known(self, url) -> bool:
+        return url in self._entries
+
+    def record(self, url, row: dict, headers=None) -> str:
+        """
+        Store a freshly scraped row; returns "added", "changed" or "unchanged".
+        `headers` are the response's (for its validators); None keeps the stored ones.
+        """
+        digest = content_hash(row)
+        with self._lock:
+            previous = self._entries.get(url)
+            if headers is None:
+                headers = {"ETag": (previous or {}).get("etag"), "Last-Modified": (previous or {}).get("last_modified")}
+            if previous is None:
+                change = "added"
+            elif previous["hash"] != digest:
+                change = "changed"
+            else:
+                change = "unchanged"
+            self._entries[url] = {
+                "hash": digest,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "checked_at": time.time(),
+                "changed_at": time.time() if change != "unchanged" else previous.get("changed_at"),
+                "row": row,
+            }
+            self._seen.add(url)
+            if change == "unchanged":
+                self.unchanged += 1
+            else:
+                self.changes[change].append(row)
+            return change
+
+    def finish(self) -> dict:
+        """
+        Mark every URL not seen this run as removed and drop it from the state.
+        Don't call it after a run with failures, or the failed URLs count as removed.
+        """
+        with self._lock:
+            for url in sorted(set(self._entries) - self._seen):
+                self.changes["removed"].append(self._entries.pop(url)["row"])
+        return self.summary()
+
+    def summary(self) -> dict:
+        return {**{change: len(rows) for change, rows in self.changes.items()}, "unchanged": self.unchanged}
+
+    def save(self):
+        tmp = f"{self.path}.tmp-{os.getpid()}"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"saved_at": time.time(), "urls": self._entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def write_delta(self, path, fieldnames=DELTA_FIELDS):
+        """added / changed / removed rows as a CSV with a leading `change` column."""
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+            writer.writeheader()
+            for change in CHANGES:
+                for row in self.changes[change]:
+                    details = row.get("details")
+                    if isinstance(details, dict):
+                        row = {**row, "details": json.dumps(details, ensure_ascii=False)}
+                    writer.writerow({**row, "change": change})
+        return path
+
+
+def probe(session, state: ScrapeState, url, limiter=None, timeout: float = 15):
+    """
+    HEAD `url` with its stored validators, for scrapers that render pages in a
+    browser (which can't send conditional requests). Returns (stored row if the
+    server says 304 Not Modified else None, response headers).
+    """
+    if limiter is not None:
+        limiter.acquire()
+    try:
+        response = session.head(url, headers=state.conditional_headers(url), timeout=timeout, allow_redirects=True)
+    except Exception:
+        return None, {}
+    if response.status_code == 304 and state.known(url):
+        return state.not_modified(url), response.headers
+    return None, response.headers
+
+
+def delta_path(output_csv) -> str:
+    """poc_kay.csv -> poc_kay.delta.csv"""
+    root, ext = os.path.splitext(output_csv)
+    return f"{root}.delta{ext or '.csv'}"
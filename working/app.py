@@ -1,46 +1,272 @@
-from fastapi import FastAPI
-from fastapi.responses import FileResponse
-import pandas as pd
-import uuid
 import time
-from pathlib import Path
-import matplotlib
-matplotlib.use("Agg")  # Prevent GUI windows from opening in FastAPI
-import matplotlib.pyplot as plt
-from normalization import get_similar_prices
-from price_calculator import calculate_retail_price
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from pydantic import BaseModel
+from typing import Any, List, Literal
+import asyncio
+import hashlib
+import json
+import math
+import numpy as np
+import pandas as pd
+from contextlib import asynccontextmanager
+from email.utils import formatdate, parsedate_to_datetime
+from normalization import (engine, get_similar_prices, get_similar_prices_batch, upsert_competitors, delete_competitors,
+                           apply_scrape_delta)
+from results_sink import ResultsSink
+from chart_renderer import ChartCache, chart_etag, chart_key, render_pricing_chart
+from pipeline import PricingPipeline, StageOverloaded
+from price_calculator import gold_price_provider, fetch_gold_price_usd_per_gram
+from metrics import (REQUEST_ERRORS, REQUEST_SECONDS, SERVER_TIMING, cache_access, collect_timings, registry,
+                     server_timing, stage)
+from profiling import PROFILE_HEADER, PROFILE_QUERY_PARAM, profile_request
+
+results_sink = ResultsSink()
+chart_cache = ChartCache()
+
+
+pipeline = None
+
+# Endpoints that answer before the pricing engine has finished loading
+ENGINE_FREE_PATHS = {"/healthz", "/readyz", "/gold-price", "/pipeline", "/metrics", "/docs", "/openapi.json"}
+
+app_import_seconds = round(time.perf_counter() - _import_started, 3)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global pipeline
+    # Load model, catalogs and embeddings in the background; the port is bound right away
+    engine.start_warmup()
+    pipeline = PricingPipeline()
+    pipeline.warm_up_render(render_pricing_chart, 1.0, 1.0, 1.0)
+    yield
+    # Don't lose queued result rows on shutdown
+    results_sink.close()
+    pipeline.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def require_engine(request: Request, call_next):
+    if not engine.ready and request.url.path not in ENGINE_FREE_PATHS:
+        return JSONResponse({"error": "Pricing engine is warming up", **engine.status()},
+                            status_code=503, headers={"Retry-After": "5"})
+    return await call_next(request)
+
+
+def _route(request: Request) -> str:
+    # The route template, not the raw path, so listing ids don't become metric labels
+    return getattr(request.scope.get("route"), "path", "unmatched")
+
+
+@app.middleware("http")
+async def time_request(request: Request, call_next):
+    """Request latency into /metrics, and the stages timed on its behalf as a Server-Timing header."""
+    started = time.perf_counter()
+    status = 500
+    with collect_timings() as timings:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+        except Exception as e:
+            REQUEST_ERRORS.inc(route=_route(request), error=type(e).__name__)
+            raise
+        finally:
+            total = time.perf_counter() - started
+            REQUEST_SECONDS.observe(total, method=request.method, route=_route(request), status=status)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing(timings, total)
+    return response
+
+
+@app.middleware("http")
+async def profile(request: Request, call_next):
+    """
+    Opt-in profiling (PROFILING_ENABLED=1): an X-Profile header or ?profile= query
+    parameter samples the threads that work on this request into a flame graph file.
+    """
+    trigger = request.headers.get(PROFILE_HEADER) or request.query_params.get(PROFILE_QUERY_PARAM)
+    with profile_request(f"{request.method} {request.url.path}", trigger) as session:
+        response = await call_next(request)
+    if session is not None:
+        response.headers["X-Profile"] = f"skipped; {session.skipped}" if session.skipped else session.path
+    return response
+
+
+class SimilarPricesBatchRequest(BaseModel):
+    listing_ids: List[str]
+    top_n: int = 5
+
+
+class CompetitorRow(BaseModel):
+    name: str
+    price: Any
+    url: str
+    details: Any = "{}"
+
+
+class CompetitorUpsertRequest(BaseModel):
+    rows: List[CompetitorRow]
+
+
+class CompetitorDeleteRequest(BaseModel):
+    urls: List[str]
+
+
+class CompetitorDeltaRow(CompetitorRow):
+    change: Literal["added", "changed", "removed"]
+
+
+class CompetitorDeltaRequest(BaseModel):
+    rows: List[CompetitorDeltaRow]
+
+
+def _competitor_frame(rows, columns) -> pd.DataFrame:
+    # Details arrive as a JSON object or as the scraper's JSON string
+    return pd.DataFrame([
+        {**row.model_dump(), "details": row.details if isinstance(row.details, str) else json.dumps(row.details)}
+        for row in rows
+    ], columns=columns)
+
+
+def _json_safe(value):
+    # numpy scalars and NaN are not valid JSON
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _savings(retail_price, gemgem_price, competitor_price) -> dict:
+    competitor_savings = competitor_price - gemgem_price
+    retail_savings = retail_price - gemgem_price
+    return {
+        "competitor_savings": competitor_savings,
+        "competitor_savings_percent": (competitor_savings / competitor_price) * 100 if competitor_price else 0,
+        "retail_savings": retail_savings,
+        "retail_savings_percent": (retail_savings / retail_price) * 100 if retail_price else 0,
+    }
+
+
+def _pricing_validators(listing_id: str, top_n: int, gold_price_per_gram: float):
+    """
+    (ETag, Last-Modified) for /pricing: they change only when the catalog data,
+    the competitor corpus version or the gold price changes.
+    """
+    snap = engine.competitor_corpus.snapshot
+    tag_source = f"{engine.data_fingerprint}|{snap.version}|{gold_price_per_gram:.4f}|{listing_id}|{top_n}"
+    etag = '"' + hashlib.sha1(tag_source.encode("utf-8")).hexdigest()[:20] + '"'
+    return etag, _last_modified()
+
 
-# Load datasets
-gemgem_df = pd.read_csv("data/poc_gemgem.csv")
+def _last_modified() -> int:
+    """Newest of the catalog data, the competitor corpus version and the last gold price fetch."""
+    snap = engine.competitor_corpus.snapshot
+    return int(max(engine.data_modified_at, snap.created_at if snap.version else 0,
+                   gold_price_provider.last_success_at or 0))
 
-app = FastAPI()
+
+def _not_modified(request: Request, etag: str, last_modified: int) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match wins over If-Modified-Since when both are sent
+        return if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+@app.get("/pricing/{listing_id}")
+async def pricing(listing_id: str, request: Request, top_n: int = 5):
+    """Retail breakdown, competitor comparison and savings as JSON (no chart rendering)."""
+    try:
+        listing = engine.listing_store.get(listing_id)
+        if listing is None:
+            return JSONResponse({"error": "Listing not found"}, status_code=404)
+
+        gold_price_per_gram = await pipeline.io.run(fetch_gold_price_usd_per_gram)
+        etag, last_modified = _pricing_validators(listing_id, top_n, gold_price_per_gram)
+        headers = {"ETag": etag, "Last-Modified": formatdate(last_modified, usegmt=True),
+                   "Cache-Control": "public, max-age=0, must-revalidate"}
+        # Answer revalidations before doing any similarity work
+        if _not_modified(request, etag, last_modified):
+            cache_access("http_revalidation", hit=True)
+            return Response(status_code=304, headers=headers)
+        if "if-none-match" in request.headers or "if-modified-since" in request.headers:
+            cache_access("http_revalidation", hit=False)
+
+        price_info = await pipeline.inference.run(get_similar_prices, listing_id, top_n)
+        retail = engine.listing_store.retail_breakdown(listing_id, gold_price_per_gram)
+        gemgem_price = listing.price
+        competitor_price = price_info["similar_website_average_price"]
+
+        body = {
+            "listing_id": listing_id,
+            "name": listing.name,
+            "gemgem_price": gemgem_price,
+            "retail": retail,
+            "retail_price": retail["retail_price"],
+            "competitor_average_price": competitor_price,
+            **_savings(retail["retail_price"], gemgem_price, competitor_price),
+            "match_rate": price_info.get("match_rate"),
+            "similar_products": price_info["similar_products"],
+            "gold_price_last_updated": gold_price_provider.status()["last_success_at"],
+        }
+        return JSONResponse(_json_safe(body), headers=headers)
+
+    except StageOverloaded as e:
+        REQUEST_ERRORS.inc(route=_route(request), error="StageOverloaded")
+        return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "1"})
 
 
 @app.get("/pricing-chart/{listing_id}")
-def generate_chart(listing_id: str):
+async def generate_chart(listing_id: str, request: Request):
     start_time = time.time()  # Start performance timer
 
     try:
         # Get GEMGEM price
-        row = gemgem_df[gemgem_df["listing_id"] == listing_id]
-        if row.empty:
+        listing = engine.listing_store.get(listing_id)
+        if listing is None:
             return {"error": "Listing not found"}
 
-        gemgem_price = row["price"].values[0]
+        gemgem_price = listing.price
+
+        # Gold price (I/O stage) and competitor similarity (inference stage) run concurrently
+        gold_price_per_gram, price_info = await asyncio.gather(
+            pipeline.io.run(fetch_gold_price_usd_per_gram),
+            pipeline.inference.run(get_similar_prices, listing_id),
+        )
 
         # Retail price
-        retail_price = calculate_retail_price(listing_id, gemgem_df)
+        retail_price = engine.listing_store.retail_breakdown(listing_id, gold_price_per_gram)["retail_price"]
 
         # Competitor price
-        price_info = get_similar_prices(listing_id)
         competitor_price = price_info["similar_website_average_price"]
 
-        # Savings Calculations
-        competitor_savings = competitor_price - gemgem_price
-        competitor_savings_percent = (competitor_savings / competitor_price) * 100 if competitor_price else 0
-
-        retail_savings = retail_price - gemgem_price
-        retail_savings_percent = (retail_savings / retail_price) * 100 if retail_price else 0
+        # Chart: answer revalidations before logging a result or rendering anything
+        key = chart_key(listing_id, retail_price, gemgem_price, competitor_price)
+        last_modified = _last_modified()
+        headers = {"ETag": chart_etag(key), "Last-Modified": formatdate(last_modified, usegmt=True),
+                   "Cache-Control": "no-cache"}
+        if _not_modified(request, headers["ETag"], last_modified):
+            cache_access("http_revalidation", hit=True)
+            return Response(status_code=304, headers=headers)
+        if "if-none-match" in request.headers or "if-modified-since" in request.headers:
+            cache_access("http_revalidation", hit=False)
 
         # Save results for analysis
         processing_time = round(time.time() - start_time, 3)  # seconds
@@ -49,55 +275,112 @@ def generate_chart(listing_id: str):
             "retail_price": retail_price,
             "gemgem_price": gemgem_price,
             "competitor_price": competitor_price,
-            "competitor_savings": competitor_savings,
-            "competitor_savings_percent": competitor_savings_percent,
-            "retail_savings": retail_savings,
-            "retail_savings_percent": retail_savings_percent,
+            **_savings(retail_price, gemgem_price, competitor_price),
             "match_rate": price_info.get("match_rate", None),  # From normalization.py
             "processing_time_sec": processing_time
         }
 
-        csv_path = Path("poc_test_results.csv")
-        if csv_path.exists():
-            df_existing = pd.read_csv(csv_path)
-            df_existing = pd.concat([df_existing, pd.DataFrame([results_row])], ignore_index=True)
-            df_existing.to_csv(csv_path, index=False)
-        else:
-            pd.DataFrame([results_row]).to_csv(csv_path, index=False)
-
-        # Create chart
-        labels = ["Retail Price", "GEMGEM Price", "Other Platforms"]
-        values = [retail_price, gemgem_price, competitor_price]
-        colors = ["#d4a5a5", "#3cb371", "#d4a5a5"]
-
-        plt.figure(figsize=(6, 5))
-        bars = plt.bar(labels, values, color=colors)
-        plt.ylabel("Price (USD)")
-        plt.title("Smart Pricing Comparison & Savings")
-
-        # Annotate prices on top of bars
-        for bar, val in zip(bars, values):
-            plt.text(bar.get_x() + bar.get_width()/2, val, f"${val:,.2f}",
-                     ha='center', va='bottom', fontsize=10, fontweight='bold')
-
-        # Add savings info as a note below chart
-        savings_text = (
-            f"Savings vs Competitors: ${competitor_savings:,.2f} ({competitor_savings_percent:.1f}%)\n"
-            f"Savings vs Retail: ${retail_savings:,.2f} ({retail_savings_percent:.1f}%)"
-        )
-        plt.gcf().text(0.5, -0.15, savings_text, ha='center', fontsize=9)
-
-        plt.tight_layout()
-
-        # Save chart
-        chart_filename = f"{uuid.uuid4()}.png"
-        chart_path = f"/tmp/{chart_filename}"
-        plt.savefig(chart_path, bbox_inches="tight")
-        plt.close()
+        results_sink.submit(results_row)  # appended in the background
 
-        return FileResponse(chart_path, media_type="image/png", filename="chart.png")
+        # Served from the LRU cache when the numbers repeat, else rendered in the render stage
+        png = chart_cache.get(key)
+        cache_access("chart", hit=png is not None)
+        if png is None:
+            with stage("render"):
+                png = await pipeline.render.run(render_pricing_chart, *key[1:])
+            chart_cache.put(key, png)
+        headers["Content-Disposition"] = 'attachment; filename="chart.png"'
+        return Response(content=png, media_type="image/png", headers=headers)
 
+    except StageOverloaded as e:
+        # Backpressure: tell the client / load balancer to retry rather than queueing forever
+        REQUEST_ERRORS.inc(route=_route(request), error="StageOverloaded")
+        return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "1"})
     except Exception as e:
+        REQUEST_ERRORS.inc(route=_route(request), error=type(e).__name__)
         with open("error_log.txt", "a") as f:
             f.write(f"{listing_id} - {str(e)}\n")
         return {"error": str(e)}
+
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up. Fails only if the engine could not be loaded at all."""
+    status = engine.status()
+    if status["error"] and not status["warming_up"]:
+        return JSONResponse({"status": "error", "error": status["error"]}, status_code=500)
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: 200 once the engine is loaded, with the startup time of each phase."""
+    body = {**engine.status(), "app_import_seconds": app_import_seconds}
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+
+@app.get("/gold-price")
+def gold_price_status():
+    return gold_price_provider.status()
+
+
+@app.get("/pipeline")
+def pipeline_status():
+    return {"stages": pipeline.stats(), "chart_cache": chart_cache.stats(), "results_sink": results_sink.stats()}
+
+
+def _runtime_gauges():
+    """Gauges read off the running objects at scrape time."""
+    gold = gold_price_provider.status()
+    families = [
+        ("pricing_engine_ready", "1 once the model, catalogs and embeddings are loaded", [({}, int(engine.ready))]),
+        ("pricing_gold_price_per_gram", "18K gold price in USD per gram being served", [({}, gold["gold_price_per_gram"])]),
+        ("pricing_gold_price_age_seconds", "Seconds since the last successful gold price fetch",
+         [({}, gold["age_seconds"])]),
+        ("pricing_gold_price_fallback", "1 while the fallback gold price is served", [({}, int(gold["is_fallback"]))]),
+        ("pricing_chart_cache_entries", "Charts in the in-memory PNG cache", [({}, chart_cache.stats()["entries"])]),
+        ("pricing_chart_cache_bytes", "Bytes held by the PNG cache", [({}, chart_cache.stats()["bytes"])]),
+        ("pricing_results_queued", "Result rows waiting to be written", [({}, results_sink.stats()["queued"])]),
+    ]
+    if pipeline is not None:
+        stages = pipeline.stats()
+        for field in ("in_flight", "waiting", "rejected"):
+            families.append((f"pricing_pipeline_{field}", f"Pipeline stage {field.replace('_', ' ')} calls",
+                             [({"stage": name}, s[field]) for name, s in stages.items()]))
+    if engine.ready:
+        snap = engine.competitor_corpus.snapshot
+        families.append(("pricing_competitors", "Competitor products in the live corpus", [({}, len(snap))]))
+        families.append(("pricing_corpus_version", "Competitor corpus version", [({}, snap.version)]))
+    return families
+
+
+registry.register_collector(_runtime_gauges)
+
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint: stage latencies, cache hit / miss counts, errors and runtime gauges."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/similar-prices/batch")
+def similar_prices_batch(request: SimilarPricesBatchRequest):
+    results = get_similar_prices_batch(request.listing_ids, top_n=request.top_n)
+    # The full competitor frame is only useful in-process
+    return {"results": [_json_safe({k: v for k, v in r.items() if k != "competitor_df"}) for r in results]}
+
+
+@app.post("/competitors/upsert")
+def competitors_upsert(request: CompetitorUpsertRequest):
+    return upsert_competitors(_competitor_frame(request.rows, ["name", "price", "url", "details"]))
+
+
+@app.post("/competitors/delete")
+def competitors_delete(request: CompetitorDeleteRequest):
+    return delete_competitors(request.urls)
+
+
+@app.post("/competitors/delta")
+def competitors_delta(request: CompetitorDeltaRequest):
+    """Apply a scraper's delta (the rows of its *.delta.csv) as one upsert + delete."""
+    return apply_scrape_delta(_competitor_frame(request.rows, ["change", "name", "price", "url", "details"]))
@@ -3,17 +3,28 @@ from fastapi.responses import FileResponse
 import pandas as pd
 import uuid
 import time
-from pathlib import Path
+from contextlib import asynccontextmanager
 import matplotlib
 matplotlib.use("Agg")  # Prevent GUI windows from opening in FastAPI
 import matplotlib.pyplot as plt
 from normalization import get_similar_prices
+from results_sink import ResultsSink
 from price_calculator import calculate_retail_price
 
 # Load datasets
 gemgem_df = pd.read_csv("data/poc_gemgem.csv")
 
-app = FastAPI()
+results_sink = ResultsSink()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Don't lose queued result rows on shutdown
+    results_sink.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/pricing-chart/{listing_id}")
@@ -47,13 +58,7 @@ def generate_chart(listing_id: str):
             "processing_time_sec": processing_time
         }
 
-        csv_path = Path("poc_test_results.csv")
-        if csv_path.exists():
-            df_existing = pd.read_csv(csv_path)
-            df_existing = pd.concat([df_existing, pd.DataFrame([results_row])], ignore_index=True)
-            df_existing.to_csv(csv_path, index=False)
-        else:
-            pd.DataFrame([results_row]).to_csv(csv_path, index=False)
+        results_sink.submit(results_row)  # appended in the background
 
         # --- Create chart ---
         labels = ["Retail Price", "GEMGEM Price", "Other Platforms"]
@@ -0,0 +1,251 @@
+import os
+import re
+from fractions import Fraction
+
+import numpy as np
+import pandas as pd
+
+# How many attributes a competitor must share with the listing before it is scored:
+# the first BLOCKING_LEVEL of ATTRIBUTES (0 = score every competitor)
+BLOCKING_LEVEL = int(os.getenv("BLOCKING_LEVEL", "2"))
+# Relax one attribute at a time until at least this many candidates survive (0 = top_n)
+BLOCKING_MIN_CANDIDATES = int(os.getenv("BLOCKING_MIN_CANDIDATES", "0"))
+
+# Most to least important; a blocking level keeps a prefix of this list
+ATTRIBUTES = ["category", "stone", "metal", "karat", "carat"]
+ATTRIBUTE_COLUMNS = [f"attr_{name}" for name in ATTRIBUTES]
+
+# Upper edges of the carat weight buckets; neighbouring buckets also match
+CARAT_BUCKETS = [0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0]
+
+# First match wins, so the more specific words come first
+CATEGORY_KEYWORDS = [
+    ("anklet", "anklet"),
+    ("earring", "earrings"),
+    ("bangle", "bracelet"),
+    ("cuff", "bracelet"),
+    ("bracelet", "bracelet"),
+    ("necklace", "necklace"),
+    ("pendant", "pendant"),
+    ("ring", "ring"),
+]
+
+# Where each schema keeps an attribute (Kay nests, Glamira is flat, GemGem nests differently)
+STONE_KEYS = [("Stone(s)", "Stone Type"), ("Stone",), ("Center Stone",)]
+METAL_KEYS = [("Metal(s)", "Metal"), ("Color / Metal",), ("Specifications", "Metal"), ("Metal(s)", "Metal Type")]
+KARAT_KEYS = [("Metal(s)", "Gold Karat")] + METAL_KEYS
+CARAT_KEYS = [("Stone(s)", "Carat Weight"), ("Stone(s)", "Total Weight (CT. T.W.)"),
+              ("Total Stone Carat",), ("Carat",)]
+
+_CARAT_RE = re.compile(r"(?:(\d+)\s+)?(\d+)/(\d+)|(\d+(?:\.\d+)?)")
+_KARAT_RE = re.compile(r"(\d{1,2})\s*k(?:t|arat)?\b", re.IGNORECASE)
+# Carat weight written in a product name, e.g. "1/4 ct tw" or "3.41ctw"
+_NAME_CARAT_RE = re.compile(r"((?:\d+\s+)?\d+/\d+|\d+(?:\.\d+)?)\s*ct", re.IGNORECASE)
+
+
+def _lookup(details: dict, *paths):
+    """First non-empty string found at any of the key paths."""
+    for path in paths:
+        value = details
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if isinstance(value, str) and value.strip():
+            return value
+    return None
+
+
+def _category(name: str, details: dict):
+    text = (name or "").lower()
+    for keyword, category in CATEGORY_KEYWORDS:
+        if re.search(rf"\b{keyword}s?\b", text):
+            return category
+    for section, category in (("Bracelet Design", "bracelet"), ("Necklace Design", "necklace")):
+        if section in details:
+            return category
+    return None
+
+
+def _stone(value):
+    if value is None:
+        return None
+    value = value.lower()
+    if "no stone" in value or value.strip() == "none":
+        return "none"
+    if "lab" in value and "diamond" in value:
+        return "lab diamond"
+    if "diamond" in value:
+        return "diamond"
+    if "pearl" in value:
+        return "pearl"
+    return value.strip()
+
+
+def _metal(value):
+    if value is None:
+        return None
+    value = value.lower()
+    if "platinum" in value:
+        return "platinum"
+    if "silver" in value or "925" in value:
+        return "silver"
+    if "gold" in value:
+        return "gold"
+    return None
+
+
+def _karat(details: dict, name: str):
+    for value in [_lookup(details, path) for path in KARAT_KEYS] + [name]:
+        match = _KARAT_RE.search(value) if value else None
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def _name_carats(name: str):
+    match = _NAME_CARAT_RE.search(name or "")
+    return parse_carats(match.group(1)) if match else None
+
+
+def parse_carats(value):
+    """'3.41 ctw' -> 3.41, '1/15' -> 0.0667, '1 1/2' -> 1.5; None if there is no number."""
+    if value is None:
+        return None
+    match = _CARAT_RE.search(value)
+    if not match:
+        return None
+    whole, num, den, decimal = match.groups()
+    if decimal:
+        return float(decimal)
+    return int(whole or 0) + float(Fraction(int(num), int(den)))
+
+
+def extract_attributes(name: str, details: dict) -> dict:
+    """
+    Normalised blocking attributes of one product; None where the source doesn't say.
+    Metal, karat and carat weight fall back to the product name, which
+    usually spells them out ("... 1/4 ct tw 10K Yellow Gold").
+    """
+    details = details if isinstance(details, dict) else {}
+    carats = parse_carats(_lookup(details, *CARAT_KEYS))
+    return {
+        "attr_category": _category(name, details),
+        "attr_stone": _stone(_lookup(details, *STONE_KEYS)),
+        "attr_metal": _metal(_lookup(details, *METAL_KEYS) or name),
+        "attr_karat": _karat(details, name),
+        "attr_carat": carats if carats is not None else _name_carats(name),
+    }
+
+
+def add_attribute_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Add the attr_* columns from `name` and `parsed_details` (computed once, at load)."""
+    attributes = pd.DataFrame(
+        [extract_attributes(n, d) for n, d in zip(df["name"], df["parsed_details"])],
+        columns=ATTRIBUTE_COLUMNS, index=df.index,
+    )
+    for column in ATTRIBUTE_COLUMNS:
+        df[column] = attributes[column]
+    return df
+
+
+def _key(attribute: str, value):
+    """Posting-list key of one attribute value (carats are bucketed); None = unknown."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if attribute == "carat":
+        return int(np.searchsorted(CARAT_BUCKETS, value, side="right"))
+    return value
+
+
+class AttributeIndex:
+    """
+    Inverted index from attribute values to competitor row ids (blocking).
+
+    candidates() intersects the posting lists of the listing's attributes,
+    so only competitors that could plausibly be the same kind of product
+    reach cosine scoring. Rows whose attribute is unknown match any value,
+    and a listing attribute that is unknown constrains nothing. Like the
+    vector indexes it is immutable: with_added returns a new index.
+    """
+
+    def __init__(self, postings: dict, n: int):
+        self._postings = postings  # {attribute: {key: sorted row ids}}
+        self._n = n
+        self._cache = {}
+
+    def __len__(self):
+        return self._n
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, first_id: int = 0) -> "AttributeIndex":
+        postings = {}
+        for attribute, column in zip(ATTRIBUTES, ATTRIBUTE_COLUMNS):
+            if column not in df.columns:
+                keys = pd.Series([None] * len(df), dtype=object)
+            elif attribute == "carat":
+                carats = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=float)
+                keys = pd.Series(np.searchsorted(CARAT_BUCKETS, carats, side="right")).where(~np.isnan(carats))
+            else:
+                keys = pd.Series(df[column].to_numpy(dtype=object))
+            postings[attribute] = {
+                (None if pd.isna(key) else key): ids.astype(np.int64) + first_id
+                for key, ids in keys.groupby(keys, dropna=False).indices.items()
+            }
+        return cls(postings, len(df))
+
+    def with_added(self, df: pd.DataFrame, first_id: int) -> "AttributeIndex":
+        """New index that also covers `df`, whose rows get ids first_id, first_id + 1, ..."""
+        added = AttributeIndex.from_frame(df, first_id)
+        postings = {}
+        for attribute in ATTRIBUTES:
+            merged = dict(self._postings[attribute])
+            for key, ids in added._postings[attribute].items():
+                merged[key] = np.concatenate([merged[key], ids]) if key in merged else ids
+            postings[attribute] = merged
+        return AttributeIndex(postings, max(self._n, first_id + len(df)))
+
+    def _matching(self, attribute: str, value):
+        key = _key(attribute, value)
+        if key is None:
+            return None
+        keys = [key - 1, key, key + 1] if attribute == "carat" else [key]
+        lists = self._postings[attribute]
+        blocks = [lists[k] for k in keys + [None] if k in lists]
+        return np.sort(np.concatenate(blocks)) if blocks else np.empty(0, dtype=np.int64)
+
+    def _block(self, query: dict, level: int):
+        # NaN != NaN, so a NaN attribute would never hit the cache: key it as None
+        values = (query.get(c) for c in ATTRIBUTE_COLUMNS[:level])
+        cache_key = (tuple(None if pd.isna(v) else v for v in values), level)
+        if cache_key not in self._cache:
+            sets = []
+            for attribute, column in zip(ATTRIBUTES[:level], ATTRIBUTE_COLUMNS[:level]):
+                ids = self._matching(attribute, query.get(column))
+                if ids is not None:
+                    sets.append(ids)
+            result = None  # nothing known about the listing: no restriction
+            if sets:
+                sets.sort(key=len)
+                result = sets[0]
+                for ids in sets[1:]:
+                    result = np.intersect1d(result, ids, assume_unique=True)
+            if len(self._cache) >= 4096:
+                self._cache.clear()
+            self._cache[cache_key] = result
+        return self._cache[cache_key]
+
+    def candidates(self, query: dict, level: int = BLOCKING_LEVEL, min_candidates: int = 1, alive=None):
+        """
+        Row ids to score for a listing with attributes `query` (attr_* keys).
+        Starts at `level` and drops the least important attribute until at
+        least `min_candidates` live rows survive. Returns (ids, level used);
+        ids is None when no blocking applies and every row should be scored.
+        """
+        for current in range(min(level, len(ATTRIBUTES)), 0, -1):
+            ids = self._block(query, current)
+            if ids is None:
+                return None, current
+            if alive is not None:
+                ids = ids[alive[ids]]
+            if len(ids) >= min_candidates:
+                return ids, current
+        return None, 0
@@ -0,0 +1,288 @@
+import argparse
+import ast
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from attribute_index import add_attribute_columns
+from price_calculator import add_weight_columns
+
+try:
+    import pyarrow  # noqa: F401  (pandas' Parquet engine)
+except ImportError:  # only needed to write / read a compiled catalog
+    pyarrow = None
+
+# Compiled catalog root (versions + CURRENT pointer); when it has one the engine loads it instead of the CSVs
+CATALOG_PATH = os.getenv("CATALOG_PATH", "")
+
+DATA_FILES = ["data/poc_kay.csv", "data/poc_glamira.csv", "data/poc_gemgem.csv"]
+
+# Bump when the compiled columns change, so old catalogs get a new version instead of being misread
+CATALOG_FORMAT = 1
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+
+# Keywords indicating non-natural diamonds (matched in name and details)
+EXCLUSION_KEYWORDS = [
+    'lab grown', 'lab-created', 'lab created',
+    'simulated', 'artificial', 'moissanite', 'man made', 'synthetic'
+]
+# Products cheaper than this aren't compared
+MIN_PRICE = 1000
+
+# Kay has no weight field; Glamira says "≈ 3.10 Grams", GemGem "6.79g"
+WEIGHT_KEYS = [("Specifications", "Item Weight"), ("Average Weight",), ("Product Details", "Weight")]
+_GRAMS_RE = re.compile(r"(\d+(?:\.\d+)?)\s*g", re.IGNORECASE)
+
+
+class Catalog:
+    """A compiled catalog version: typed competitor and GemGem frames plus its manifest."""
+
+    def __init__(self, path, manifest, competitors: pd.DataFrame, gemgem: pd.DataFrame):
+        self.path = Path(path)
+        self.manifest = manifest
+        self.competitors = competitors
+        self.gemgem = gemgem
+
+    @property
+    def version(self) -> str:
+        return self.manifest["version"]
+
+
+# --- Parsing ---
+
+def parse_details(details_str):
+    """
+    The scraped `details` column as a dict ({} if it isn't one).
+    The scrapers write JSON; older exports are Python dict reprs, hence the literal_eval fallback.
+    """
+    if isinstance(details_str, dict):
+        return details_str
+    if not isinstance(details_str, str):
+        return {}
+    try:
+        details = json.loads(details_str)
+    except json.JSONDecodeError:
+        try:
+            details = ast.literal_eval(details_str)
+        except (ValueError, SyntaxError):
+            return {}
+    return details if isinstance(details, dict) else {}
+
+
+def details_to_text(details_dict):
+    return ', '.join([f"{k}: {v}" for k, v in details_dict.items()])
+
+
+def clean_prices(values: pd.Series) -> pd.Series:
+    """
+    Price column as float64, NaN where there is no number.
+    Removes currency symbols, words, commas ('$1,078.00' -> 1078.0) in one vectorised pass.
+    """
+    if values.dtype != object:
+        return pd.to_numeric(values, errors="coerce").astype("float64")
+    text = values.where(values.isna(), values.astype(str)).str.replace(r"[^\d.]", "", regex=True)
+    return pd.to_numeric(text, errors="coerce").astype("float64")
+
+
+def _item_weight_grams(details: dict):
+    for path in WEIGHT_KEYS:
+        value = details
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        match = _GRAMS_RE.search(value) if isinstance(value, str) else None
+        if match:
+            return float(match.group(1))
+    return np.nan
+
+
+def stone_origin(name: pd.Series, details: pd.Series) -> pd.Series:
+    """'lab' when the name or details mention a non-natural stone (EXCLUSION_KEYWORDS), else 'natural'."""
+    pattern = '|'.join(EXCLUSION_KEYWORDS)
+    lab = (name.astype(str).str.lower().str.contains(pattern, na=False) |
+           details.astype(str).str.lower().str.contains(pattern, na=False))
+    return pd.Series(np.where(lab, "lab", "natural"), index=name.index)
+
+
+def compile_frame(df: pd.DataFrame, source: str) -> pd.DataFrame:
+    """
+    Normalise one raw scrape (name, price, url/listing_id, details) into typed columns:
+    price, attr_* (category, stone, metal, karat, carat), item_weight_g,
+    stone_origin, source and embedding_text. Every row is kept; serving_rows filters.
+    """
+    df = df.reset_index(drop=True).copy()
+    df['source'] = source
+    df['name'] = df['name'].astype(str)
+    df['details'] = df['details'].astype(str)
+    df['price'] = clean_prices(df['price'])
+    df['parsed_details'] = df['details'].map(parse_details)
+    df['embedding_text'] = df['parsed_details'].map(details_to_text)
+    df['item_weight_g'] = df['parsed_details'].map(_item_weight_grams).astype('float64')
+    df['stone_origin'] = stone_origin(df['name'], df['details'])
+    df = add_attribute_columns(df)
+    for column in ("attr_karat", "attr_carat"):
+        df[column] = pd.to_numeric(df[column], errors="coerce").astype("float64")
+    if 'listing_id' in df.columns:
+        # GemGem listings also get the typed pricing inputs (metal / diamond weight)
+        df['listing_id'] = df['listing_id'].astype(str)
+        df = add_weight_columns(df)
+    return df
+
+
+def serving_mask(df: pd.DataFrame) -> pd.Series:
+    """Rows the app compares: natural stones priced at MIN_PRICE or more."""
+    return (df['price'] >= MIN_PRICE) & (df['stone_origin'] == "natural")
+
+
+def serving_rows(df: pd.DataFrame) -> pd.DataFrame:
+    return df[serving_mask(df)].reset_index(drop=True)
+
+
+def source_of(path) -> str:
+    """'data/poc_kay.csv' -> 'kay'."""
+    return Path(path).stem.replace("poc_", "")
+
+
+def fingerprint(data_files) -> str:
+    """Identifies the raw data, so HTTP validators survive restarts and agree across workers."""
+    return hashlib.sha1(b"".join(open(path, "rb").read() for path in data_files)).hexdigest()[:16]
+
+
+def compile_sources(data_files=DATA_FILES):
+    """
+    Read and compile the raw CSVs (competitor files first, GemGem last).
+    Returns (competitors, gemgem, manifest fields) with every row kept.
+    """
+    *competitor_files, gemgem_file = data_files
+    competitors = pd.concat(
+        [compile_frame(pd.read_csv(path), source_of(path)) for path in competitor_files], ignore_index=True
+    )
+    gemgem = compile_frame(pd.read_csv(gemgem_file), source_of(gemgem_file))
+    fields = {
+        "data_fingerprint": fingerprint(data_files),
+        "data_modified_at": max(os.path.getmtime(path) for path in data_files),
+        "sources": [str(path) for path in data_files],
+    }
+    return competitors, gemgem, fields
+
+
+# --- Versioned catalog on disk ---
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise ImportError("pyarrow is required for the compiled catalog (pip install pyarrow)")
+
+
+def current_version(root):
+    """Version name in root/CURRENT, or None if nothing has been compiled."""
+    pointer = Path(root) / CURRENT if root else None
+    if pointer is None or not pointer.is_file():
+        return None
+    return pointer.read_text().strip() or None
+
+
+def exists(root) -> bool:
+    version = current_version(root)
+    return version is not None and (Path(root) / version / MANIFEST).is_file()
+
+
+def _write_frame(df: pd.DataFrame, path: Path):
+    # Dicts don't go into Parquet; `details` keeps the raw text
+    df = df.drop(columns=["parsed_details"], errors="ignore")
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].map(lambda v: v if v is None or isinstance(v, str) else str(v))
+    df.to_parquet(path, engine="pyarrow", index=False)
+
+
+def compile_catalog(root=None, data_files=DATA_FILES, force: bool = False) -> Path:
+    """
+    Compile the raw CSVs into root/<version>/ (competitors.parquet, gemgem.parquet,
+    manifest.json) and point root/CURRENT at it. The version is derived from
+    CATALOG_FORMAT and the source bytes, so re-running on unchanged data is a no-op.
+    Older versions are left in place for rollback.
+    """
+    _require_pyarrow()
+    root = Path(root or CATALOG_PATH or "cache/catalog")
+    data_fingerprint = fingerprint(data_files)
+    version = f"v{CATALOG_FORMAT}-{data_fingerprint}"
+    target = root / version
+
+    if force or not (target / MANIFEST).is_file():
+        started = time.perf_counter()
+        competitors, gemgem, fields = compile_sources(data_files)
+        tmp = root / f"tmp-{version}-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        _write_frame(competitors, tmp / "competitors.parquet")
+        _write_frame(gemgem, tmp / "gemgem.parquet")
+        manifest = {
+            "format": CATALOG_FORMAT,
+            "version": version,
+            "built_at": time.time(),
+            "compile_seconds": round(time.perf_counter() - started, 3),
+            "rows": {source: int(n) for source, n in
+                     pd.concat([competitors['source'], gemgem['source']]).value_counts(sort=False).items()},
+            "columns": {
+                "competitors": {c: str(t) for c, t in competitors.drop(columns="parsed_details").dtypes.items()},
+                "gemgem": {c: str(t) for c, t in gemgem.drop(columns="parsed_details").dtypes.items()},
+            },
+            **fields,
+        }
+        (tmp / MANIFEST).write_text(json.dumps(manifest, indent=2))
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp, target)
+
+    # Readers only ever see a complete version: the pointer moves last, atomically
+    pointer_tmp = root / f"{CURRENT}.tmp-{os.getpid()}"
+    pointer_tmp.write_text(version)
+    os.replace(pointer_tmp, root / CURRENT)
+    return target
+
+
+def load_catalog(root=None, version: str = None) -> Catalog:
+    """Open a compiled catalog version (default: the CURRENT one); no row is re-parsed."""
+    _require_pyarrow()
+    root = Path(root or CATALOG_PATH or "cache/catalog")
+    version = version or current_version(root)
+    if version is None:
+        raise FileNotFoundError(f"No compiled catalog in {root} (build one with: python working/catalog.py)")
+    path = root / version
+    manifest = json.loads((path / MANIFEST).read_text())
+    if manifest.get("format") != CATALOG_FORMAT:
+        raise ValueError(f"Unsupported catalog format {manifest.get('format')} in {path}")
+    return Catalog(
+        path,
+        manifest,
+        competitors=pd.read_parquet(path / "competitors.parquet", engine="pyarrow"),
+        gemgem=pd.read_parquet(path / "gemgem.parquet", engine="pyarrow"),
+    )
+
+
+def is_stale(catalog: Catalog) -> bool:
+    """True when a source CSV changed after the catalog was compiled (cheap mtime check)."""
+    return any(
+        os.path.exists(path) and os.path.getmtime(path) > catalog.manifest["data_modified_at"]
+        for path in catalog.manifest.get("sources", [])
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile the poc_*.csv scrapes into a versioned Parquet catalog")
+    parser.add_argument("--output", default=CATALOG_PATH or "cache/catalog", help="Catalog root directory")
+    parser.add_argument("--force", action="store_true", help="Recompile even if this version already exists")
+    parser.add_argument("data_files", nargs="*", default=DATA_FILES,
+                        help="Competitor CSVs followed by the GemGem CSV")
+    args = parser.parse_args()
+
+    out = compile_catalog(args.output, args.data_files, force=args.force)
+    manifest = json.loads((out / MANIFEST).read_text())
+    print(f"✅ Catalog {manifest['version']} written to {out} {manifest['rows']} "
+          f"in {manifest['compile_seconds']}s")
@@ -0,0 +1,108 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Bump when the chart layout changes so clients drop charts cached under old ETags
+CHART_VERSION = "1"
+# Size bounds for the in-memory PNG cache
+CHART_CACHE_ENTRIES = int(os.getenv("CHART_CACHE_ENTRIES", "1024"))
+CHART_CACHE_MB = float(os.getenv("CHART_CACHE_MB", "64"))
+
+
+def render_pricing_chart(retail_price: float, gemgem_price: float, competitor_price: float) -> bytes:
+    """
+    Render the pricing comparison chart to PNG bytes.
+    Uses a standalone Figure + Agg canvas (no pyplot global state), so it is
+    safe to call from several threads or from a worker process.
+    """
+    competitor_savings = competitor_price - gemgem_price
+    competitor_savings_percent = (competitor_savings / competitor_price) * 100 if competitor_price else 0
+    retail_savings = retail_price - gemgem_price
+    retail_savings_percent = (retail_savings / retail_price) * 100 if retail_price else 0
+
+    labels = ["Retail Price", "GEMGEM Price", "Other Platforms"]
+    values = [retail_price, gemgem_price, competitor_price]
+    colors = ["#d4a5a5", "#3cb371", "#d4a5a5"]
+
+    fig = Figure(figsize=(6, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    bars = ax.bar(labels, values, color=colors)
+    ax.set_ylabel("Price (USD)")
+    ax.set_title("Smart Pricing Comparison & Savings")
+
+    # Annotate prices on top of bars
+    for bar, val in zip(bars, values):
+        ax.text(bar.get_x() + bar.get_width()/2, val, f"${val:,.2f}",
+                ha='center', va='bottom', fontsize=10, fontweight='bold')
+
+    # Add savings info as a note below chart
+    savings_text = (
+        f"Savings vs Competitors: ${competitor_savings:,.2f} ({competitor_savings_percent:.1f}%)\n"
+        f"Savings vs Retail: ${retail_savings:,.2f} ({retail_savings_percent:.1f}%)"
+    )
+    fig.text(0.5, -0.15, savings_text, ha='center', fontsize=9)
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    return buf.getvalue()
+
+
+def chart_key(listing_id: str, retail_price: float, gemgem_price: float, competitor_price: float) -> tuple:
+    # Cents are all the chart shows, so rounding keeps float noise from missing the cache
+    return (listing_id, round(float(retail_price), 2), round(float(gemgem_price), 2), round(float(competitor_price), 2))
+
+
+def chart_etag(key: tuple) -> str:
+    """Strong ETag derived from the chart inputs, so it is known before rendering."""
+    digest = hashlib.sha1(repr((CHART_VERSION,) + key).encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+class ChartCache:
+    """Thread-safe LRU cache of rendered PNGs, bounded by entry count and total bytes."""
+
+    def __init__(self, max_entries: int = CHART_CACHE_ENTRIES, max_bytes: int = int(CHART_CACHE_MB * 1024 * 1024)):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            png = self._items.get(key)
+            if png is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return png
+
+    def put(self, key, png: bytes):
+        if len(png) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._items[key] = png
+            self._bytes += len(png)
+            while len(self._items) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
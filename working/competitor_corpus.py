@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from attribute_index import AttributeIndex
+from vector_index import IVF_MIN_ROWS, BruteForceIndex, make_index
+
+# Compact once this fraction of the corpus is tombstoned rows
+CORPUS_COMPACT_RATIO = float(os.getenv("CORPUS_COMPACT_RATIO", "0.2"))
+
+# Columns that decide whether a re-scraped row actually changed
+CONTENT_COLUMNS = ["name", "price", "embedding_text"]
+
+
+class CorpusSnapshot:
+    """
+    One consistent view of the corpus: row i of `df` is row i of `index` and
+    of the `attributes` blocking index.
+    Rows that were deleted or replaced stay in `df` until the next compaction
+    but are tombstoned in the index, so searches never return them.
+    """
+
+    def __init__(self, df: pd.DataFrame, index, version: int, attributes: AttributeIndex = None):
+        self.df = df
+        self.index = index
+        self.version = version
+        self.attributes = attributes if attributes is not None else AttributeIndex.from_frame(df)
+        self.created_at = time.time()  # when this snapshot was published
+        self._live_df = None
+
+    def __len__(self):
+        return len(self.index) - self.index.n_dead
+
+    def live_df(self) -> pd.DataFrame:
+        if self._live_df is None:
+            alive = self.index.alive
+            self._live_df = self.df if alive is None else self.df[alive]
+        return self._live_df
+
+
+def _same_value(a, b) -> bool:
+    if pd.isna(a) and pd.isna(b):
+        return True
+    return a == b
+
+
+class CompetitorCorpus:
+    """
+    Competitor rows plus their vector index, updatable in place by URL.
+
+    Readers take `corpus.snapshot` once per request. Writers build the next
+    snapshot under a lock and publish it with a single assignment, so searches
+    never wait for an update and never see half of one. An upsert appends or
+    tombstones only the rows it touches; tombstones are compacted away once
+    they exceed `compact_ratio` of the corpus. A corpus that started below
+    IVF_MIN_ROWS (exact-search fallback) is rebuilt through `index_factory` at
+    the first compaction after it grows past the threshold.
+    """
+
+    def __init__(self, df: pd.DataFrame, embeddings, index_factory=make_index,
+                 compact_ratio: float = CORPUS_COMPACT_RATIO):
+        df = df.reset_index(drop=True)
+        self.index_factory = index_factory
+        self.compact_ratio = compact_ratio
+        self._lock = threading.Lock()
+        self._url_rows = {url: i for i, url in enumerate(df["url"])}
+        self.snapshot = CorpusSnapshot(df, index_factory(embeddings), 0, AttributeIndex.from_frame(df))
+
+    @property
+    def version(self) -> int:
+        return self.snapshot.version
+
+    def __len__(self):
+        return len(self.snapshot)
+
+    def upsert(self, rows: pd.DataFrame, embeddings) -> dict:
+        """
+        Insert new rows and replace changed ones, keyed by `url`.
+        `embeddings` is aligned with `rows`; rows whose content is unchanged are skipped.
+        A URL repeated within `rows` counts once, with its last row.
+        """
+        rows = rows.reset_index(drop=True)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        last = ~rows["url"].duplicated(keep="last").to_numpy()
+        if not last.all():
+            rows, embeddings = rows[last].reset_index(drop=True), embeddings[last]
+        with self._lock:
+            snap = self.snapshot
+            changed, stale = [], []
+            for i, row in enumerate(rows.itertuples(index=False)):
+                existing = self._url_rows.get(row.url)
+                if existing is not None:
+                    old = snap.df.iloc[existing]
+                    if all(_same_value(old[c], getattr(row, c)) for c in CONTENT_COLUMNS if c in rows.columns):
+                        continue
+                    stale.append(existing)
+                changed.append(i)
+
+            if not changed:
+                return {"added": 0, "updated": 0, "unchanged": len(rows)}
+
+            index = snap.index
+            if stale:
+                index = index.with_removed(stale)
+            first_id = len(index)
+            index = index.with_added(embeddings[changed])
+            new_rows = rows.iloc[changed]
+            df = pd.concat([snap.df, new_rows], ignore_index=True) if len(snap.df) else new_rows.reset_index(drop=True)
+            for offset, url in enumerate(new_rows["url"]):
+                self._url_rows[url] = first_id + offset
+
+            self._publish(df, index, snap.attributes.with_added(new_rows, first_id))
+            return {"added": len(changed) - len(stale), "updated": len(stale), "unchanged": len(rows) - len(changed)}
+
+    def delete(self, urls) -> int:
+        """Tombstone the rows with these URLs; returns how many were removed."""
+        with self._lock:
+            ids = [self._url_rows.pop(url) for url in urls if url in self._url_rows]
+            if ids:
+                snap = self.snapshot
+                self._publish(snap.df, snap.index.with_removed(ids), snap.attributes)
+            return len(ids)
+
+    def compact(self):
+        """Physically drop tombstoned rows from the frame and the index."""
+        with self._lock:
+            snap = self.snapshot
+            self._publish(snap.df, snap.index, snap.attributes, force_compact=True)
+
+    def _publish(self, df, index, attributes, force_compact=False):
+        if force_compact or index.n_dead > self.compact_ratio * len(index):
+            if index.n_dead:
+                index, kept = index.compacted()
+                df = df.iloc[kept].reset_index(drop=True)
+                self._url_rows = {url: i for i, url in enumerate(df["url"])}
+                attributes = AttributeIndex.from_frame(df)  # row ids changed
+            if isinstance(index, BruteForceIndex) and len(index) >= IVF_MIN_ROWS:
+                # Grown past the exact-search fallback: let the factory pick the backend again
+                index = self.index_factory(index.codes, encoded=True, scales=index.scales)
+        self.snapshot = CorpusSnapshot(df, index, self.snapshot.version + 1, attributes)
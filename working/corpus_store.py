@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from vector_index import encode_vectors
+
+try:
+    import pyarrow.feather as feather
+except ImportError:  # only needed to build / open a corpus store
+    feather = None
+
+# Prebuilt corpus directory; when it exists the engine opens it instead of reading the CSVs
+CORPUS_STORE_PATH = os.getenv("CORPUS_STORE_PATH", "")
+
+CORPUS_STORE_FORMAT = 1
+MANIFEST = "manifest.json"
+CURRENT = "CURRENT"
+# Store versions kept on disk: the current one and the one before it, for workers still opening it
+KEEP_VERSIONS = 2
+
+# Python objects (dicts) can't go into Arrow; what pricing and blocking need from them is already in typed columns
+SKIP_COLUMNS = ["parsed_details"]
+
+
+class CorpusStore:
+    """
+    A corpus opened from disk.
+
+    The embedding matrices are np.memmap views (mmap_mode="r") and the Arrow
+    files are memory-mapped too, so every uvicorn worker that opens the same
+    directory reads the same pages from the OS page cache instead of holding
+    its own copy. Only the pandas string columns are per-process objects.
+    """
+
+    def __init__(self, path, manifest, competitor_df, competitor_codes, competitor_scales,
+                 gemgem_df, gemgem_embeddings):
+        self.path = Path(path)
+        self.manifest = manifest
+        self.competitor_df = competitor_df
+        self.competitor_codes = competitor_codes
+        self.competitor_scales = competitor_scales
+        self.gemgem_df = gemgem_df
+        self.gemgem_embeddings = gemgem_embeddings
+
+    @property
+    def dtype(self) -> str:
+        return self.manifest["dtype"]
+
+
+def _require_pyarrow():
+    if feather is None:
+        raise ImportError("pyarrow is required for the corpus store (pip install pyarrow)")
+
+
+def current_version(path):
+    """Version name in path/CURRENT, or None if no store has been saved there."""
+    pointer = Path(path) / CURRENT if path else None
+    if pointer is None or not pointer.is_file():
+        return None
+    return pointer.read_text().strip() or None
+
+
+def _version_dir(path) -> Path:
+    """The directory holding the current store files (stores saved before versioning kept them in `path`)."""
+    version = current_version(path)
+    return Path(path) / version if version else Path(path)
+
+
+def exists(path) -> bool:
+    return bool(path) and (_version_dir(path) / MANIFEST).is_file()
+
+
+def _write_frame(df: pd.DataFrame, path: Path):
+    df = df.drop(columns=[c for c in SKIP_COLUMNS if c in df.columns]).reset_index(drop=True)
+    # Mixed-type object columns (e.g. raw scraped prices) are stored as text
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].map(lambda v: v if v is None or isinstance(v, str) else str(v))
+    # Uncompressed, so the file can be memory-mapped without decoding
+    feather.write_feather(df, path, compression="uncompressed")
+
+
+def _read_frame(path: Path) -> pd.DataFrame:
+    table = feather.read_table(path, memory_map=True)
+    # split_blocks lets numeric columns stay views of the mapped file
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def save_corpus_store(path, competitor_df: pd.DataFrame, competitor_index, gemgem_df: pd.DataFrame,
+                      gemgem_embeddings, dtype: str = None, **manifest_fields) -> Path:
+    """
+    Write the corpus as a new version under `path` (a directory) and point
+    path/CURRENT at it, the way catalog.py publishes catalogs: readers only
+    ever see a complete version. Competitor vectors are saved already encoded
+    (in `dtype`, default the index's own), so opening the store needs no
+    conversion; rows tombstoned in the index are left out. Returns the version directory.
+    """
+    _require_pyarrow()
+    path = Path(path)
+    if competitor_index.n_dead:
+        competitor_index, kept = competitor_index.compacted()
+        competitor_df = competitor_df.iloc[kept]
+    dtype = dtype or competitor_index.dtype
+    if dtype == competitor_index.dtype:
+        codes, scales = competitor_index.codes, competitor_index.scales
+    else:
+        codes, scales = encode_vectors(competitor_index.vectors, dtype)
+
+    version = f"v{CORPUS_STORE_FORMAT}-{int(time.time() * 1000)}-{os.getpid()}"
+    target = path / version
+    tmp = path / f"tmp-{version}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    np.save(tmp / "competitor_vectors.npy", np.ascontiguousarray(codes))
+    if scales is not None:
+        np.save(tmp / "competitor_scales.npy", np.ascontiguousarray(scales))
+    np.save(tmp / "gemgem_vectors.npy", np.ascontiguousarray(gemgem_embeddings, dtype=np.float32))
+    _write_frame(competitor_df, tmp / "competitors.arrow")
+    _write_frame(gemgem_df, tmp / "gemgem.arrow")
+
+    manifest = {
+        "format": CORPUS_STORE_FORMAT,
+        "version": version,
+        "built_at": time.time(),
+        "dtype": dtype,
+        "dim": int(codes.shape[1]),
+        "competitors": len(competitor_df),
+        "gemgem": len(gemgem_df),
+        **manifest_fields,
+    }
+    (tmp / MANIFEST).write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, target)
+
+    # The pointer moves last, atomically; workers that already mapped the old files keep reading them
+    pointer_tmp = path / f"{CURRENT}.tmp-{os.getpid()}"
+    pointer_tmp.write_text(version)
+    os.replace(pointer_tmp, path / CURRENT)
+    _prune(path, keep=KEEP_VERSIONS)
+    return target
+
+
+def _prune(path: Path, keep: int):
+    versions = sorted((p for p in path.glob(f"v{CORPUS_STORE_FORMAT}-*") if p.is_dir()),
+                      key=lambda p: p.stat().st_mtime)
+    current = current_version(path)
+    for old in versions[:max(0, len(versions) - keep)]:
+        if old.name != current:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def open_corpus_store(path) -> CorpusStore:
+    _require_pyarrow()
+    path = _version_dir(path)
+    manifest = json.loads((path / MANIFEST).read_text())
+    if manifest.get("format") != CORPUS_STORE_FORMAT:
+        raise ValueError(f"Unsupported corpus store format {manifest.get('format')} in {path}")
+    scales_path = path / "competitor_scales.npy"
+    return CorpusStore(
+        path,
+        manifest,
+        competitor_df=_read_frame(path / "competitors.arrow"),
+        competitor_codes=np.load(path / "competitor_vectors.npy", mmap_mode="r"),
+        competitor_scales=np.load(scales_path, mmap_mode="r") if scales_path.exists() else None,
+        gemgem_df=_read_frame(path / "gemgem.arrow"),
+        gemgem_embeddings=np.load(path / "gemgem_vectors.npy", mmap_mode="r"),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the memory-mapped corpus store from the poc_*.csv data")
+    parser.add_argument("--output", default=CORPUS_STORE_PATH or "cache/corpus")
+    parser.add_argument("--dtype", help="Embedding storage dtype (default: VECTOR_DTYPE)")
+    args = parser.parse_args()
+
+    from normalization import PricingEngine
+
+    # Always build from the CSVs, never from an existing store
+    engine = PricingEngine(store_path="").ensure_ready()
+    snap = engine.competitor_corpus.snapshot
+    out = save_corpus_store(
+        args.output, snap.df, snap.index, engine.gemgem_df, engine.gemgem_embeddings, dtype=args.dtype,
+        model=engine.model_name, data_fingerprint=engine.data_fingerprint,
+        data_modified_at=engine.data_modified_at, catalog_version=engine.catalog_version,
+    )
+    manifest = json.loads((out / MANIFEST).read_text())
+    print(f"✅ Corpus store written to {out} ({manifest['competitors']} competitors, {manifest['dtype']})")
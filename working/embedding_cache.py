@@ -0,0 +1,141 @@
+import hashlib
+import os
+import re
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from metrics import cache_access, stage
+
+# Where encoded vectors are persisted between runs (one sub-directory per model)
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "cache/embeddings")
+
+# Merge shard files back into one once there are more than this many
+MAX_SHARDS = 32
+
+
+def text_hash(text: str) -> bytes:
+    """SHA-1 digest of an embedding text, used as its content address."""
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed on-disk store of sentence embeddings.
+    Vectors are keyed by (model name, hash of the embedding text), so only
+    texts that are new or have changed ever reach model.encode().
+    New vectors are appended as small shard files, never rewriting old ones.
+    """
+
+    def __init__(self, model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR):
+        self.model_name = model_name
+        slug = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.dir = Path(cache_dir) / slug
+        self.hits = 0
+        self.misses = 0
+        self._rows = {}  # text hash -> row in self._vectors
+        self._vectors = None
+        self._shard_files = []  # shards whose vectors are in self._vectors
+        self._load()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _shards(self):
+        # Names start with a write timestamp, so sorting keeps shards in write order
+        return sorted(self.dir.glob("shard-*.npz"))
+
+    def _load(self):
+        keys, blocks, vanished = [], [], False
+        for shard in self._shards():
+            try:
+                with np.load(shard, allow_pickle=False) as data:
+                    if str(data["model"]) != self.model_name:
+                        continue
+                    keys.extend(bytes(k) for k in data["keys"])
+                    blocks.append(data["vectors"].astype(np.float32, copy=False))
+                self._shard_files.append(shard)
+            except FileNotFoundError:
+                vanished = True  # merged away by another process's compact()
+            except Exception as e:
+                print(f"⚠️ Skipping unreadable embedding shard {shard}: {e}")
+
+        if vanished:
+            # Its vectors now live in a newer merged shard: list the directory again
+            self._shard_files = []
+            return self._load()
+        if blocks:
+            self._vectors = np.concatenate(blocks)
+            # Later shards win if the same key was ever written twice
+            self._rows = {k: i for i, k in enumerate(keys)}
+
+    def _write_shard(self, keys, vectors) -> Path:
+        self.dir.mkdir(parents=True, exist_ok=True)
+        # Unique per writer, so processes sharing the directory never pick the same name
+        path = self.dir / f"shard-{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}.npz"
+        tmp = self.dir / f"tmp-{path.name}"
+        np.savez(tmp, model=np.array(self.model_name), keys=np.array(keys, dtype="S20"), vectors=vectors)
+        os.replace(tmp, path)  # atomic, so concurrent readers never see half a shard
+        return path
+
+    def compact(self):
+        """
+        Rewrite the shards this cache holds in memory as a single file.
+        Shards other processes wrote since we loaded are left alone.
+        """
+        shards = self._shard_files
+        if len(shards) <= 1 or self._vectors is None:
+            return
+        items = sorted(self._rows.items(), key=lambda kv: kv[1])
+        keys = [k for k, _ in items]
+        vectors = self._vectors[[i for _, i in items]]
+        merged = self._write_shard(keys, vectors)
+        for shard in shards:
+            shard.unlink(missing_ok=True)
+        self._shard_files = [merged]
+        self._vectors = vectors
+        self._rows = {k: i for i, k in enumerate(keys)}
+
+    def encode(self, model, texts) -> np.ndarray:
+        """
+        Return a float32 matrix with one embedding per text, encoding only the
+        texts that are not already in the cache.
+        """
+        keys = [text_hash(t) for t in texts]
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self._rows and key not in missing:
+                missing[key] = text
+        self.misses += len(missing)
+        self.hits += len(keys) - len(missing)
+        cache_access("embeddings", hit=True, count=len(keys) - len(missing))
+        cache_access("embeddings", hit=False, count=len(missing))
+
+        if missing:
+            with stage("model_encode"):
+                new_vectors = model.encode(list(missing.values()), convert_to_numpy=True, show_progress_bar=False)
+            new_vectors = np.asarray(new_vectors, dtype=np.float32)
+            start = 0 if self._vectors is None else len(self._vectors)
+            self._vectors = new_vectors if self._vectors is None else np.concatenate([self._vectors, new_vectors])
+            for offset, key in enumerate(missing):
+                self._rows[key] = start + offset
+            try:
+                self._shard_files.append(self._write_shard(list(missing), new_vectors))
+                if len(self._shards()) > MAX_SHARDS:
+                    self.compact()
+            except OSError as e:
+                print(f"⚠️ Could not persist embeddings to {self.dir}: {e}")
+
+        if not keys:
+            dim = model.get_sentence_embedding_dimension() if self._vectors is None else self._vectors.shape[1]
+            return np.zeros((0, dim), dtype=np.float32)
+        return self._vectors[[self._rows[k] for k in keys]]
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = (self.hits / total * 100) if total else 0.0
+        return (f"🧠 Embedding cache [{self.model_name}]: {self.hits} hits, {self.misses} misses "
+                f"({hit_rate:.1f}% hit rate, {len(self)} vectors on disk)")
@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from metrics import stage
+
+# How long a fetched price is served before a background refresh is started
+GOLD_PRICE_TTL_SEC = float(os.getenv("GOLD_PRICE_TTL_SEC", "300"))
+# Hard limit on each call to the price API
+GOLD_PRICE_TIMEOUT_SEC = float(os.getenv("GOLD_PRICE_TIMEOUT_SEC", "5"))
+# After a failed fetch, wait this long before trying again
+GOLD_PRICE_RETRY_SEC = float(os.getenv("GOLD_PRICE_RETRY_SEC", "30"))
+
+FALLBACK_GOLD_PRICE_PER_GRAM = 80.0  # 18K, used until the first successful fetch
+TROY_OUNCE_GRAMS = 31.1035
+PURITY_18K = 0.75
+
+
+class MetalPriceApiSource:
+    """
+    Reads the USD price of one troy ounce of gold from metalpriceapi,
+    or from anything that answers the same JSON shape (e.g. a local stub server).
+    """
+
+    def __init__(self, url: str, session: requests.Session = None):
+        self.url = url
+        self.session = session or requests.Session()
+
+    def fetch_usd_per_ounce(self, timeout: float) -> float:
+        with stage("gold_api"):
+            response = self.session.get(self.url, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+            return float(data['rates']['USDXAU'])
+
+
+class GoldPriceProvider:
+    """
+    TTL cache around a gold price source with stale-while-revalidate.
+
+    get() never waits on the network once a price is known: when the cached
+    value is older than `ttl`, one background refresh is started and the last
+    good value keeps being served until it lands. Only the very first call
+    blocks, and for at most `timeout` seconds.
+    """
+
+    def __init__(self, source, ttl: float = GOLD_PRICE_TTL_SEC, timeout: float = GOLD_PRICE_TIMEOUT_SEC,
+                 retry_after: float = GOLD_PRICE_RETRY_SEC, fallback: float = FALLBACK_GOLD_PRICE_PER_GRAM):
+        self.source = source
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.fallback = fallback
+        self._lock = threading.Lock()
+        self._value = None
+        self._fetched_at = None        # wall clock, for reporting
+        self._fetched_monotonic = None  # for TTL checks
+        self._next_attempt = 0.0
+        self._refreshing = False
+        self.last_error = None
+        self.fetch_count = 0
+
+    @property
+    def last_success_at(self):
+        """Unix timestamp of the last successful fetch, or None."""
+        return self._fetched_at
+
+    def is_stale(self) -> bool:
+        return self._value is None or time.monotonic() - self._fetched_monotonic >= self.ttl
+
+    def get(self) -> float:
+        """18K gold price in USD per gram."""
+        if self._value is None and self.fetch_count == 0:
+            # Cold start: nothing to serve yet, so fetch inline (bounded by the timeout)
+            with self._lock:
+                if self._value is None and self.fetch_count == 0:
+                    self.refresh()
+        elif self.is_stale():
+            self._refresh_in_background()
+        return self._value if self._value is not None else self.fallback
+
+    def refresh(self) -> bool:
+        """Fetch synchronously; keeps the previous value if the fetch fails."""
+        self.fetch_count += 1
+        try:
+            usd_per_ounce = self.source.fetch_usd_per_ounce(self.timeout)
+            self._value = usd_per_ounce / TROY_OUNCE_GRAMS * PURITY_18K
+            self._fetched_at = time.time()
+            self._fetched_monotonic = time.monotonic()
+            self.last_error = None
+            return True
+        except Exception as e:
+            print("❌ Error fetching gold price:", e)
+            self.last_error = str(e)
+            self._next_attempt = time.monotonic() + self.retry_after
+            return False
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing or time.monotonic() < self._next_attempt:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="gold-price-refresh", daemon=True).start()
+
+    def status(self) -> dict:
+        fetched_at = self._fetched_at
+        return {
+            "gold_price_per_gram": round(self._value if self._value is not None else self.fallback, 2),
+            "is_fallback": self._value is None,
+            "last_success_at": (datetime.fromtimestamp(fetched_at, tz=timezone.utc).isoformat()
+                                if fetched_at else None),
+            "age_seconds": round(time.time() - fetched_at, 1) if fetched_at else None,
+            "stale": self.is_stale(),
+            "refreshing": self._refreshing,
+            "last_error": self.last_error,
+            "ttl_seconds": self.ttl,
+        }
+
+
+def serve_stub(port: int, usd_per_ounce: float, delay: float = 0.0):
+    """Local stand-in for metalpriceapi: GET anything -> {"rates": {"USDXAU": ...}}."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = json.dumps({"success": True, "base": "USD", "rates": {"USDXAU": usd_per_ounce}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"🪙 Stub gold price API on http://127.0.0.1:{port}/ (USDXAU={usd_per_ounce}, delay={delay}s)")
+    print(f"   Point the app at it with METAL_PRICE_URL=http://127.0.0.1:{port}/")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stub of the metalpriceapi endpoint")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--usd-per-ounce", type=float, default=2400.0)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds to sleep before answering")
+    args = parser.parse_args()
+    serve_stub(args.port, args.usd_per_ounce, args.delay)
@@ -0,0 +1,89 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from attribute_index import ATTRIBUTE_COLUMNS
+from metrics import cache_access, stage
+from price_calculator import WEIGHT_COLUMNS, add_weight_columns, calculate_retail_prices
+
+
+class Listing:
+    """Precomputed attributes of one GemGem listing."""
+
+    __slots__ = ("listing_id", "position", "name", "price", "details", "parsed_details",
+                 "embedding_text", "metal_weight", "diamond_weight", "diamond_source", "embedding", "attributes")
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__ if name not in ("embedding", "attributes")}
+
+
+class ListingStore:
+    """
+    In-memory GemGem catalog with an O(1) listing_id -> row index.
+
+    One instance (normalization.listing_store) is shared by the API, the UI,
+    similarity search and pricing, so a request resolves its listing once
+    instead of scanning the listing_id column in every module.
+    """
+
+    def __init__(self, df: pd.DataFrame, embeddings=None):
+        df = df.reset_index(drop=True)
+        if not set(WEIGHT_COLUMNS).issubset(df.columns):
+            df = add_weight_columns(df)
+        self.df = df
+        self.embeddings = embeddings
+        # First occurrence wins, matching the old `.values[0]` lookups
+        self._positions = {}
+        for pos, listing_id in enumerate(df["listing_id"].values):
+            self._positions.setdefault(listing_id, pos)
+        self._columns = {c: df[c].to_numpy() for c in df.columns}
+        self._retail_lock = threading.Lock()
+        self._retail = None  # (pricing inputs, breakdown columns) for the whole catalog
+
+    def __len__(self):
+        return len(self.df)
+
+    def __contains__(self, listing_id):
+        return listing_id in self._positions
+
+    def position(self, listing_id):
+        """Row position of a listing (also its row in `embeddings`), or None."""
+        return self._positions.get(listing_id)
+
+    def get(self, listing_id):
+        pos = self._positions.get(listing_id)
+        if pos is None:
+            return None
+        fields = {c: values[pos] for c, values in self._columns.items() if c in Listing.__slots__}
+        fields["position"] = pos
+        fields["attributes"] = {c: self._columns[c][pos] for c in ATTRIBUTE_COLUMNS if c in self._columns}
+        if self.embeddings is not None:
+            fields["embedding"] = self.embeddings[pos]
+        return Listing(**fields)
+
+    def retail_breakdown(self, listing_id, gold_price_per_gram: float, making_charge_per_g=20, markup_pct=50) -> dict:
+        """
+        calculate_retail_price for one listing as a row read.
+        The whole catalog is priced in one vectorised pass per distinct gold
+        price / pricing inputs, so gold moves cost milliseconds, not per-request work.
+        """
+        pos = self._positions.get(listing_id)
+        if pos is None:
+            return {}
+        key = (gold_price_per_gram, making_charge_per_g, markup_pct)
+        cached = self._retail
+        cache_access("retail_prices", hit=cached is not None and cached[0] == key)
+        if cached is None or cached[0] != key:
+            with self._retail_lock:
+                cached = self._retail
+                if cached is None or cached[0] != key:
+                    with stage("retail_calc"):
+                        prices = calculate_retail_prices(self.df, gold_price_per_gram, making_charge_per_g, markup_pct)
+                    cached = (key, {c: prices[c].to_numpy() for c in prices.columns})
+                    self._retail = cached
+        return {c: (v[pos].item() if isinstance(v[pos], np.generic) else v[pos]) for c, v in cached[1].items()}
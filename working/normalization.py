@@ -1,35 +1,37 @@
 import pandas as pd
-import json
-from sentence_transformers import SentenceTransformer, util
 import numpy as np
+import os
 import re
 from price_calculator import calculate_retail_price
 import time
+from embedding_cache import EmbeddingCache
+from competitor_corpus import CompetitorCorpus
+from listing_store import ListingStore
+from metrics import stage
+from profiling import traced
+import corpus_store
+import catalog
+from catalog import (DATA_FILES, EXCLUSION_KEYWORDS, MIN_PRICE, clean_prices, compile_frame,
+                     parse_details, serving_mask, serving_rows)
+from functools import partial
+from vector_index import make_index
+from attribute_index import (ATTRIBUTE_COLUMNS, BLOCKING_LEVEL, BLOCKING_MIN_CANDIDATES,
+                             add_attribute_columns)
+import threading
+from contextlib import contextmanager
 
-# Load model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Print every competitor's similarity score per query (O(N), debugging only)
+DEBUG_SIMILARITY = os.getenv("DEBUG_SIMILARITY", "0") == "1"
 
-def clean_price(value):
-    """
-    Clean and convert price string to float.
-    Removes currency symbols, words, commas.
-    """
-    if pd.isna(value):
-        return None
-    if isinstance(value, str):
-        # Remove $, commas, words like 'rupees', 'Rs', etc.
-        value = re.sub(r'[^\d.]', '', value)  # Keep only digits and dot
-    try:
-        return float(value)
-    except ValueError:
-        return None
+# Sentence embedding model (loaded by the engine, not at import)
+MODEL_NAME = 'all-MiniLM-L6-v2'
 
 def preprocess_df(df: pd.DataFrame) -> pd.DataFrame:
     # Clean and convert price column
-    df['price'] = df['price'].apply(clean_price).astype('float64')
-    
+    df['price'] = clean_prices(df['price'])
+
     # Remove products with price < 1000
-    df = df[df['price'] >= 1000]
+    df = df[df['price'] >= MIN_PRICE]
 
     # Lowercase name and details for filtering
     df['name'] = df['name'].astype(str)
@@ -38,11 +40,7 @@ def preprocess_df(df: pd.DataFrame) -> pd.DataFrame:
     details_lower = df['details'].str.lower()
 
     # Keywords indicating non-natural diamonds
-    exclusion_keywords = [
-        'lab grown', 'lab-created', 'lab created',
-        'simulated', 'artificial', 'moissanite', 'man made', 'synthetic'
-    ]
-    pattern = '|'.join(exclusion_keywords)
+    pattern = '|'.join(EXCLUSION_KEYWORDS)
 
     # Filter out non-natural diamond products
     mask = ~(
@@ -53,76 +51,329 @@ def preprocess_df(df: pd.DataFrame) -> pd.DataFrame:
 
     return df
 
-# Load datasets
-kay_df = preprocess_df(pd.read_csv("data/poc_kay.csv"))
-glamira_df = preprocess_df(pd.read_csv("data/poc_glamira.csv"))
-gemgem_df = preprocess_df(pd.read_csv("data/poc_gemgem.csv"))
+# --- Engine: lazily loaded model, catalogs and embeddings ---
 
 
-# Clean price columns
-kay_df['price'] = pd.to_numeric(kay_df['price'], errors='coerce')
-glamira_df['price'] = pd.to_numeric(glamira_df['price'], errors='coerce')
-gemgem_df['price'] = pd.to_numeric(gemgem_df['price'], errors='coerce')
+class PricingEngine:
+    """
+    The heavy state behind similarity search: the model, the three catalogs,
+    their embeddings, the competitor corpus and the listing store.
 
-# Combine competitors
-competitor_df = pd.concat([kay_df, glamira_df], ignore_index=True)
+    Nothing is loaded at import time. The first ensure_ready() loads it all
+    once; start_warmup() does that on a background thread so a server can
+    bind its port and answer health checks meanwhile. status() reports how
+    long each startup phase took.
 
-# --- Parsing and embedding preparation ---
+    If `store_path` holds a prebuilt corpus store (see corpus_store.py), it is
+    memory-mapped instead: no CSV parsing, no encoding, and the model is only
+    loaded once something actually needs to encode (an upsert).
 
-def parse_details(details_str):
-    try:
-        return json.loads(details_str.replace("'", '"'))
-    except (json.JSONDecodeError, TypeError):
-        return {}
+    Otherwise the typed rows come from the compiled Parquet catalog in
+    `catalog_path` (see catalog.py) when there is one, and only then from
+    the raw CSVs, compiled in memory with the same code.
+    """
 
-def details_to_text(details_dict):
-    return ', '.join([f"{k}: {v}" for k, v in details_dict.items()])
+    PHASES = ["imports", "csv_load", "catalog_load", "store_open", "model_load", "encode", "index"]
 
-# Prepare competitor embeddings
-competitor_df['parsed_details'] = competitor_df['details'].apply(parse_details)
-competitor_df['embedding_text'] = competitor_df['parsed_details'].apply(details_to_text)
-competitor_embeddings = model.encode(competitor_df['embedding_text'].tolist(), convert_to_tensor=True)
+    def __init__(self, model_name: str = MODEL_NAME, data_files=DATA_FILES,
+                 store_path: str = corpus_store.CORPUS_STORE_PATH, catalog_path: str = catalog.CATALOG_PATH):
+        self.model_name = model_name
+        self.data_files = list(data_files)
+        self.store_path = store_path
+        self.catalog_path = catalog_path
+        self.source = None  # "csv", "catalog" or "store" once loaded
+        self.catalog_version = None
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._embedding_cache = None
+        self._cache_lock = threading.Lock()
+        self.timings = {}
+        self.error = None
+        self.started_at = None
+        self.ready_at = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
 
-# Prepare GemGem embeddings
-gemgem_df['parsed_details'] = gemgem_df['details'].apply(parse_details)
-gemgem_df['embedding_text'] = gemgem_df['parsed_details'].apply(details_to_text)
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
 
-# --- Similar price function ---
+    def ensure_ready(self):
+        """Load everything if it isn't loaded yet (blocking); returns the engine."""
+        if not self._ready.is_set():
+            with self._lock:
+                if not self._ready.is_set():
+                    self._load()
+        return self
 
-def get_similar_prices(listing_id: str, top_n: int = 5):
-    start_time = time.time()
+    def start_warmup(self):
+        """Start loading on a background thread and return immediately."""
+        if not self.ready and (self._thread is None or not self._thread.is_alive()):
+            self._thread = threading.Thread(target=self._warmup, name="engine-warmup", daemon=True)
+            self._thread.start()
+        return self._thread
 
-    gem_row = gemgem_df[gemgem_df['listing_id'] == listing_id]
-    if gem_row.empty:
-        return {"error": f"No GemGem product found with listing ID {listing_id}"}
+    def _warmup(self):
+        try:
+            self.ensure_ready()
+        except Exception:
+            print(f"❌ Pricing engine warm-up failed: {self.error}")
+
+    @contextmanager
+    def _phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - started, 3)
+
+    @property
+    def model(self):
+        """The SentenceTransformer, loaded on first use."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    with self._phase("imports"):
+                        # torch + transformers dominate import time, so they are imported here, not at module load
+                        from sentence_transformers import SentenceTransformer
+                    with self._phase("model_load"):
+                        self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    @property
+    def embedding_cache(self):
+        """
+        The on-disk embedding cache, opened on first use: it reads every shard
+        into memory, which the store path (vectors memory-mapped) only needs
+        once something has to be encoded, e.g. an upsert.
+        """
+        if self._embedding_cache is None:
+            with self._cache_lock:
+                if self._embedding_cache is None:
+                    self._embedding_cache = EmbeddingCache(self.model_name)
+        return self._embedding_cache
+
+    def _load(self):
+        self.started_at = time.time()
+        self.error = None
+        self.timings = {}
+        try:
+            if corpus_store.exists(self.store_path):
+                self._load_store()
+            else:
+                if self.store_path:
+                    print(f"⚠️ No corpus store at {self.store_path} "
+                          f"(build one with: python working/corpus_store.py)")
+                if catalog.exists(self.catalog_path):
+                    competitors, gemgem_df = self._read_catalog()
+                else:
+                    if self.catalog_path:
+                        print(f"⚠️ No compiled catalog at {self.catalog_path}; loading the CSVs "
+                              f"(compile one with: python working/catalog.py)")
+                    competitors, gemgem_df = self._read_csv()
+                self._build(competitors, gemgem_df)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            raise
+
+        self.ready_at = time.time()
+        if self._embedding_cache is not None:
+            print(self._embedding_cache.report())
+        print(f"✅ Pricing engine ready in {self.ready_at - self.started_at:.2f}s from {self.source} {self.timings}")
+        self._ready.set()
+
+    def _load_store(self):
+        with self._phase("store_open"):
+            store = corpus_store.open_corpus_store(self.store_path)
+            if store.manifest.get("model", self.model_name) != self.model_name:
+                raise ValueError(f"Corpus store {self.store_path} was built with {store.manifest['model']}, "
+                                 f"not {self.model_name}")
+            self.data_fingerprint = store.manifest["data_fingerprint"]
+            self.data_modified_at = store.manifest["data_modified_at"]
+            self.catalog_version = store.manifest.get("catalog_version")
+            gemgem_df = store.gemgem_df
+            if ATTRIBUTE_COLUMNS[0] not in gemgem_df.columns:
+                # Stores built before attribute blocking
+                gemgem_df['parsed_details'] = gemgem_df['details'].apply(parse_details)
+                gemgem_df = add_attribute_columns(gemgem_df)
+            self.gemgem_df = gemgem_df
+            self.gemgem_embeddings = store.gemgem_embeddings
 
-    gem_text = gem_row['embedding_text'].values[0]
-    gem_price = gem_row['price'].values[0]
-    gem_name = gem_row['name'].values[0]
+        with self._phase("index"):
+            # The stored vectors are already encoded: the index wraps the read-only memmap as-is
+            self.competitor_corpus = CompetitorCorpus(
+                store.competitor_df, store.competitor_codes,
+                index_factory=partial(make_index, encoded=True, scales=store.competitor_scales)
+            )
+            self.listing_store = ListingStore(gemgem_df, self.gemgem_embeddings)
+        self.source = "store"
 
-    # Compute similarity
-    gem_embedding = model.encode(gem_text, convert_to_tensor=True)
-    cos_scores = util.pytorch_cos_sim(gem_embedding, competitor_embeddings)[0]
-    top_indices = np.argsort(-cos_scores.cpu().numpy())[:top_n]
+    def _read_catalog(self):
+        """Typed rows from the compiled catalog: two Parquet reads and a vectorised filter."""
+        with self._phase("catalog_load"):
+            compiled = catalog.load_catalog(self.catalog_path)
+            if catalog.is_stale(compiled):
+                print(f"⚠️ Catalog {compiled.version} is older than its source CSVs "
+                      f"(recompile with: python working/catalog.py)")
+            # Same validators as loading the CSVs the catalog was compiled from
+            self.data_fingerprint = compiled.manifest["data_fingerprint"]
+            self.data_modified_at = compiled.manifest["data_modified_at"]
+            self.catalog_version = compiled.version
+            competitors, gemgem_df = serving_rows(compiled.competitors), serving_rows(compiled.gemgem)
+        self.source = "catalog"
+        return competitors, gemgem_df
+
+    def _read_csv(self):
+        """Compile the raw CSVs in memory, exactly as catalog.py would."""
+        with self._phase("csv_load"):
+            competitors, gemgem_df, fields = catalog.compile_sources(self.data_files)
+            self.data_fingerprint = fields["data_fingerprint"]
+            self.data_modified_at = fields["data_modified_at"]
+            competitors, gemgem_df = serving_rows(competitors), serving_rows(gemgem_df)
+        self.source = "csv"
+        return competitors, gemgem_df
+
+    def _build(self, competitors: pd.DataFrame, gemgem_df: pd.DataFrame):
+        self.gemgem_df = gemgem_df
+        self.model  # these sources always encode, so load the model and the cache up front
+        self.embedding_cache
+
+        with self._phase("encode"):
+            competitor_embeddings = self.embedding_cache.encode(self.model, competitors['embedding_text'].tolist())
+            self.gemgem_embeddings = self.embedding_cache.encode(self.model, gemgem_df['embedding_text'].tolist())
+
+        with self._phase("index"):
+            self.competitor_corpus = CompetitorCorpus(competitors, competitor_embeddings)
+            # Shared O(1) listing_id index over the GemGem catalog (used by app, UI and pricing)
+            self.listing_store = ListingStore(gemgem_df, self.gemgem_embeddings)
+
+    def status(self) -> dict:
+        if self.ready:
+            elapsed = round(self.ready_at - self.started_at, 3)
+        elif self.started_at:
+            elapsed = round(time.time() - self.started_at, 3)
+        else:
+            elapsed = None
+        return {
+            "ready": self.ready,
+            "warming_up": self._thread is not None and self._thread.is_alive(),
+            "error": self.error,
+            "source": self.source,
+            "catalog_version": self.catalog_version,
+            "phases": {name: self.timings.get(name) for name in self.PHASES},
+            "elapsed_seconds": elapsed,
+        }
+
+
+engine = PricingEngine()
+
+# Former import-time globals, still readable as normalization.<name>; reading one loads the engine
+ENGINE_ATTRIBUTES = {"model", "embedding_cache", "gemgem_df", "gemgem_embeddings",
+                     "competitor_corpus", "listing_store", "data_fingerprint", "data_modified_at"}
+
+
+def __getattr__(name):
+    if name in ENGINE_ATTRIBUTES:
+        return getattr(engine.ensure_ready(), name)
+    # competitor_df / competitor_index / competitor_embeddings are live views of
+    # the corpus, which changes under upsert_competitors / delete_competitors
+    if name in ("competitor_df", "competitor_index", "competitor_embeddings"):
+        snap = engine.ensure_ready().competitor_corpus.snapshot
+        if name == "competitor_df":
+            return snap.live_df()
+        if name == "competitor_index":
+            return snap.index
+        vectors = snap.index.vectors
+        return vectors if snap.index.alive is None else vectors[snap.index.alive]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- Incremental competitor updates ---
+
+_update_lock = threading.Lock()
+
+
+def upsert_competitors(rows: pd.DataFrame) -> dict:
+    """
+    Add or refresh competitor products keyed by url, e.g. the rows touched by a re-scrape.
+    Rows are normalised like the compiled catalog; only new or changed texts are
+    encoded, and rows that are no longer served (too cheap, lab grown) are removed.
+    """
+    rows = rows.drop_duplicates('url', keep='last').reset_index(drop=True)
+    eng = engine.ensure_ready()
+    competitor_corpus = eng.competitor_corpus
+    with _update_lock:
+        source = rows['url'].astype(str).str.extract(r'(kay|glamira)', flags=re.IGNORECASE)[0].str.lower()
+        compiled = compile_frame(rows, 'other').assign(source=source.fillna('other').to_numpy())
+        mask = serving_mask(compiled)
+        rejected = compiled.loc[~mask, 'url']
+        kept = compiled[mask].drop(columns='parsed_details').reset_index(drop=True)
+        embeddings = eng.embedding_cache.encode(eng.model, kept['embedding_text'].tolist())
+        stats = competitor_corpus.upsert(kept, embeddings)
+        stats["removed"] = competitor_corpus.delete(rejected)
+    stats["version"] = competitor_corpus.version
+    return stats
+
+
+def delete_competitors(urls) -> dict:
+    competitor_corpus = engine.ensure_ready().competitor_corpus
+    with _update_lock:
+        removed = competitor_corpus.delete(urls)
+    return {"removed": removed, "version": competitor_corpus.version}
+
+def apply_scrape_delta(delta: pd.DataFrame) -> dict:
+    """
+    Apply a scraper's *.delta.csv (change = added / changed / removed, plus the
+    usual name / price / url / details): only the added and changed rows are
+    normalised and embedded, removed urls are deleted. Served as POST /competitors/delta.
+    """
+    changed = delta[delta['change'].isin(['added', 'changed'])].drop(columns='change')
+    stats = upsert_competitors(changed) if len(changed) else {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+    stats["removed"] += delete_competitors(delta.loc[delta['change'] == 'removed', 'url'])["removed"]
+    stats["version"] = engine.competitor_corpus.version
+    return stats
+
+# --- Similar price function ---
+
+def _candidates(snap, listing, top_n, blocking_level=None):
+    """Attribute blocking: (competitor row ids to score or None for all, level actually used)."""
+    level = BLOCKING_LEVEL if blocking_level is None else blocking_level
+    if level <= 0 or not listing.attributes:
+        return None, 0
+    return snap.attributes.candidates(
+        listing.attributes, level, max(top_n, BLOCKING_MIN_CANDIDATES), snap.index.alive
+    )
+
+
+def _similar_prices_result(snap, listing, top_indices, top_scores, start_time, candidates=None, level=0):
+    competitor_df = snap.live_df()
+    listing_id = listing.listing_id
+    gem_embedding = listing.embedding
+    gem_price = listing.price
+    gem_name = listing.name
 
     # Get top similar products
-    similar = competitor_df.iloc[top_indices].copy()
-    similar['similarity_score'] = cos_scores[top_indices].cpu().numpy()
+    similar = snap.df.iloc[top_indices].copy()
+    similar['similarity_score'] = top_scores
     similar['price'] = pd.to_numeric(similar['price'], errors='coerce')
     avg_similar_price = similar['price'].dropna().mean()
 
+    if DEBUG_SIMILARITY:
         # Debug: Show similarity scores for all competitors
-    all_scores = pd.DataFrame({
-        'name': competitor_df['name'],
-        'source': competitor_df['url'].apply(lambda x: 'Kay' if 'kay' in x.lower() else 'Glamira'),
-        'price': competitor_df['price'],
-        'url': competitor_df['url'],
-        'similarity_score': cos_scores.cpu().numpy()
-    }).sort_values(by='similarity_score', ascending=False)
-    print(f"Total rows in all_scores: {len(all_scores)}")
-
-    print("\n--- All Similarity Scores ---")
-    print(all_scores[['name', 'source', 'price', 'similarity_score']])
+        live_scores = snap.index.score_all(gem_embedding)
+        if snap.index.alive is not None:
+            live_scores = live_scores[snap.index.alive]
+        all_scores = pd.DataFrame({
+            'name': competitor_df['name'],
+            'source': competitor_df['url'].apply(lambda x: 'Kay' if 'kay' in x.lower() else 'Glamira'),
+            'price': competitor_df['price'],
+            'url': competitor_df['url'],
+            'similarity_score': live_scores
+        }).sort_values(by='similarity_score', ascending=False)
+        print(f"Total rows in all_scores: {len(all_scores)}")
+
+        print("\n--- All Similarity Scores ---")
+        print(all_scores[['name', 'source', 'price', 'similarity_score']])
     processing_time = round(time.time() - start_time, 3)
 
     threshold = 0.05
@@ -138,15 +389,96 @@ def get_similar_prices(listing_id: str, top_n: int = 5):
         "similar_website_average_price": round(avg_similar_price, 2),
         "similar_products": similar[['name', 'price', 'url', 'similarity_score']].to_dict(orient="records"),
         "processing_time_seconds": processing_time,
-        "match_rate": match_rate
+        "match_rate": match_rate,
+        "blocking_level": level,
+        "candidates_scored": len(snap) if candidates is None else len(candidates),
     }
 
+
+@traced
+def get_similar_prices(listing_id: str, top_n: int = 5, blocking_level: int = None):
+    """
+    Top-n most similar competitor products and their average price.
+    Only competitors that share the listing's leading attributes (see
+    attribute_index.BLOCKING_LEVEL; 0 disables blocking) are scored.
+    """
+    start_time = time.time()
+    eng = engine.ensure_ready()
+
+    with stage("listing_lookup"):
+        listing = eng.listing_store.get(listing_id)
+    if listing is None:
+        return {"error": f"No GemGem product found with listing ID {listing_id}"}
+
+    # Compute similarity (GemGem embeddings are precomputed through the cache)
+    snap = eng.competitor_corpus.snapshot
+    with stage("blocking"):
+        candidates, level = _candidates(snap, listing, top_n, blocking_level)
+    with stage("similarity_search"):
+        if candidates is None:
+            top_indices, top_scores = snap.index.search(listing.embedding, top_n)
+        else:
+            top_indices, top_scores = snap.index.search_candidates(listing.embedding, candidates, top_n)
+
+    with stage("result_build"):
+        return _similar_prices_result(snap, listing, top_indices, top_scores, start_time, candidates, level)
+
+
+@traced
+def get_similar_prices_batch(listing_ids, top_n: int = 5, blocking_level: int = None):
+    """
+    Batched get_similar_prices: one list of results in the same order as listing_ids.
+    Listings that blocking can't narrow down are scored together in a single
+    matrix-matrix product, the rest against their own candidate sets. Each
+    result's processing_time_seconds is its share of the batch time.
+    """
+    start_time = time.time()
+    eng = engine.ensure_ready()
+
+    with stage("listing_lookup"):
+        listings = [eng.listing_store.get(lid) for lid in dict.fromkeys(listing_ids)]
+        listings = [listing for listing in listings if listing is not None]
+    results = {}
+    if listings:
+        snap = eng.competitor_corpus.snapshot
+        unblocked = []
+        for listing in listings:
+            with stage("blocking"):
+                candidates, level = _candidates(snap, listing, top_n, blocking_level)
+            if candidates is None:
+                unblocked.append((listing, level))
+                continue
+            with stage("similarity_search"):
+                indices, scores = snap.index.search_candidates(listing.embedding, candidates, top_n)
+            results[listing.listing_id] = _similar_prices_result(
+                snap, listing, indices, scores, start_time, candidates, level
+            )
+
+        if unblocked:
+            # GemGem texts are encoded in one batch at load time through the embedding cache
+            query_embeddings = eng.gemgem_embeddings[[listing.position for listing, _ in unblocked]]
+            with stage("similarity_search"):
+                all_indices, all_scores = snap.index.search_batch(query_embeddings, top_n)
+            for (listing, level), indices, scores in zip(unblocked, all_indices, all_scores):
+                results[listing.listing_id] = _similar_prices_result(
+                    snap, listing, indices, scores, start_time, level=level
+                )
+
+        per_listing = round((time.time() - start_time) / len(listings), 3)
+        for result in results.values():
+            result["processing_time_seconds"] = per_listing
+
+    return [
+        results.get(lid, {"error": f"No GemGem product found with listing ID {lid}"})
+        for lid in listing_ids
+    ]
+
 # --- Run example ---
 
 if __name__ == "__main__":
     listing_id = "L2025071241181"  # Replace with desired listing_id
     result = get_similar_prices(listing_id)
-    retail_price = calculate_retail_price(listing_id, gemgem_df)
+    retail_price = calculate_retail_price(listing_id, engine.listing_store)
 
     print("\n=== Price Summary ===")
     print(f"GemGem Price: ${result['gemgem_price']}")
@@ -0,0 +1,122 @@
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from metrics import record_stage
+from profiling import traced
+
+# Threads for network-bound work (gold price API)
+PIPELINE_IO_WORKERS = int(os.getenv("PIPELINE_IO_WORKERS", "16"))
+PIPELINE_IO_LIMIT = int(os.getenv("PIPELINE_IO_LIMIT", "64"))
+# Threads for model inference / similarity search (NumPy and torch release the GIL)
+PIPELINE_INFERENCE_WORKERS = int(os.getenv("PIPELINE_INFERENCE_WORKERS", "4"))
+PIPELINE_INFERENCE_LIMIT = int(os.getenv("PIPELINE_INFERENCE_LIMIT", "16"))
+# Processes for chart rendering (0 = render on a thread pool instead)
+PIPELINE_RENDER_PROCESSES = int(os.getenv("PIPELINE_RENDER_PROCESSES", "2"))
+PIPELINE_RENDER_LIMIT = int(os.getenv("PIPELINE_RENDER_LIMIT", "8"))
+# How long a request may wait for a free slot in a stage before it is shed with a 503
+PIPELINE_QUEUE_TIMEOUT_SEC = float(os.getenv("PIPELINE_QUEUE_TIMEOUT_SEC", "5"))
+
+
+class StageOverloaded(Exception):
+    """A pipeline stage had no free slot within the queue timeout."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Pipeline stage '{stage}' is overloaded")
+        self.stage = stage
+
+
+class Stage:
+    """
+    One executor plus a concurrency limit.
+    At most `limit` calls are in flight (running or queued in the executor);
+    callers beyond that wait up to `queue_timeout` and are then rejected, so a
+    slow stage sheds load instead of tying up every request.
+    """
+
+    def __init__(self, name: str, executor, limit: int, queue_timeout: float = PIPELINE_QUEUE_TIMEOUT_SEC):
+        self.name = name
+        self.executor = executor
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args, **kwargs):
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise StageOverloaded(self.name)
+        finally:
+            self.waiting -= 1
+            record_stage(f"{self.name}_queue", time.perf_counter() - started)
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            call = partial(fn, *args, **kwargs)
+            if isinstance(self.executor, ThreadPoolExecutor):
+                # Threads run in the caller's context, so stages timed there reach its Server-Timing
+                # and, when the request is being profiled, the thread is sampled while it runs the call
+                call = partial(contextvars.copy_context().run, traced(call))
+            return await loop.run_in_executor(self.executor, call)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "waiting": self.waiting,
+                "completed": self.completed, "rejected": self.rejected}
+
+
+class PricingPipeline:
+    """
+    Separately sized executors for the stages of a pricing request:
+    `io` (gold price), `inference` (embedding lookup + similarity) and
+    `render` (matplotlib, in worker processes by default). A slow upstream
+    can then only exhaust its own stage, never the CPU-bound ones.
+    Create it from inside the running event loop (e.g. the app lifespan).
+    """
+
+    def __init__(self, io_workers=PIPELINE_IO_WORKERS, io_limit=PIPELINE_IO_LIMIT,
+                 inference_workers=PIPELINE_INFERENCE_WORKERS, inference_limit=PIPELINE_INFERENCE_LIMIT,
+                 render_processes=PIPELINE_RENDER_PROCESSES, render_limit=PIPELINE_RENDER_LIMIT):
+        self.io = Stage("io", ThreadPoolExecutor(io_workers, thread_name_prefix="pipeline-io"), io_limit)
+        self.inference = Stage(
+            "inference", ThreadPoolExecutor(inference_workers, thread_name_prefix="pipeline-inference"),
+            inference_limit
+        )
+        if render_processes > 0:
+            # spawn, not fork: the parent holds torch / BLAS thread pools that don't survive fork
+            render_executor = ProcessPoolExecutor(render_processes, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            render_executor = ThreadPoolExecutor(2, thread_name_prefix="pipeline-render")
+        self.render = Stage("render", render_executor, render_limit)
+
+    @property
+    def stages(self):
+        return [self.io, self.inference, self.render]
+
+    def warm_up_render(self, fn, *args):
+        """Start the render workers now (spawning and importing matplotlib takes seconds)."""
+        workers = getattr(self.render.executor, "_max_workers", 1)
+        for _ in range(workers):
+            self.render.executor.submit(fn, *args)
+
+    def stats(self) -> dict:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def shutdown(self):
+        for stage in self.stages:
+            stage.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,5 +1,5 @@
-import requests
 import ast
+import numpy as np
 import pandas as pd
 import os
 from dotenv import load_dotenv
@@ -9,32 +9,39 @@ from pathlib import Path
 env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
+from gold_price import GoldPriceProvider, MetalPriceApiSource  # reads GOLD_PRICE_* from the env loaded above
+from metrics import cache_access, stage
+
 # API Setup
 API_KEY = os.getenv("METAL_API_KEY")
-if not API_KEY:
-    raise EnvironmentError("❌ METAL_API_KEY not set in .env file.")
+# METAL_PRICE_URL overrides the endpoint, e.g. to point at a local stub server
+METAL_PRICE_URL = os.getenv("METAL_PRICE_URL")
+if not METAL_PRICE_URL:
+    if not API_KEY:
+        raise EnvironmentError("❌ METAL_API_KEY not set in .env file.")
+    METAL_PRICE_URL = f"https://api.metalpriceapi.com/v1/latest?api_key={API_KEY}&base=USD&symbols=XAU"
 
-METAL_PRICE_URL = f"https://api.metalpriceapi.com/v1/latest?api_key={API_KEY}&base=USD&symbols=XAU"
+gold_price_provider = GoldPriceProvider(MetalPriceApiSource(METAL_PRICE_URL))
 
 def fetch_gold_price_usd_per_gram():
-    try:
-        response = requests.get(METAL_PRICE_URL)
-        data = response.json()
-        usd_per_xau = data['rates']['USDXAU']
-        usd_per_gram_24k = usd_per_xau / 31.1035
-        usd_per_gram_18k = usd_per_gram_24k * 0.75
-        return usd_per_gram_18k
-    except Exception as e:
-        print("❌ Error fetching gold price:", e)
-        return 80.0  # fallback price per gram
+    # Cached 18K price; refreshed in the background once older than GOLD_PRICE_TTL_SEC
+    cache_access("gold_price", hit=not gold_price_provider.is_stale())
+    with stage("gold_price"):
+        return gold_price_provider.get()
+
+
+WEIGHT_COLUMNS = ["metal_weight", "diamond_weight", "diamond_source"]
 
 
 def extract_weights(details_str):
+    # Also accepts details that were already parsed into a dict (catalog / parsed_details)
     try:
-        if pd.isna(details_str):
+        if isinstance(details_str, dict):
+            details = details_str
+        elif pd.isna(details_str):
             raise ValueError("Empty details string")
-
-        details = ast.literal_eval(details_str)
+        else:
+            details = ast.literal_eval(details_str)
 
         metal_weight = 0.0
         diamond_weight = 0.0
@@ -109,28 +116,40 @@ def extract_weights(details_str):
 #     retail_price = base_price * (1 + markup_pct / 100)
 
 #     return round(retail_price, 2)
-def calculate_retail_price(listing_id: str, gemgem_df, making_charge_per_g=20, markup_pct=50):
-    row = gemgem_df[gemgem_df['listing_id'] == listing_id]
-    if row.empty:
-        return {}
-
-    price_details = row['details'].values[0]
-    weights = extract_weights(price_details)
-    metal_weight = weights["metal_weight"]
-    diamond_weight = weights["diamond_weight"]
-    diamond_source = weights["diamond_source"]
-
-    # Gold price
-    gold_price_per_gram = fetch_gold_price_usd_per_gram()
+def add_weight_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Parse `details` once into typed metal_weight / diamond_weight / diamond_source
+    columns, so pricing never has to literal_eval a row again.
+    Uses `parsed_details` instead of re-parsing when the frame already has it.
+    """
+    source = df['parsed_details'] if 'parsed_details' in df.columns else df['details']
+    weights = [extract_weights(d) for d in source]
+    df['metal_weight'] = pd.Series([w["metal_weight"] for w in weights], index=df.index, dtype='float64')
+    df['diamond_weight'] = pd.Series([w["diamond_weight"] for w in weights], index=df.index, dtype='float64')
+    df['diamond_source'] = pd.Series([str(w["diamond_source"]) for w in weights], index=df.index, dtype='object')
+    return df
+
+
+def calculate_retail_prices(df: pd.DataFrame, gold_price_per_gram: float, making_charge_per_g=20, markup_pct=50) -> pd.DataFrame:
+    """
+    Retail price breakdown for every row of `df` in one vectorised pass.
+    Returns a frame indexed like `df` with the same fields as calculate_retail_price.
+    """
+    if not set(WEIGHT_COLUMNS).issubset(df.columns):
+        df = add_weight_columns(df[['details']].copy())
+
+    metal_weight = df['metal_weight'].to_numpy(dtype='float64')
+    diamond_weight = df['diamond_weight'].to_numpy(dtype='float64')
+    is_lab = df['diamond_source'].astype(str).str.lower().to_numpy() == "lab"
 
     # Determine gold weight
-    gold_weight = metal_weight if metal_weight > 0 else diamond_weight * 1.5
+    gold_weight = np.where(metal_weight > 0, metal_weight, diamond_weight * 1.5)
 
     gold_cost = gold_weight * gold_price_per_gram
     making_charge = gold_weight * making_charge_per_g
 
     # Diamond pricing
-    diamond_price_per_carat = 400 if diamond_source.lower() == "lab" else 1500
+    diamond_price_per_carat = np.where(is_lab, 400, 1500)
     diamond_cost = diamond_weight * diamond_price_per_carat
 
     # Base + markup
@@ -138,17 +157,37 @@ def calculate_retail_price(listing_id: str, gemgem_df, making_charge_per_g=20, m
     markup_value = base_price * (markup_pct / 100)
     retail_price = base_price + markup_value
 
-    return {
-        "gold_cost": round(gold_cost, 2),
+    return pd.DataFrame({
+        "gold_cost": np.round(gold_cost, 2),
         "gold_price_per_gram": round(gold_price_per_gram, 2),
-        "gold_weight": round(gold_weight, 2),
-        "diamond_cost": round(diamond_cost, 2),
+        "gold_weight": np.round(gold_weight, 2),
+        "diamond_cost": np.round(diamond_cost, 2),
         "diamond_price_per_carat": diamond_price_per_carat,
-        "diamond_weight": round(diamond_weight, 2),
-        "diamond_source": diamond_source,
-        "making_charge": round(making_charge, 2),
+        "diamond_weight": np.round(diamond_weight, 2),
+        "diamond_source": df['diamond_source'].to_numpy(),
+        "making_charge": np.round(making_charge, 2),
         "markup_pct": markup_pct,
-        "markup_value": round(markup_value, 2),
-        "retail_price": round(retail_price, 2)
-    }
+        "markup_value": np.round(markup_value, 2),
+        "retail_price": np.round(retail_price, 2)
+    }, index=df.index)
 
+
+def calculate_retail_price(listing_id: str, gemgem_df, making_charge_per_g=20, markup_pct=50):
+    if not isinstance(gemgem_df, pd.DataFrame):
+        # A ListingStore: O(1) row read from the catalog-wide breakdown
+        return gemgem_df.retail_breakdown(
+            listing_id, fetch_gold_price_usd_per_gram(), making_charge_per_g=making_charge_per_g, markup_pct=markup_pct
+        )
+
+    with stage("listing_scan"):
+        row = gemgem_df[gemgem_df['listing_id'] == listing_id]
+    if row.empty:
+        return {}
+
+    gold_price_per_gram = fetch_gold_price_usd_per_gram()
+    with stage("retail_calc"):
+        breakdown = calculate_retail_prices(
+            row, gold_price_per_gram, making_charge_per_g=making_charge_per_g, markup_pct=markup_pct
+        ).iloc[0]
+    # Plain Python scalars, as callers serialise this dict
+    return {k: (v.item() if hasattr(v, "item") else v) for k, v in breakdown.items()}
@@ -0,0 +1,222 @@
+import functools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as Tally
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from metrics import registry
+
+# Master switch: without it the profile header / query parameter is ignored
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+# When set, the trigger must carry this value (X-Profile: <token> or ?profile=<token>) instead of "1"
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+# Where collapsed-stack (.folded) files and their .json summaries are written
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Milliseconds between stack samples of the profiled threads
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# At most one profiled request per this many seconds (per process); others run unprofiled
+PROFILE_MIN_INTERVAL_SEC = float(os.getenv("PROFILE_MIN_INTERVAL_SEC", "10"))
+# Sampling stops after this long even if the request is still running
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "30"))
+# Oldest profiles are deleted beyond this many
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+
+PROFILE_HEADER = "x-profile"
+PROFILE_QUERY_PARAM = "profile"
+
+PROFILES = registry.counter("pricing_profiles_total", "Profiling requests by outcome", ["result"])
+
+# The profile the current request is being sampled into, if any
+_session = ContextVar("profile_session", default=None)
+_gate = threading.Lock()
+_last_started = 0.0
+
+
+def requested(trigger) -> bool:
+    """Whether a header / query parameter value asks for a profile and profiling is switched on."""
+    if not PROFILING_ENABLED or not trigger:
+        return False
+    return trigger == PROFILE_TOKEN if PROFILE_TOKEN else trigger.lower() in ("1", "true", "yes")
+
+
+def _frame_name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class ProfileSession:
+    """
+    Wall-clock sampling profiler over the threads that work on one request.
+
+    Threads join with track() while they run the request's code (pipeline
+    thread stages and get_similar_prices do that on their own, see traced()).
+    A background thread samples their stacks every `interval` seconds and
+    tallies them as collapsed stacks ("thread;module.py:func;... count"),
+    the input format of flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, label: str, interval: float = PROFILE_INTERVAL_MS / 1000, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.label = label
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks = Tally()
+        self.samples = 0
+        self.truncated = False
+        self.skipped = None  # reason, when the request asked for a profile but didn't get one
+        self.path = None
+        self._threads = {}  # thread id -> nesting depth
+        self._names = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self.started_at = None
+        self.duration = None
+
+    @contextmanager
+    def track(self):
+        """Sample the calling thread until the block exits."""
+        tid = threading.get_ident()
+        with self._lock:
+            self._threads[tid] = self._threads.get(tid, 0) + 1
+            self._names[tid] = threading.current_thread().name
+        try:
+            yield
+        finally:
+            with self._lock:
+                depth = self._threads.pop(tid) - 1
+                if depth:
+                    self._threads[tid] = depth
+
+    def start(self):
+        self.started_at = time.time()
+        self._sampler = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._sampler.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        self.duration = round(time.time() - self.started_at, 3)
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval):
+            if time.monotonic() > deadline:
+                self.truncated = True
+                return
+            with self._lock:
+                threads = list(self._threads)
+            frames = sys._current_frames()
+            for tid in threads:
+                frame = frames.get(tid)
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                if names:
+                    self.stacks[";".join([self._names.get(tid, str(tid))] + names[::-1])] += 1
+                    self.samples += 1
+
+    def top(self, n: int = 15) -> list:
+        """Functions with the most samples at the top of the stack (self time)."""
+        leaves = Tally()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return [{"function": name, "samples": count, "ms": round(count * self.interval * 1000, 1)}
+                for name, count in leaves.most_common(n)]
+
+    def write(self, directory=PROFILE_DIR) -> str:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", self.label).strip("_")[:80]
+        stem = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))}-{slug}-{os.getpid()}"
+        folded = directory / f"{stem}.folded"
+        folded.write_text("".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()))
+        (directory / f"{stem}.json").write_text(json.dumps({
+            "label": self.label,
+            "started_at": self.started_at,
+            "duration_sec": self.duration,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "truncated": self.truncated,
+            "top_self": self.top(),
+        }, indent=2))
+        _prune(directory)
+        self.path = str(folded)
+        return self.path
+
+
+def _prune(directory: Path, keep: int = PROFILE_MAX_FILES):
+    profiles = sorted(directory.glob("*.folded"), key=lambda p: p.stat().st_mtime)
+    for old in profiles[:max(0, len(profiles) - keep)]:
+        old.unlink(missing_ok=True)
+        old.with_suffix(".json").unlink(missing_ok=True)
+
+
+def _admit():
+    """Reason the profile can't run now, or None after reserving the slot."""
+    global _last_started
+    if not _gate.acquire(blocking=False):
+        return "another profile is running"
+    if time.monotonic() - _last_started < PROFILE_MIN_INTERVAL_SEC:
+        _gate.release()
+        return f"at most one profile per {PROFILE_MIN_INTERVAL_SEC:g}s"
+    _last_started = time.monotonic()
+    return None
+
+
+@contextmanager
+def profile_request(label: str, trigger, include_current_thread: bool = False):
+    """
+    Profile the block when `trigger` (the X-Profile header or ?profile= value) asks for it.
+    Yields None when it doesn't, else the ProfileSession: its .path is the written
+    .folded file afterwards, or .skipped says why the limits turned it down.
+    """
+    if not requested(trigger):
+        yield None
+        return
+    session = ProfileSession(label)
+    session.skipped = _admit()
+    if session.skipped:
+        PROFILES.inc(result="skipped")
+        yield session
+        return
+
+    token = _session.set(session)
+    session.start()
+    try:
+        if include_current_thread:
+            with session.track():
+                yield session
+        else:
+            yield session
+    finally:
+        _session.reset(token)
+        session.stop()
+        try:
+            session.write()
+            PROFILES.inc(result="written")
+            print(f"🔬 Profile of {label}: {session.samples} samples in {session.duration}s -> {session.path}")
+        except OSError as e:
+            PROFILES.inc(result="error")
+            print(f"⚠️ Could not write profile of {label}: {e}")
+        finally:
+            _gate.release()
+
+
+def traced(fn):
+    """Run `fn` with the calling thread sampled into the current request's profile, if it has one."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        session = _session.get()
+        if session is None:
+            return fn(*args, **kwargs)
+        with session.track():
+            return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,213 @@
+import atexit
+import csv
+import io
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+from metrics import stage
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process file locks
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet output is optional
+    pa = pq = None
+
+# Where per-request pricing results go, and in which format ("csv" or "parquet")
+RESULTS_PATH = os.getenv("RESULTS_PATH", "poc_test_results.csv")
+RESULTS_FORMAT = os.getenv("RESULTS_FORMAT", "csv")
+# Rows waiting to be written; when full, new rows are dropped rather than blocking requests
+RESULTS_QUEUE_SIZE = int(os.getenv("RESULTS_QUEUE_SIZE", "10000"))
+# Write once this many rows are queued, or after this many seconds, whichever is first
+RESULTS_FLUSH_ROWS = int(os.getenv("RESULTS_FLUSH_ROWS", "500"))
+RESULTS_FLUSH_SEC = float(os.getenv("RESULTS_FLUSH_SEC", "2"))
+# Start a new file past this size / age (0 disables)
+RESULTS_ROTATE_MB = float(os.getenv("RESULTS_ROTATE_MB", "50"))
+RESULTS_ROTATE_SEC = float(os.getenv("RESULTS_ROTATE_SEC", "0"))
+
+_FLUSH = object()
+_STOP = object()
+
+
+class ResultsSink:
+    """
+    Append-only, buffered writer for per-request result rows.
+
+    submit() only enqueues, so request latency no longer depends on how big
+    the results file has grown. A single background thread drains the queue
+    in batches and appends them, which also means concurrent requests can no
+    longer overwrite each other's rows. Files are rotated by size or age, and
+    pending rows are flushed on close() / interpreter exit.
+    """
+
+    def __init__(self, path=RESULTS_PATH, fmt=RESULTS_FORMAT, max_queue=RESULTS_QUEUE_SIZE,
+                 flush_rows=RESULTS_FLUSH_ROWS, flush_interval=RESULTS_FLUSH_SEC,
+                 rotate_bytes=RESULTS_ROTATE_MB * 1024 * 1024, rotate_interval=RESULTS_ROTATE_SEC):
+        self.path = Path(path)
+        self.format = fmt.lower()
+        if self.format == "parquet" and pq is None:
+            print("⚠️ pyarrow is not installed; writing results as CSV instead of Parquet")
+            self.format = "csv"
+        if self.format == "parquet":
+            # A directory of part files, readable as one dataset
+            self.path = self.path.with_suffix(".parquet")
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        self.rotate_interval = rotate_interval
+
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._opened_at = time.time()
+        self._part = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="results-sink", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, row: dict) -> bool:
+        """Queue one row without blocking; returns False if it had to be dropped."""
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(row)
+            self.submitted += 1
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout: float = 10.0):
+        """Block until everything submitted so far has been written."""
+        if self._closed:
+            return
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        done.wait(timeout)
+
+    def close(self, timeout: float = 10.0):
+        """Flush pending rows and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write(batch)
+                return
+            if isinstance(item, tuple) and item and item[0] is _FLUSH:
+                self._write(batch)
+                batch = []
+                item[1].set()
+                continue
+            if item is not None:
+                batch.append(item)
+
+            if len(batch) >= self.flush_rows or (batch and time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, rows):
+        if not rows:
+            return
+        try:
+            with stage("results_write"):
+                if self.format == "parquet":
+                    self._write_parquet(rows)
+                else:
+                    self._write_csv(rows)
+            self.written += len(rows)
+        except Exception as e:
+            self.errors += len(rows)
+            print(f"❌ Could not write {len(rows)} result rows to {self.path}: {e}")
+
+    def _write_csv(self, rows):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        columns = list(dict.fromkeys(k for row in rows for k in row))
+        while True:
+            with open(self.path, "a+", newline="", encoding="utf-8") as f:
+                if fcntl:
+                    # Other uvicorn workers append to (and rotate) the same file
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    if not self._is_current(f):
+                        continue  # rotated by another worker while we waited for the lock
+                f.seek(0)
+                header = next(csv.reader([f.readline()]), None)
+                # A column the file doesn't have starts a new file rather than being dropped
+                if header and (self._rotation_due(f) or not set(columns) <= set(header)):
+                    self._rotate()
+                    continue
+                buf = io.StringIO()
+                writer = csv.DictWriter(buf, fieldnames=header or columns)
+                if not header:
+                    writer.writeheader()
+                writer.writerows(rows)
+                f.seek(0, os.SEEK_END)
+                f.write(buf.getvalue())  # one append for the whole batch
+                f.flush()
+                return
+
+    def _write_parquet(self, rows):
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._part += 1
+        name = f"part-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}-{self._part:06d}.parquet"
+        rows = [{k: (v.item() if hasattr(v, "item") else v) for k, v in row.items()} for row in rows]
+        pq.write_table(pa.Table.from_pylist(rows), self.path / name)
+
+    def _is_current(self, f) -> bool:
+        """Whether the open file is still the one at self.path."""
+        try:
+            return os.stat(self.path).st_ino == os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _rotation_due(self, f) -> bool:
+        too_big = self.rotate_bytes and os.fstat(f.fileno()).st_size >= self.rotate_bytes
+        too_old = self.rotate_interval and time.time() - self._opened_at >= self.rotate_interval
+        return bool(too_big or too_old)
+
+    def _rotate(self):
+        """Move the current file aside (called with its lock held)."""
+        stamp = f"{datetime.now():%Y%m%d-%H%M%S}"
+        rotated = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+        n = 1
+        while rotated.exists():
+            n += 1
+            rotated = self.path.with_name(f"{self.path.stem}.{stamp}-{n}{self.path.suffix}")
+        os.replace(self.path, rotated)
+        self._opened_at = time.time()
+
+    def stats(self) -> dict:
+        return {
+            "path": str(self.path),
+            "format": self.format,
+            "queued": self._queue.qsize(),
+            "submitted": self.submitted,
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))  # for scraping/
+
+# price_calculator needs a gold price endpoint at import; nothing here fetches one
+os.environ.setdefault("METAL_PRICE_URL", "http://127.0.0.1:9/")
+
+import normalization  # noqa: E402
+from competitor_corpus import CompetitorCorpus  # noqa: E402
+from embedding_cache import EmbeddingCache  # noqa: E402
+from scraping.state import ScrapeState  # noqa: E402
+
+DETAILS = {"Specifications": {"Metal": "14K White Gold", "Stone Type": "Diamond", "Total Carat Weight": "1 ct"}}
+
+
+class HashEncoder:
+    """Deterministic stand-in for the sentence model: a vector seeded by the text."""
+
+    def get_sentence_embedding_dimension(self):
+        return 8
+
+    def encode(self, texts, **kwargs):
+        seeds = [int(hashlib.md5(t.encode()).hexdigest()[:8], 16) for t in texts]
+        return np.array([np.random.default_rng(s).standard_normal(8) for s in seeds], dtype=np.float32)
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    eng = normalization.PricingEngine(store_path=None, catalog_path=None)
+    eng._model = HashEncoder()
+    eng._embedding_cache = EmbeddingCache(eng.model_name, tmp_path / "embeddings")
+    empty = pd.DataFrame(columns=["name", "price", "url", "embedding_text"])
+    eng.competitor_corpus = CompetitorCorpus(empty, np.zeros((0, 8), dtype=np.float32))
+    eng._ready.set()
+    monkeypatch.setattr(normalization, "engine", eng)
+    return eng
+
+
+def _row(n, price):
+    return {"name": f"Diamond Ring {n}", "price": f"${price:,}", "url": f"https://www.kayoutlet.com/p/{n}",
+            "details": {**DETAILS, "Name": f"ring {n}"}}
+
+
+def _scrape(state_path, delta_path, rows):
+    state = ScrapeState(str(state_path))
+    for row in rows:
+        state.record(row["url"], row)
+    state.finish()
+    state.save()
+    return pd.read_csv(state.write_delta(str(delta_path)))
+
+
+def test_apply_scrape_delta_follows_the_scrapers_delta(engine, tmp_path):
+    state_path = tmp_path / "state.json"
+    first = _scrape(state_path, tmp_path / "first.delta.csv", [_row(1, 1500), _row(2, 2500), _row(3, 3500)])
+    stats = normalization.apply_scrape_delta(first)
+    assert (stats["added"], stats["updated"], stats["removed"]) == (3, 0, 0)
+
+    # Ring 1 unchanged, ring 2 repriced, ring 3 gone
+    second = _scrape(state_path, tmp_path / "second.delta.csv", [_row(1, 1500), _row(2, 2750)])
+    assert sorted(second["change"]) == ["changed", "removed"]
+    stats = normalization.apply_scrape_delta(second)
+    assert (stats["added"], stats["updated"], stats["removed"]) == (0, 1, 1)
+
+    live = engine.competitor_corpus.snapshot.live_df().set_index("url")
+    assert sorted(live.index) == ["https://www.kayoutlet.com/p/1", "https://www.kayoutlet.com/p/2"]
+    assert live.loc["https://www.kayoutlet.com/p/2", "price"] == 2750
+    assert stats["version"] == engine.competitor_corpus.version
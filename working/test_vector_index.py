@@ -0,0 +1,71 @@
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from competitor_corpus import CompetitorCorpus
+from vector_index import IVF_MIN_ROWS, BruteForceIndex, IVFIndex, make_index
+
+
+def _vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_ivf_falls_back_to_exact_for_an_empty_corpus():
+    index = make_index(np.empty((0, 16), dtype=np.float32), kind="ivf")
+    assert isinstance(index, BruteForceIndex)
+    ids, scores = index.search(_vectors(1)[0], k=5)
+    assert len(ids) == 0 and len(scores) == 0
+
+
+def test_ivf_falls_back_to_exact_for_a_tiny_corpus():
+    vectors = _vectors(3)
+    index = make_index(vectors, kind="ivf", nlist=8)
+    assert isinstance(index, BruteForceIndex)
+    ids, _ = index.search(vectors[1], k=2)
+    assert ids[0] == 1
+
+
+def test_ivf_clamps_nlist_to_the_corpus_size():
+    vectors = _vectors(50)
+    index = IVFIndex(vectors, nlist=200, nprobe=200)
+    assert index.nlist == 50
+    ids, _ = index.search(vectors[7], k=1)
+    assert ids[0] == 7
+
+
+def test_ivf_index_rejects_an_empty_corpus():
+    with pytest.raises(ValueError):
+        IVFIndex(np.empty((0, 16), dtype=np.float32))
+
+
+def test_ivf_is_used_once_the_corpus_is_large_enough():
+    index = make_index(_vectors(1200), kind="ivf", nlist=0, nprobe=4)
+    assert isinstance(index, IVFIndex)
+
+
+def _rows(start, n):
+    return pd.DataFrame({
+        "url": [f"https://example.com/{i}" for i in range(start, start + n)],
+        "name": [f"ring {i}" for i in range(start, start + n)],
+        "price": np.arange(start, start + n, dtype=float),
+        "embedding_text": [f"ring {i}" for i in range(start, start + n)],
+    })
+
+
+def test_corpus_switches_to_ivf_after_growing_past_the_threshold():
+    corpus = CompetitorCorpus(_rows(0, 10), _vectors(10), index_factory=partial(make_index, kind="ivf", nlist=0, nprobe=4))
+    assert isinstance(corpus.snapshot.index, BruteForceIndex)
+
+    grown = _vectors(IVF_MIN_ROWS, seed=1)
+    corpus.upsert(_rows(10, IVF_MIN_ROWS), grown)
+    corpus.delete(["https://example.com/0"])
+    assert isinstance(corpus.snapshot.index, BruteForceIndex)  # no compaction yet
+
+    corpus.compact()
+    index = corpus.snapshot.index
+    assert isinstance(index, IVFIndex)
+    assert len(index) == IVF_MIN_ROWS + 9 and index.n_dead == 0
+    ids, _ = index.search(grown[5], k=1, nprobe=index.nlist)
+    assert corpus.snapshot.df.iloc[ids[0]]["url"] == "https://example.com/15"
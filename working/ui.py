@@ -1,12 +1,95 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
+import io
 import json
 import os
 import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from price_calculator import fetch_gold_price_usd_per_gram
+from normalization import get_similar_prices, engine
+from profiling import PROFILE_QUERY_PARAM, profile_request
+
+# Comparison results / charts memoized per process (the oldest are dropped beyond this)
+UI_CACHE_ENTRIES = int(os.getenv("UI_CACHE_ENTRIES", "1024"))
+
+
+@st.cache_resource(show_spinner="Loading pricing engine...")
+def load_engine():
+    """Model, catalogs, embeddings and listing store: loaded once per process, shared by every session."""
+    return engine.ensure_ready()
+
+
+def convert(o):
+    if isinstance(o, (np.int64, np.int32)):
+        return int(o)
+    if isinstance(o, (np.float64, np.float32)):
+        return float(o)
+    return str(o)
+
+
+@st.cache_data(max_entries=UI_CACHE_ENTRIES, show_spinner=False)
+def compare_listing(listing_id: str, data_fingerprint: str, corpus_version: int, gold_price_per_gram: float, top_n: int = 5):
+    """
+    Similar products, competitor average and retail breakdown of one listing.
+    data_fingerprint / corpus_version / gold_price_per_gram are only part of the
+    cache key: a rerun or repeat lookup is a dict lookup until one of them moves.
+    """
+    eng = load_engine()
+    similar_products = get_similar_prices(listing_id, top_n=top_n)
+    result = {"similar_products": similar_products.get("similar_products") or []}
+    if not result["similar_products"]:
+        return result
+
+    listing = eng.listing_store.get(listing_id)
+    gemgem_price = float(listing.price)
+    competitor_avg_price = float(pd.DataFrame(result["similar_products"])["price"].mean())
+    result.update(
+        gemgem_price=gemgem_price,
+        competitor_avg_price=competitor_avg_price,
+        retail=eng.listing_store.retail_breakdown(listing_id, gold_price_per_gram),
+    )
+
+    # ---- Log JSON if GemGem price > competitor avg (once per result, not on every rerun) ----
+    if gemgem_price > competitor_avg_price:
+        log_data = {
+            "gemgem_listing_id": str(listing_id),
+            "gemgem_price": float(gemgem_price),
+            "competitor_avg_price": float(competitor_avg_price),
+            "similar_products": [
+                {k: convert(v) for k, v in product.items()}
+                for product in result["similar_products"]
+            ]
+        }
+
+        os.makedirs("logs", exist_ok=True)
+        with open("logs/price_mismatch_log.json", "a") as f:
+            f.write(json.dumps(log_data) + "\n")
+    return result
+
+
+@st.cache_data(max_entries=UI_CACHE_ENTRIES, show_spinner=False)
+def comparison_chart(gemgem_price: float, competitor_avg_price: float, retail_estimate: float) -> bytes:
+    """PNG of the three-bar comparison (standalone Figure, no pyplot global state)."""
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    labels = ["GemGem Price", "Competitor Avg", "Retail Estimate"]
+    values = [gemgem_price, competitor_avg_price, retail_estimate]
+    bars = ax.bar(labels, values, color=["#1f77b4", "#ff7f0e", "#2ca02c"])
+
+    # Show values on top of bars
+    for bar in bars:
+        yval = bar.get_height()
+        ax.text(bar.get_x() + bar.get_width() / 2, yval + 50, f"${yval:.2f}",
+                ha="center", va="bottom", fontsize=9)
+
+    ax.set_ylabel("Price (USD)")
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
 
-from price_calculator import calculate_retail_price
-from normalization import get_similar_prices, preprocess_df
 
 st.subheader("📈 System Flow Overview")
 st.graphviz_chart("""
@@ -35,95 +118,66 @@ digraph {
 }
 """)
 
-# Load datasets
-gemgem_df = pd.read_csv("data/poc_gemgem.csv")
-kay_df = preprocess_df(pd.read_csv("data/poc_kay.csv"))
-glamira_df = preprocess_df(pd.read_csv("data/poc_glamira.csv"))
-
-# Merge into one dataframe
-competitor_df = pd.concat([kay_df, glamira_df], ignore_index=True)
-
 st.set_page_config(page_title="Jewelry Price Comparison POC", layout="centered")
 st.title("💎 Jewelry Price Comparison Tool (POC)")
 
+# Model, compiled catalog and embeddings load once per process, after the page has started rendering
+pricing_engine = load_engine()
+listing_store = pricing_engine.listing_store
+
 # Input Listing ID
 listing_id = st.text_input("Enter GemGem Listing ID:", "")
 
 if listing_id:
     # Fetch product
-    product_row = gemgem_df[gemgem_df["listing_id"] == listing_id]
-    if product_row.empty:
+    listing = listing_store.get(listing_id)
+    if listing is None:
         st.error("❌ Listing ID not found in dataset.")
     else:
         st.subheader("📌 Product Details")
-        st.write(product_row[["name", "details"]].iloc[0])
+        st.write(pd.Series({"name": listing.name, "details": listing.details}))
 
         # Get similar competitor products
         st.subheader("🔍 Similar Competitor Products")
-        similar_products = get_similar_prices(listing_id, top_n=5)
+        # ?profile=1 (with PROFILING_ENABLED=1) samples this lookup into a flame graph file
+        with profile_request(f"ui {listing_id}", st.query_params.get(PROFILE_QUERY_PARAM),
+                             include_current_thread=True) as profile:
+            comparison = compare_listing(
+                listing_id,
+                pricing_engine.data_fingerprint,
+                pricing_engine.competitor_corpus.snapshot.version,
+                # Cached provider price: refreshed in the background, no API call per rerun
+                fetch_gold_price_usd_per_gram(),
+            )
+        if profile is not None:
+            st.caption(f"🔬 Profile skipped: {profile.skipped}" if profile.skipped else f"🔬 Profile written to {profile.path}")
 
-        if "similar_products" not in similar_products or not similar_products["similar_products"]:
+        if not comparison["similar_products"]:
             st.warning("⚠️ No similar products found for this listing.")
         else:
-            st.success(f"Found {len(similar_products['similar_products'])} similar products!")
+            st.success(f"Found {len(comparison['similar_products'])} similar products!")
 
             # Prices
-            gemgem_price = float(product_row["price"].iloc[0])
-            competitor_avg_price = float(
-                pd.DataFrame(similar_products["similar_products"])["price"].mean()
-            )
+            gemgem_price = comparison["gemgem_price"]
+            competitor_avg_price = comparison["competitor_avg_price"]
 
-            retail_data = calculate_retail_price(listing_id, gemgem_df)
+            retail_data = comparison["retail"]
             retail_estimate = float(retail_data["retail_price"])
 
             savings = competitor_avg_price - gemgem_price
             savings_pct = (savings / competitor_avg_price * 100) if competitor_avg_price > 0 else 0
 
-            # ---- Log JSON if GemGem price > competitor avg ----
             if gemgem_price > competitor_avg_price:
-                def convert(o):
-                    if isinstance(o, (np.int64, np.int32)):
-                        return int(o)
-                    if isinstance(o, (np.float64, np.float32)):
-                        return float(o)
-                    return str(o)
-
-                log_data = {
-                    "gemgem_listing_id": str(listing_id),
-                    "gemgem_price": float(gemgem_price),
-                    "competitor_avg_price": float(competitor_avg_price),
-                    "similar_products": [
-                        {k: convert(v) for k, v in product.items()}
-                        for product in similar_products["similar_products"]
-                    ]
-                }
-
-                os.makedirs("logs", exist_ok=True)
-                with open("logs/price_mismatch_log.json", "a") as f:
-                    f.write(json.dumps(log_data) + "\n")
-
                 st.error("⚠️ GemGem price is higher than competitor average! Logged for review.")
 
             # ---- ALWAYS SHOW competitor products in UI ----
-            df_competitors = pd.DataFrame(similar_products["similar_products"])
+            df_competitors = pd.DataFrame(comparison["similar_products"])
             st.subheader("📋 Competitor Products (with URLs)")
             st.dataframe(df_competitors)
 
             # Chart
             st.subheader("📊 Price Comparison")
-            fig, ax = plt.subplots()
-            labels = ["GemGem Price", "Competitor Avg", "Retail Estimate"]
-            values = [gemgem_price, competitor_avg_price, retail_estimate]
-            bars = ax.bar(labels, values, color=["#1f77b4", "#ff7f0e", "#2ca02c"])
-
-            # Show values on top of bars
-            for bar in bars:
-                yval = bar.get_height()
-                ax.text(bar.get_x() + bar.get_width() / 2, yval + 50, f"${yval:.2f}",
-                        ha="center", va="bottom", fontsize=9)
-
-            ax.set_ylabel("Price (USD)")
-            st.pyplot(fig)
+            st.image(comparison_chart(gemgem_price, competitor_avg_price, retail_estimate))
 
             # Show savings
             st.subheader("💰 Savings")
@@ -0,0 +1,421 @@
+import argparse
+import copy
+import os
+import time
+
+import numpy as np
+
+# Which backend get_similar_prices uses: "exact" (brute force) or "ivf" (approximate)
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "exact")
+# IVF knobs: number of k-means lists (0 = sqrt(N)) and lists probed per query
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+# Corpora smaller than this get exact search even with VECTOR_INDEX=ivf (too few rows to cluster)
+IVF_MIN_ROWS = int(os.getenv("IVF_MIN_ROWS", "1000"))
+# Storage for the embedding matrix: "float32", "float16" (half the memory) or "int8" (a quarter)
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+# Compact rows are widened to float32 this many at a time while scoring (small blocks stay in cache)
+VECTOR_SCORE_CHUNK = int(os.getenv("VECTOR_SCORE_CHUNK", "1024"))
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+
+def normalize(vectors) -> np.ndarray:
+    """L2-normalise rows so that a dot product is the cosine similarity."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def encode_vectors(vectors, dtype: str = "float32"):
+    """
+    Normalise rows and store them as `dtype`. Returns (codes, scales).
+    int8 is symmetric scalar quantisation with one float32 scale per row
+    (row ~= codes * scale); scales is None for the float types.
+    """
+    vectors = normalize(vectors)
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=-1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[..., None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown vector dtype: {dtype} (expected one of {VECTOR_DTYPES})")
+
+
+def decode_vectors(codes, scales=None) -> np.ndarray:
+    """float32 rows back from encode_vectors' output."""
+    vectors = np.asarray(codes, dtype=np.float32)
+    return vectors if scales is None else vectors * scales[:, None]
+
+
+def stored_dot(codes, scales, queries, chunk: int = VECTOR_SCORE_CHUNK) -> np.ndarray:
+    """
+    codes @ queries for encoded rows, without decoding the whole matrix:
+    compact rows are widened to float32 `chunk` rows at a time. `queries` is
+    one float32 vector (d,) or a (d, q) matrix. For int8 the per-row scale is
+    applied to the scores, since (scale * code) . q == scale * (code . q).
+    """
+    if codes.dtype == np.float32:
+        scores = codes @ queries
+    else:
+        scores = np.empty((len(codes),) + queries.shape[1:], dtype=np.float32)
+        for start in range(0, len(codes), chunk):
+            scores[start:start + chunk] = codes[start:start + chunk].astype(np.float32) @ queries
+    if scales is not None:
+        scores *= scales if scores.ndim == 1 else scales[:, None]
+    return scores
+
+
+def _take(scales, ids):
+    return None if scales is None else scales[ids]
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first.
+    Uses partial selection (O(N)) and only sorts the k survivors.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Row-wise top_k for a (queries x rows) score matrix."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((len(scores), 0), dtype=np.int64)
+    if k < scores.shape[1]:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class VectorIndex:
+    """
+    Common interface: search(query, k) -> (row indices, cosine scores).
+
+    Indexes are never modified once built: with_added / with_removed / compacted
+    return a new index, so a search that is already running keeps a consistent
+    view while updates are published. Removed rows are tombstoned in `alive`
+    and skipped by every search until the index is compacted.
+    Updates must always be applied to the newest index (the corpus serialises
+    them), because appended rows reuse spare capacity in a shared buffer.
+    Rows are stored as `dtype` (see encode_vectors) and scored in that form.
+    With encoded=True, `vectors` (+ `scales` for int8) are already the output
+    of encode_vectors and are used as-is, e.g. a read-only np.memmap that
+    several processes share; the first with_added then copies them privately.
+    """
+
+    name = "base"
+
+    def __init__(self, vectors, dtype: str = None, encoded: bool = False, scales=None):
+        if encoded:
+            self.dtype = str(vectors.dtype)
+            self._buf, self._scale_buf = vectors, scales
+        else:
+            self.dtype = dtype or VECTOR_DTYPE
+            self._buf, self._scale_buf = encode_vectors(vectors, self.dtype)
+        self._n = len(self._buf)
+        self.alive = None  # None = every row is live
+
+    @property
+    def codes(self) -> np.ndarray:
+        """The stored rows, in the index dtype."""
+        return self._buf[:self._n]
+
+    @property
+    def scales(self):
+        return None if self._scale_buf is None else self._scale_buf[:self._n]
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Rows as float32 (a decoded copy unless the index stores float32)."""
+        return decode_vectors(self.codes, self.scales) if self.dtype != "float32" else self.codes
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the stored rows (and int8 scales)."""
+        return self.codes.nbytes + (0 if self.scales is None else self.scales.nbytes)
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def n_dead(self) -> int:
+        return 0 if self.alive is None else int(self._n - self.alive.sum())
+
+    def score_all(self, query) -> np.ndarray:
+        """Exact cosine score of the query against every row (debugging / evaluation)."""
+        return stored_dot(self.codes, self.scales, normalize(query))
+
+    def _select(self, ids, scores, k):
+        # Drop tombstoned rows, then take the k best
+        if self.alive is not None:
+            live = self.alive[ids]
+            ids, scores = ids[live], scores[live]
+        best = top_k(scores, k)
+        return ids[best], scores[best]
+
+    def search(self, query, k: int = 5):
+        raise NotImplementedError
+
+    def search_candidates(self, query, ids, k: int = 5):
+        """Exact search restricted to the given row ids (e.g. survivors of attribute blocking)."""
+        ids = np.asarray(ids, dtype=np.int64)
+        scores = stored_dot(self.codes[ids], _take(self.scales, ids), normalize(query))
+        return self._select(ids, scores, k)
+
+    def search_batch(self, queries, k: int = 5):
+        """
+        Search several queries at once.
+        Returns (indices, scores), each holding one best-first array per query.
+        """
+        results = [self.search(q, k) for q in queries]
+        return [r[0] for r in results], [r[1] for r in results]
+
+    def with_added(self, vectors) -> "VectorIndex":
+        """New index with rows appended; ids of the new rows start at len(self)."""
+        codes, scales = encode_vectors(np.asarray(vectors).reshape(-1, self._buf.shape[1]), self.dtype)
+        new = copy.copy(self)
+        end = self._n + len(codes)
+        if end > len(self._buf) or not self._buf.flags.writeable:
+            # Grow geometrically so a stream of small upserts stays amortised O(1) per row
+            capacity = max(end, 2 * self._n, 16)
+            buf = np.empty((capacity, self._buf.shape[1]), dtype=self._buf.dtype)
+            buf[:self._n] = self.codes
+            new._buf = buf
+            if scales is not None:
+                new._scale_buf = np.empty(capacity, dtype=np.float32)
+                new._scale_buf[:self._n] = self.scales
+        # Rows past self._n are invisible to this (older) index, so writing them is safe
+        new._buf[self._n:end] = codes
+        if scales is not None:
+            new._scale_buf[self._n:end] = scales
+        new._n = end
+        if self.alive is not None:
+            new.alive = np.concatenate([self.alive, np.ones(len(codes), dtype=bool)])
+        new._on_added(self._n, codes)
+        return new
+
+    def _on_added(self, first_id, codes):
+        pass
+
+    def with_removed(self, ids) -> "VectorIndex":
+        """New index with the given row ids tombstoned."""
+        new = copy.copy(self)
+        alive = np.ones(self._n, dtype=bool) if self.alive is None else self.alive.copy()
+        alive[np.asarray(ids, dtype=np.int64)] = False
+        new.alive = alive
+        return new
+
+    def compacted(self):
+        """
+        Drop tombstoned rows.
+        Returns (new index, kept) where kept[i] is the old id of new row i.
+        """
+        kept = np.arange(self._n) if self.alive is None else np.flatnonzero(self.alive)
+        new = copy.copy(self)
+        new._buf = self.codes[kept]
+        new._scale_buf = _take(self.scales, kept)
+        new._n = len(kept)
+        new.alive = None
+        new._on_compacted()
+        return new, kept
+
+    def _on_compacted(self):
+        pass
+
+
+class BruteForceIndex(VectorIndex):
+    """Exact search: one matrix-vector product plus partial selection."""
+
+    name = "exact"
+
+    def search(self, query, k: int = 5):
+        scores = self.score_all(query)
+        return self._select(np.arange(self._n), scores, k)
+
+    def search_batch(self, queries, k: int = 5):
+        # One matrix-matrix product for the whole batch
+        scores = np.ascontiguousarray(stored_dot(self.codes, self.scales, normalize(queries).T).T)
+        if self.alive is not None:
+            scores[:, ~self.alive] = -np.inf
+        indices = top_k_rows(scores, k)
+        top_scores = np.take_along_axis(scores, indices, axis=1)
+        if self.alive is None or np.isfinite(top_scores).all():
+            return indices, top_scores
+        # Fewer than k live rows: trim the tombstoned fillers
+        finite = np.isfinite(top_scores)
+        return [i[f] for i, f in zip(indices, finite)], [s[f] for s, f in zip(top_scores, finite)]
+
+
+class IVFIndex(VectorIndex):
+    """
+    Inverted-file approximate index.
+    Rows are clustered with spherical k-means into `nlist` lists; a query only
+    scans the `nprobe` lists whose centroids are closest to it.
+    More lists / fewer probes = faster, fewer lists / more probes = higher recall.
+    Rows added after the build are assigned to a list but kept in a small side
+    buffer until the next compaction regroups them.
+    """
+
+    name = "ivf"
+
+    def __init__(self, vectors, nlist: int = 0, nprobe: int = 8, train_iters: int = 10,
+                 max_train_points: int = 256, seed: int = 0, dtype: str = None, encoded: bool = False,
+                 scales=None):
+        super().__init__(vectors, dtype, encoded, scales)
+        n = len(self)
+        if n == 0:
+            raise ValueError("IVFIndex needs at least one row to train on (make_index falls back to exact search)")
+        self.nlist = max(1, min(nlist or int(np.sqrt(n)), n))
+        self.nprobe = nprobe
+        self.centroids = self._train(train_iters, max_train_points * self.nlist, seed)
+        self._build_lists()
+
+    def _build_lists(self):
+        # Store rows grouped by list so every probe scans a contiguous block
+        assignments = self._assign(self.codes)
+        self._ids = np.argsort(assignments, kind="stable")
+        self._grouped = self.codes[self._ids]
+        self._grouped_scales = _take(self.scales, self._ids)
+        counts = np.bincount(assignments, minlength=self.nlist)
+        self._offsets = np.concatenate([[0], np.cumsum(counts)])
+        self._delta_ids = np.empty(0, dtype=np.int64)
+        self._delta_lists = np.empty(0, dtype=np.int64)
+
+    def _assign(self, codes, chunk: int = 65536) -> np.ndarray:
+        # Nearest centroid per row; a positive int8 row scale can't change the argmax
+        out = np.empty(len(codes), dtype=np.int64)
+        for start in range(0, len(codes), chunk):
+            block = codes[start:start + chunk].astype(np.float32, copy=False)
+            out[start:start + chunk] = np.argmax(block @ self.centroids.T, axis=1)
+        return out
+
+    def _train(self, iters, max_points, seed) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+        n = len(self)
+        picked = slice(None) if n <= max_points else rng.choice(n, max_points, replace=False)
+        sample = normalize(decode_vectors(self.codes[picked], _take(self.scales, picked)))
+        self.centroids = sample[rng.choice(len(sample), self.nlist, replace=False)].copy()
+        for _ in range(iters):
+            labels = self._assign(sample)
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=self.nlist)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            empty = counts == 0
+            sums = np.zeros_like(self.centroids)
+            sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+            # Re-seed empty lists with random points so no list is wasted
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            self.centroids = normalize(sums)
+        return self.centroids
+
+    def _on_added(self, first_id, codes):
+        self._delta_ids = np.concatenate([self._delta_ids, np.arange(first_id, first_id + len(codes))])
+        self._delta_lists = np.concatenate([self._delta_lists, self._assign(codes)])
+
+    def _on_compacted(self):
+        # Keep the trained centroids; only regroup the surviving rows
+        self._build_lists()
+
+    def search(self, query, k: int = 5, nprobe: int = None):
+        query = normalize(query)
+        probes = top_k(self.centroids @ query, nprobe or self.nprobe)
+        blocks = [np.arange(self._offsets[p], self._offsets[p + 1]) for p in probes]
+        positions = np.concatenate(blocks) if blocks else np.empty(0, dtype=np.int64)
+        ids = self._ids[positions]
+        scores = stored_dot(self._grouped[positions], _take(self._grouped_scales, positions), query)
+        if len(self._delta_ids):
+            extra = self._delta_ids[np.isin(self._delta_lists, probes)]
+            ids = np.concatenate([ids, extra])
+            scores = np.concatenate([scores, stored_dot(self.codes[extra], _take(self.scales, extra), query)])
+        return self._select(ids, scores, k)
+
+
+def make_index(vectors, kind: str = None, dtype: str = None, **kwargs) -> VectorIndex:
+    """Build the configured index backend (VECTOR_INDEX / VECTOR_DTYPE / IVF_* env vars by default)."""
+    kind = (kind or VECTOR_INDEX).lower()
+    if kind == "exact":
+        return BruteForceIndex(vectors, dtype=dtype, **kwargs)
+    if kind == "ivf":
+        if len(vectors) < max(IVF_MIN_ROWS, 1):
+            # Empty or tiny: k-means has nothing to cluster and a full scan is as fast
+            exact_kwargs = {k: v for k, v in kwargs.items() if k in ("encoded", "scales")}
+            return BruteForceIndex(vectors, dtype=dtype, **exact_kwargs)
+        kwargs.setdefault("nlist", IVF_NLIST)
+        kwargs.setdefault("nprobe", IVF_NPROBE)
+        return IVFIndex(vectors, dtype=dtype, **kwargs)
+    raise ValueError(f"Unknown vector index backend: {kind}")
+
+
+def recall_report(vectors, queries, k: int = 5, nlists=(0,), nprobes=(1, 4, 8, 16, 32)):
+    """
+    Compare IVF settings against exact search.
+    Returns one row per (nlist, nprobe) with recall@k and mean query latency.
+    """
+    exact = BruteForceIndex(vectors, dtype="float32")
+    start = time.perf_counter()
+    truth = [set(exact.search(q, k)[0].tolist()) for q in queries]
+    exact_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    rows = []
+    for nlist in nlists:
+        start = time.perf_counter()
+        ivf = IVFIndex(vectors, nlist=nlist)
+        build_sec = time.perf_counter() - start
+        for nprobe in nprobes:
+            if nprobe > ivf.nlist:
+                continue
+            start = time.perf_counter()
+            found = [set(ivf.search(q, k, nprobe=nprobe)[0].tolist()) for q in queries]
+            ann_ms = (time.perf_counter() - start) / len(queries) * 1000
+            recall = np.mean([len(f & t) / max(len(t), 1) for f, t in zip(found, truth)])
+            rows.append({
+                "nlist": ivf.nlist,
+                "nprobe": nprobe,
+                f"recall@{k}": round(float(recall), 4),
+                "ann_ms": round(ann_ms, 3),
+                "exact_ms": round(exact_ms, 3),
+                "speedup": round(exact_ms / ann_ms, 2) if ann_ms else None,
+                "build_sec": round(build_sec, 2),
+            })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall vs latency report for the IVF index")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="Use N random clustered vectors instead of the competitor corpus")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, nargs="*", default=[0])
+    parser.add_argument("--nprobe", type=int, nargs="*", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.synthetic:
+        centers = rng.standard_normal((max(1, args.synthetic // 1000), 384)).astype(np.float32)
+        corpus = centers[rng.integers(0, len(centers), args.synthetic)]
+        corpus += 0.5 * rng.standard_normal(corpus.shape).astype(np.float32)
+        queries = corpus[rng.choice(len(corpus), args.queries)] + 0.1 * rng.standard_normal((args.queries, 384))
+    else:
+        from normalization import competitor_embeddings, gemgem_embeddings
+        corpus, queries = competitor_embeddings, gemgem_embeddings
+
+    print(f"📊 Recall report: {len(corpus)} vectors, {len(queries)} queries, k={args.k}")
+    for row in recall_report(corpus, queries, k=args.k, nlists=args.nlist, nprobes=args.nprobe):
+        print(row)